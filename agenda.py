@@ -0,0 +1,102 @@
+"""
+Índice en memoria de la agenda de cada barbero por día
+
+Para cada (id_barbero, fecha) se guardan los intervalos ocupados como una
+lista ordenada de (inicio, fin, id_cita) en minutos desde las 00:00. Como
+el constraint de exclusión impide solapamientos entre citas activas, los
+intervalos son disjuntos y ordenar por inicio también ordena por fin: un
+solapamiento se resuelve con bisect en O(log n).
+
+El índice es por proceso. crud.py lo actualiza en create/update/delete, las
+entradas caducan tras AGENDA_TTL_SEGUNDOS (cambios hechos por otros workers;
+las cargadas desde una réplica, tras el TTL corto que les pase crud.py) y se
+descartan por LRU al superar AGENDA_MAX_DIAS. Ante un miss se reconstruye
+desde la base de datos.
+"""
+
+import bisect
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import date, time
+
+from config import config
+
+
+def a_minutos(hora: time) -> int:
+    return hora.hour * 60 + hora.minute
+
+def a_hora(minutos: int) -> time:
+    return time(minutos // 60, minutos % 60)
+
+def buscar_solapamiento(intervalos: list, inicio: int, fin: int):
+    """Intervalo que solapa con [inicio, fin), o None"""
+    # Primer intervalo que termina después de `inicio`; solapa si empieza antes de `fin`
+    i = bisect.bisect_right(intervalos, inicio, key=lambda iv: iv[1])
+    if i < len(intervalos) and intervalos[i][0] < fin:
+        return intervalos[i]
+    return None
+
+def hay_solapamiento(intervalos: list, inicio: int, fin: int) -> bool:
+    return buscar_solapamiento(intervalos, inicio, fin) is not None
+
+def huecos_libres(intervalos: list, apertura: int, cierre: int, duracion: int, paso: int) -> list:
+    """Inicios (en minutos) de los huecos de `duracion` que caben entre apertura y cierre"""
+    return [
+        inicio for inicio in range(apertura, cierre - duracion + 1, paso)
+        if not hay_solapamiento(intervalos, inicio, inicio + duracion)
+    ]
+
+
+class AgendaIndex:
+    def __init__(self, max_dias: int, ttl_segundos: float):
+        self.max_dias = max_dias
+        self.ttl_segundos = ttl_segundos
+        self._dias = OrderedDict()  # (id_barbero, fecha) -> (vence_en, intervalos)
+        self._lock = threading.Lock()
+
+    def obtener(self, id_barbero: int, fecha: date, cargar, ttl_segundos: float = None):
+        """
+        Intervalos del día. `cargar()` se llama ante un miss y debe retornar
+        la lista de (inicio, fin, id_cita) o None si el barbero no existe.
+        `ttl_segundos` reemplaza el TTL normal para lo que cargue esta llamada.
+        """
+        clave = (id_barbero, fecha)
+        with self._lock:
+            entrada = self._dias.get(clave)
+            if entrada and _time.monotonic() < entrada[0]:
+                self._dias.move_to_end(clave)
+                return list(entrada[1])
+
+        intervalos = cargar()
+        if intervalos is None:
+            return None
+        intervalos = sorted(intervalos)
+        with self._lock:
+            vence_en = _time.monotonic() + (self.ttl_segundos if ttl_segundos is None else ttl_segundos)
+            self._dias[clave] = (vence_en, intervalos)
+            self._dias.move_to_end(clave)
+            while len(self._dias) > self.max_dias:
+                self._dias.popitem(last=False)
+        return list(intervalos)
+
+    def agregar(self, id_barbero: int, fecha: date, hora: time, duracion_minutos: int, id_cita: int):
+        """Solo actualiza días ya cargados; los demás se leerán de la BD al pedirlos"""
+        inicio = a_minutos(hora)
+        with self._lock:
+            entrada = self._dias.get((id_barbero, fecha))
+            if entrada:
+                bisect.insort(entrada[1], (inicio, inicio + duracion_minutos, id_cita))
+
+    def quitar(self, id_barbero: int, fecha: date, id_cita: int):
+        with self._lock:
+            entrada = self._dias.get((id_barbero, fecha))
+            if entrada:
+                entrada[1][:] = [iv for iv in entrada[1] if iv[2] != id_cita]
+
+    def limpiar(self):
+        with self._lock:
+            self._dias.clear()
+
+
+agenda = AgendaIndex(config.AGENDA_MAX_DIAS, config.AGENDA_TTL_SEGUNDOS)
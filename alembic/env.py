@@ -83,6 +83,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
     )
 
     with context.begin_transaction():
@@ -109,8 +110,11 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        # Una transacción por migración: el swap de f3b7c92d4e18 se confirma
+        # antes de que corran las siguientes
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
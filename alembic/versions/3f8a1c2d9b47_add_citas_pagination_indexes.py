@@ -0,0 +1,34 @@
+"""add citas pagination and filter indexes
+
+Revision ID: 3f8a1c2d9b47
+Revises: db1d9a5bdb31
+Create Date: 2026-10-18 10:12:41.318220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a1c2d9b47'
+down_revision: Union[str, Sequence[str], None] = 'db1d9a5bdb31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_citas_fecha_hora_id', 'citas', ['fecha', 'hora', 'id_cita'], unique=False)
+    op.create_index('ix_citas_barbero_fecha_hora', 'citas', ['id_barbero', 'fecha', 'hora', 'id_cita'], unique=False)
+    op.create_index('ix_citas_usuario_fecha_hora', 'citas', ['id_usuario', 'fecha', 'hora', 'id_cita'], unique=False)
+    op.create_index('ix_citas_estado_fecha_hora', 'citas', ['estado', 'fecha', 'hora', 'id_cita'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_citas_estado_fecha_hora', table_name='citas')
+    op.drop_index('ix_citas_usuario_fecha_hora', table_name='citas')
+    op.drop_index('ix_citas_barbero_fecha_hora', table_name='citas')
+    op.drop_index('ix_citas_fecha_hora_id', table_name='citas')
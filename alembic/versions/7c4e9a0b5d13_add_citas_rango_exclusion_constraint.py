@@ -0,0 +1,74 @@
+"""add citas rango column and barber overlap exclusion constraint
+
+Revision ID: 7c4e9a0b5d13
+Revises: 3f8a1c2d9b47
+Create Date: 2026-10-18 11:40:07.902514
+
+Antes de aplicar, las citas activas que ya se solapen deben cancelarse o
+moverse: la migración las busca primero y, si hay, aborta listando los
+pares de id_cita (sin tocar la tabla) en vez de fallar a mitad del ADD
+CONSTRAINT.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e9a0b5d13'
+down_revision: Union[str, Sequence[str], None] = '3f8a1c2d9b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _rango(alias: str) -> str:
+    return (f"tsrange({alias}.fecha + {alias}.hora, {alias}.fecha + {alias}.hora"
+            f" + make_interval(mins => coalesce({alias}.duracion_minutos, 30)))")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Pre-chequeo: pares de citas activas del mismo barbero que se solapan (una
+    # cita puede cruzar la medianoche, por eso el día vecino)
+    solapes = op.get_bind().execute(sa.text(f"""
+        SELECT a.id_cita, b.id_cita FROM citas a
+        JOIN citas b ON b.id_barbero = a.id_barbero AND b.id_cita > a.id_cita
+                    AND b.fecha BETWEEN a.fecha - 1 AND a.fecha + 1
+                    AND {_rango('a')} && {_rango('b')}
+        WHERE a.estado <> 'cancelada' AND b.estado <> 'cancelada'
+        ORDER BY a.id_cita, b.id_cita
+        LIMIT 100
+    """)).all()
+    if solapes:
+        raise RuntimeError(
+            "Citas activas que se solapan (cancelar o mover una de cada par antes de migrar): "
+            + ", ".join(f"{a}/{b}" for a, b in solapes)
+        )
+    # btree_gist permite usar id_barbero (integer) con = dentro de un índice GiST
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.add_column('citas', sa.Column(
+        'rango',
+        postgresql.TSRANGE(),
+        sa.Computed(
+            "tsrange(fecha + hora, fecha + hora + make_interval(mins => coalesce(duracion_minutos, 30)))",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+    op.create_exclude_constraint(
+        'excl_citas_barbero_rango',
+        'citas',
+        ('id_barbero', '='),
+        ('rango', '&&'),
+        using='gist',
+        where="estado <> 'cancelada'",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('excl_citas_barbero_rango', 'citas', type_='exclude')
+    op.drop_column('citas', 'rango')
@@ -0,0 +1,30 @@
+"""add version to usuarios and citas
+
+Revision ID: a9d2f6e31c80
+Revises: 7c4e9a0b5d13
+Create Date: 2026-10-18 14:02:55.617342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d2f6e31c80'
+down_revision: Union[str, Sequence[str], None] = '7c4e9a0b5d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('usuarios', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('citas', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('citas', 'version')
+    op.drop_column('usuarios', 'version')
@@ -0,0 +1,54 @@
+"""citas dentro del mes
+
+Revision ID: b6d41e8f2a57
+Revises: f3b7c92d4e18
+Create Date: 2026-10-19 10:12:37.204815
+
+El constraint de solapamiento vive en cada partición mensual, así que una
+cita que cruzara la medianoche del último día del mes no se validaría
+contra las del mes siguiente. Este CHECK (en la tabla padre, heredado por
+todas las particiones) exige que cada cita termine dentro de su mes: así
+las particiones nunca pueden solaparse entre sí y el constraint de cada una
+basta.
+
+f3b7c92d4e18 ya lo declara en citas_nueva durante la copia online; acá solo
+se agrega si falta (bases que aplicaron esa migración antes de que lo hiciera).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d41e8f2a57'
+down_revision: Union[str, Sequence[str], None] = 'f3b7c92d4e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONDICION = "upper(rango) <= date_trunc('month', fecha::timestamp) + interval '1 month'"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existe = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_constraint WHERE conrelid = 'citas'::regclass AND conname = 'ck_citas_dentro_del_mes'"
+    )).scalar()
+    if existe:
+        return
+    # Pre-chequeo: listar las citas que lo violarían en vez de fallar en el ADD CONSTRAINT
+    fuera = op.get_bind().execute(sa.text(
+        f"SELECT id_cita FROM citas WHERE NOT ({CONDICION}) ORDER BY id_cita LIMIT 100"
+    )).scalars().all()
+    if fuera:
+        raise RuntimeError(
+            "Citas que cruzan el fin de mes (moverlas o acortarlas antes de migrar): "
+            + ", ".join(map(str, fuera))
+        )
+    op.execute(f"ALTER TABLE citas ADD CONSTRAINT ck_citas_dentro_del_mes CHECK ({CONDICION})")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE citas DROP CONSTRAINT ck_citas_dentro_del_mes")
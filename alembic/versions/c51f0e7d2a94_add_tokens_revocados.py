@@ -0,0 +1,35 @@
+"""add tokens_revocados
+
+Revision ID: c51f0e7d2a94
+Revises: a9d2f6e31c80
+Create Date: 2026-10-18 16:40:12.481903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c51f0e7d2a94'
+down_revision: Union[str, Sequence[str], None] = 'a9d2f6e31c80'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'tokens_revocados',
+        sa.Column('jti', sa.String(length=36), nullable=False),
+        sa.Column('expira', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('jti'),
+    )
+    op.create_index('ix_tokens_revocados_expira', 'tokens_revocados', ['expira'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tokens_revocados_expira', table_name='tokens_revocados')
+    op.drop_table('tokens_revocados')
@@ -0,0 +1,73 @@
+"""add citas_fechas
+
+Revision ID: c8e5a1f03b62
+Revises: b6d41e8f2a57
+Create Date: 2026-10-19 11:40:08.512930
+
+Las rutas por id (GET/PUT/DELETE /citas/{id}) no conocen la fecha y sin
+ella Postgres planifica y recorre todas las particiones. `citas_fechas`
+(id_cita -> fecha, sin particionar) la resuelve con una búsqueda por PK y
+la consulta sobre citas se poda a una partición. La mantiene un trigger,
+así que la actualizan también las escrituras fuera de la app y el
+movimiento de filas de crear_particiones_citas().
+
+f3b7c92d4e18 ya la crea y la llena durante la copia online; acá solo se
+crea si falta (bases que aplicaron esa migración antes de que lo hiciera).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e5a1f03b62'
+down_revision: Union[str, Sequence[str], None] = 'b6d41e8f2a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Un UPDATE que cambia de mes llega como UPDATE o como DELETE + INSERT (en
+# cualquier orden): el DELETE solo borra si la fecha sigue siendo la vieja
+SINCRONIZAR = """
+CREATE FUNCTION citas_fechas_sincronizar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM citas_fechas WHERE id_cita = OLD.id_cita AND fecha = OLD.fecha;
+        RETURN OLD;
+    END IF;
+    INSERT INTO citas_fechas (id_cita, fecha) VALUES (NEW.id_cita, NEW.fecha)
+    ON CONFLICT (id_cita) DO UPDATE SET fecha = EXCLUDED.fecha;
+    RETURN NEW;
+END
+$$
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().execute(sa.text("SELECT to_regclass('citas_fechas')")).scalar():
+        return
+    op.create_table(
+        'citas_fechas',
+        sa.Column('id_cita', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('id_cita'),
+    )
+    op.create_index('ix_citas_fechas_fecha', 'citas_fechas', ['fecha'])
+    op.execute(SINCRONIZAR)
+    # En la tabla padre: se clona en cada partición, presente o futura
+    op.execute(
+        "CREATE TRIGGER citas_fechas_sincronizar AFTER INSERT OR DELETE OR UPDATE OF fecha ON citas "
+        "FOR EACH ROW EXECUTE FUNCTION citas_fechas_sincronizar()"
+    )
+    op.execute("INSERT INTO citas_fechas (id_cita, fecha) SELECT id_cita, fecha FROM citas ON CONFLICT DO NOTHING")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER citas_fechas_sincronizar ON citas")
+    op.execute("DROP FUNCTION citas_fechas_sincronizar()")
+    op.drop_index('ix_citas_fechas_fecha', table_name='citas_fechas')
+    op.drop_table('citas_fechas')
@@ -0,0 +1,41 @@
+"""add idempotencia
+
+Revision ID: d7a3b9e05c21
+Revises: c51f0e7d2a94
+Create Date: 2026-10-18 18:12:40.237716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3b9e05c21'
+down_revision: Union[str, Sequence[str], None] = 'c51f0e7d2a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'idempotencia',
+        sa.Column('clave', sa.String(length=64), nullable=False),
+        sa.Column('huella', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=True),
+        sa.Column('headers', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('cuerpo', sa.LargeBinary(), nullable=True),
+        sa.Column('creada', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('expira', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('clave'),
+    )
+    op.create_index('ix_idempotencia_expira', 'idempotencia', ['expira'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_idempotencia_expira', table_name='idempotencia')
+    op.drop_table('idempotencia')
@@ -0,0 +1,50 @@
+"""add ocupacion_diaria
+
+Revision ID: e2c8f41a7b93
+Revises: d7a3b9e05c21
+Create Date: 2026-10-18 19:25:03.118470
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c8f41a7b93'
+down_revision: Union[str, Sequence[str], None] = 'd7a3b9e05c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ocupacion_diaria',
+        sa.Column('id_barbero', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.Column('servicio', sa.String(length=100), server_default='', nullable=False),
+        sa.Column('citas', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('canceladas', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('minutos', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['id_barbero'], ['barberos.id_barbero']),
+        sa.PrimaryKeyConstraint('id_barbero', 'fecha', 'servicio'),
+    )
+    op.create_index('ix_ocupacion_diaria_fecha', 'ocupacion_diaria', ['fecha'])
+    # Backfill con las citas existentes (igual que crud.reconstruir_ocupacion)
+    op.execute("""
+        INSERT INTO ocupacion_diaria (id_barbero, fecha, servicio, citas, canceladas, minutos)
+        SELECT id_barbero, fecha, coalesce(servicio, ''),
+               count(*) FILTER (WHERE estado IS DISTINCT FROM 'cancelada'),
+               count(*) FILTER (WHERE estado = 'cancelada'),
+               coalesce(sum(coalesce(duracion_minutos, 30)) FILTER (WHERE estado IS DISTINCT FROM 'cancelada'), 0)
+        FROM citas
+        GROUP BY id_barbero, fecha, coalesce(servicio, '')
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ocupacion_diaria_fecha', table_name='ocupacion_diaria')
+    op.drop_table('ocupacion_diaria')
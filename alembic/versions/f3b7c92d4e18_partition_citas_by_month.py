@@ -0,0 +1,295 @@
+"""partition citas by month
+
+Revision ID: f3b7c92d4e18
+Revises: e2c8f41a7b93
+Create Date: 2026-10-18 21:02:41.553902
+
+Convierte `citas` en una tabla particionada por rango mensual de `fecha`.
+La copia es online (build.sh la aplica en cada deploy): se crea la tabla
+particionada como `citas_nueva`, un trigger en `citas` le replica cada
+escritura y las filas existentes se copian en lotes por id_cita, cada uno
+en su propia transacción. El ACCESS EXCLUSIVE solo cubre el swap final
+(renombres y DROP de la tabla vieja), que se confirma solo: env.py corre
+cada migración en su propia transacción. Si la migración se corta, volver a
+correrla descarta la copia parcial y empieza de nuevo. El downgrade sí
+reescribe la tabla bajo lock: aplicarlo en una ventana de mantenimiento.
+
+- La PK pasa a (id_cita, fecha): en Postgres toda unicidad de una tabla
+  particionada debe incluir la clave de partición. id_cita sigue saliendo
+  de la misma secuencia.
+- El constraint de solapamiento no puede declararse en la tabla padre (no
+  incluye `fecha` con =), así que crear_particiones_citas() lo crea en cada
+  partición. Una cita que cruza la medianoche del último día del mes solo
+  se valida contra su propio mes a nivel de constraint.
+- citas_default recibe las fechas sin partición; crear_particiones_citas()
+  mueve esas filas cuando se crea el mes correspondiente.
+- El CHECK ck_citas_dentro_del_mes (b6d41e8f2a57) y citas_fechas con su
+  trigger (c8e5a1f03b62) se crean acá sobre citas_nueva, durante la fase
+  online: la copia los valida y llena sin tener la tabla bloqueada. Esas
+  dos migraciones quedan para las bases que ya tenían aplicada esta.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b7c92d4e18'
+down_revision: Union[str, Sequence[str], None] = 'e2c8f41a7b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNAS = "id_cita, id_usuario, id_barbero, fecha, hora, estado, servicio, duracion_minutos, version"
+
+RANGO = "tsrange(fecha + hora, fecha + hora + make_interval(mins => coalesce(duracion_minutos, 30)))"
+
+# int4range(id, id, '[]') WITH = equivale a id_barbero WITH = sin depender de btree_gist
+EXCLUSION = "EXCLUDE USING gist (int4range(id_barbero, id_barbero, '[]') WITH =, rango WITH &&) " \
+            "WHERE (estado <> 'cancelada')"
+
+INDICES = [
+    ("ix_citas_fecha_hora_id", "(fecha, hora, id_cita)"),
+    ("ix_citas_barbero_fecha_hora", "(id_barbero, fecha, hora, id_cita)"),
+    ("ix_citas_usuario_fecha_hora", "(id_usuario, fecha, hora, id_cita)"),
+    ("ix_citas_estado_fecha_hora", "(estado, fecha, hora, id_cita)"),
+]
+
+NUEVA = "citas_nueva"
+
+# Ver b6d41e8f2a57
+CONDICION = "upper(rango) <= date_trunc('month', fecha::timestamp) + interval '1 month'"
+
+# Ver c8e5a1f03b62
+SINCRONIZAR_FECHAS = """
+CREATE OR REPLACE FUNCTION citas_fechas_sincronizar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM citas_fechas WHERE id_cita = OLD.id_cita AND fecha = OLD.fecha;
+        RETURN OLD;
+    END IF;
+    INSERT INTO citas_fechas (id_cita, fecha) VALUES (NEW.id_cita, NEW.fecha)
+    ON CONFLICT (id_cita) DO UPDATE SET fecha = EXCLUDED.fecha;
+    RETURN NEW;
+END
+$$
+"""
+
+LOTE = 5000
+
+# Idempotente y serializada con un advisory lock: la llaman la migración,
+# `migrate.py particiones` y la tarea periódica de cada worker.
+# {funcion}/{padre} permiten crear las particiones de citas_nueva antes del swap
+CREAR_PARTICIONES_PLANTILLA = r"""
+CREATE OR REPLACE FUNCTION {funcion}(desde date, hasta date) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    mes date := date_trunc('month', desde)::date;
+    siguiente date;
+    nombre text;
+    creadas integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('crear_particiones_citas'));
+    WHILE mes <= hasta LOOP
+        siguiente := (mes + interval '1 month')::date;
+        nombre := 'citas_' || to_char(mes, 'YYYY_MM');
+        IF to_regclass(nombre) IS NULL THEN
+            -- Las filas del mes que cayeron en la default se sacan antes de crear la partición
+            EXECUTE format('CREATE TEMP TABLE _citas_mover AS SELECT {columnas} FROM citas_default '
+                           'WHERE fecha >= %L AND fecha < %L', mes, siguiente);
+            DELETE FROM citas_default WHERE fecha >= mes AND fecha < siguiente;
+            EXECUTE format('CREATE TABLE %I PARTITION OF {padre} FOR VALUES FROM (%L) TO (%L)',
+                           nombre, mes, siguiente);
+            EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I {exclusion}',
+                           nombre, 'excl_' || nombre || '_barbero_rango');
+            INSERT INTO {padre} ({columnas}) SELECT {columnas} FROM _citas_mover;
+            DROP TABLE _citas_mover;
+            creadas := creadas + 1;
+        END IF;
+        mes := siguiente;
+    END LOOP;
+    RETURN creadas;
+END
+$$
+"""
+
+
+def crear_particiones_sql(funcion: str, padre: str) -> str:
+    return CREAR_PARTICIONES_PLANTILLA.format(
+        funcion=funcion, padre=padre, columnas=COLUMNAS, exclusion=EXCLUSION.replace("'", "''")
+    )
+
+
+CREAR_PARTICIONES = crear_particiones_sql("crear_particiones_citas", "citas")
+
+# Réplica de cada escritura sobre citas en citas_nueva mientras dura la copia
+ESPEJO = f"""
+CREATE OR REPLACE FUNCTION {NUEVA}_espejo() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {NUEVA} WHERE id_cita = OLD.id_cita AND fecha = OLD.fecha;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {NUEVA} ({COLUMNAS})
+        VALUES ({", ".join("NEW." + c for c in COLUMNAS.split(", "))});
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def _descartar_copia() -> None:
+    op.execute(f"DROP TRIGGER IF EXISTS {NUEVA}_espejo ON citas")
+    op.execute(f"DROP FUNCTION IF EXISTS {NUEVA}_espejo()")
+    op.execute(f"DROP TABLE IF EXISTS {NUEVA}")
+    op.execute(f"DROP FUNCTION IF EXISTS crear_particiones_{NUEVA}(date, date)")
+    op.execute("DROP TABLE IF EXISTS citas_fechas")
+    op.execute("DROP FUNCTION IF EXISTS citas_fechas_sincronizar()")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Pre-chequeo del CHECK que se declara en citas_nueva: listar las citas que
+    # lo violarían en vez de fallar a mitad de la copia
+    fuera = op.get_bind().execute(sa.text(
+        f"SELECT id_cita FROM citas WHERE NOT ({CONDICION}) ORDER BY id_cita LIMIT 100"
+    )).scalars().all()
+    if fuera:
+        raise RuntimeError(
+            "Citas que cruzan el fin de mes (moverlas o acortarlas antes de migrar): "
+            + ", ".join(map(str, fuera))
+        )
+
+    with op.get_context().autocommit_block():
+        _descartar_copia()  # Restos de un intento cortado
+        op.execute(f"""
+            CREATE TABLE {NUEVA} (
+                id_cita integer NOT NULL DEFAULT nextval('citas_id_cita_seq'),
+                id_usuario integer NOT NULL,
+                id_barbero integer NOT NULL,
+                fecha date NOT NULL,
+                hora time NOT NULL,
+                estado varchar(20),
+                servicio varchar(100),
+                duracion_minutos integer,
+                version integer NOT NULL DEFAULT 1,
+                rango tsrange GENERATED ALWAYS AS ({RANGO}) STORED,
+                CONSTRAINT {NUEVA}_pkey PRIMARY KEY (id_cita, fecha),
+                CONSTRAINT {NUEVA}_id_usuario_fkey FOREIGN KEY (id_usuario) REFERENCES usuarios (id_usuario),
+                CONSTRAINT {NUEVA}_id_barbero_fkey FOREIGN KEY (id_barbero) REFERENCES barberos (id_barbero),
+                CONSTRAINT ck_citas_dentro_del_mes CHECK ({CONDICION})
+            ) PARTITION BY RANGE (fecha)
+        """)
+        # Los índices del padre se propagan a cada partición, presente o futura
+        for nombre, columnas in INDICES:
+            op.execute(f"CREATE INDEX {nombre}_nueva ON {NUEVA} {columnas}")
+        op.execute(
+            f"CREATE INDEX ix_citas_activas_barbero_fecha ON {NUEVA} (id_barbero, fecha, hora) "
+            "WHERE estado <> 'cancelada'"
+        )
+        op.execute(f"CREATE TABLE citas_default PARTITION OF {NUEVA} DEFAULT")
+        # citas_fechas se llena con la misma copia: su trigger ya está en citas_nueva
+        op.execute("""
+            CREATE TABLE citas_fechas (
+                id_cita integer NOT NULL,
+                fecha date NOT NULL,
+                CONSTRAINT citas_fechas_pkey PRIMARY KEY (id_cita)
+            )
+        """)
+        op.execute("CREATE INDEX ix_citas_fechas_fecha ON citas_fechas (fecha)")
+        op.execute(SINCRONIZAR_FECHAS)
+        op.execute(
+            f"CREATE TRIGGER citas_fechas_sincronizar AFTER INSERT OR DELETE OR UPDATE OF fecha ON {NUEVA} "
+            "FOR EACH ROW EXECUTE FUNCTION citas_fechas_sincronizar()"
+        )
+        op.execute(f"ALTER TABLE citas_default ADD CONSTRAINT excl_citas_default_barbero_rango {EXCLUSION}")
+        op.execute(crear_particiones_sql(f"crear_particiones_{NUEVA}", NUEVA))
+        # Un mes por partición desde la cita más antigua hasta 3 meses adelante
+        op.execute(f"""
+            SELECT crear_particiones_{NUEVA}(
+                least(coalesce(min(fecha), current_date), current_date),
+                greatest(coalesce(max(fecha), current_date), (current_date + interval '3 months')::date)
+            ) FROM citas
+        """)
+
+        # Desde acá toda escritura sobre citas llega también a citas_nueva
+        op.execute(ESPEJO)
+        op.execute(f"CREATE TRIGGER {NUEVA}_espejo AFTER INSERT OR UPDATE OR DELETE ON citas "
+                   f"FOR EACH ROW EXECUTE FUNCTION {NUEVA}_espejo()")
+
+        # FOR SHARE espera a las escrituras en curso sobre el lote y lee la última
+        # versión: si su trigger ya la copió, ON CONFLICT la saltea; si llega
+        # después, su trigger borra la copia del lote y la reemplaza
+        maximo = op.get_bind().execute(sa.text("SELECT max(id_cita) FROM citas")).scalar() or 0
+        for desde in range(0, maximo + 1, LOTE):
+            op.execute(f"""
+                INSERT INTO {NUEVA} ({COLUMNAS})
+                SELECT {COLUMNAS} FROM citas
+                WHERE id_cita >= {desde} AND id_cita < {desde + LOTE}
+                FOR SHARE
+                ON CONFLICT (id_cita, fecha) DO NOTHING
+            """)
+        op.execute(f"ANALYZE {NUEVA}")
+        op.execute("ANALYZE citas_fechas")
+
+    # Swap: una transacción corta que se confirma al terminar esta migración
+    # (transaction_per_migration en env.py); el trigger dejó citas_nueva al día. Sin
+    # lock_timeout, esperar el lock detrás de una transacción larga frenaría
+    # todas las consultas sobre citas que lleguen mientras tanto
+    op.execute("SET LOCAL lock_timeout = '10s'")
+    op.execute("LOCK TABLE citas IN ACCESS EXCLUSIVE MODE")
+    op.execute(f"DROP TRIGGER {NUEVA}_espejo ON citas")
+    op.execute(f"DROP FUNCTION {NUEVA}_espejo()")
+    op.execute(f"ALTER SEQUENCE citas_id_cita_seq OWNED BY {NUEVA}.id_cita")
+    op.execute("DROP TABLE citas")
+    op.execute(f"ALTER TABLE {NUEVA} RENAME TO citas")
+    for sufijo in ("pkey", "id_usuario_fkey", "id_barbero_fkey"):
+        op.execute(f"ALTER TABLE citas RENAME CONSTRAINT {NUEVA}_{sufijo} TO citas_{sufijo}")
+    for nombre, _ in INDICES:
+        op.execute(f"ALTER INDEX {nombre}_nueva RENAME TO {nombre}")
+    op.execute(f"DROP FUNCTION crear_particiones_{NUEVA}(date, date)")
+    op.execute(CREAR_PARTICIONES)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("LOCK TABLE citas IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE citas RENAME TO citas_particionada")
+    op.execute("ALTER TABLE citas_particionada RENAME CONSTRAINT citas_pkey TO citas_particionada_pkey")
+    for nombre, _ in INDICES:
+        op.drop_index(nombre, table_name='citas_particionada')
+    op.drop_index('ix_citas_activas_barbero_fecha', table_name='citas_particionada')
+
+    op.execute(f"""
+        CREATE TABLE citas (
+            id_cita integer NOT NULL DEFAULT nextval('citas_id_cita_seq'),
+            id_usuario integer NOT NULL,
+            id_barbero integer NOT NULL,
+            fecha date NOT NULL,
+            hora time NOT NULL,
+            estado varchar(20),
+            servicio varchar(100),
+            duracion_minutos integer,
+            version integer NOT NULL DEFAULT 1,
+            rango tsrange GENERATED ALWAYS AS ({RANGO}) STORED,
+            CONSTRAINT citas_pkey PRIMARY KEY (id_cita),
+            CONSTRAINT citas_id_usuario_fkey FOREIGN KEY (id_usuario) REFERENCES usuarios (id_usuario),
+            CONSTRAINT citas_id_barbero_fkey FOREIGN KEY (id_barbero) REFERENCES barberos (id_barbero)
+        )
+    """)
+    op.execute("ALTER SEQUENCE citas_id_cita_seq OWNED BY citas.id_cita")
+    # Las particiones archivadas (esquema aparte) no vuelven
+    op.execute(f"INSERT INTO citas ({COLUMNAS}) SELECT {COLUMNAS} FROM citas_particionada")
+    op.execute("DROP TABLE citas_particionada")
+    op.execute("DROP FUNCTION crear_particiones_citas(date, date)")
+    # Normalmente ya los bajó c8e5a1f03b62
+    op.execute("DROP TABLE IF EXISTS citas_fechas")
+    op.execute("DROP FUNCTION IF EXISTS citas_fechas_sincronizar()")
+    op.create_index('ix_citas_id_cita', 'citas', ['id_cita'])
+    for nombre, columnas in INDICES:
+        op.execute(f"CREATE INDEX {nombre} ON citas {columnas}")
+    op.execute(f"ALTER TABLE citas ADD CONSTRAINT excl_citas_barbero_rango {EXCLUSION}")
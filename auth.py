@@ -0,0 +1,121 @@
+"""
+Tokens de acceso firmados (JWT HS256 con config.SECRET_KEY)
+
+- access (ACCESS_TOKEN_MINUTOS): la dependencia `usuario_actual` confía en
+  la firma y en `exp`, sin consultar la BD.
+- refresh (REFRESH_TOKEN_DIAS): POST /token/refresh lo rota. El jti usado se
+  revoca con un INSERT ... ON CONFLICT que a la vez detecta su reutilización.
+
+Revocación (logout, refresh usados): tabla `tokens_revocados`. Cada worker
+mantiene en memoria los jti revocados aún vigentes y los recarga cada
+REVOCADOS_SYNC_SEGUNDOS (`sincronizar_revocados`, lanzada desde el
+lifespan); un logout hecho en otro worker se ve a lo sumo tras ese lapso.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+import jwt
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+ALGORITMO = "HS256"
+bearer = HTTPBearer(auto_error=False)
+
+_revocados = {}  # jti -> exp (epoch) de los tokens revocados que aún no vencen
+
+
+class TokenInvalido(Exception):
+    """Token mal formado, con firma inválida, vencido, de otro tipo o revocado"""
+
+
+def _emitir(usuario_id: int, tipo: str, segundos: float) -> str:
+    ahora = int(time.time())
+    claims = {
+        "sub": str(usuario_id),
+        "typ": tipo,
+        "jti": str(uuid.uuid4()),
+        "iat": ahora,
+        "exp": ahora + int(segundos),
+    }
+    return jwt.encode(claims, config.SECRET_KEY, algorithm=ALGORITMO)
+
+def crear_tokens(usuario_id: int) -> dict:
+    """Par access/refresh para /login/ y /token/refresh"""
+    return {
+        "access_token": _emitir(usuario_id, "access", config.ACCESS_TOKEN_MINUTOS * 60),
+        "refresh_token": _emitir(usuario_id, "refresh", config.REFRESH_TOKEN_DIAS * 86400),
+        "token_type": "bearer",
+        "expires_in": int(config.ACCESS_TOKEN_MINUTOS * 60),
+    }
+
+def decodificar(token: str, tipo: str) -> dict:
+    """Claims del token si es válido y del tipo pedido; lanza TokenInvalido si no"""
+    try:
+        claims = jwt.decode(token, config.SECRET_KEY, algorithms=[ALGORITMO],
+                            options={"require": ["sub", "typ", "jti", "exp"]})
+    except jwt.ExpiredSignatureError as e:
+        raise TokenInvalido("Token vencido") from e
+    except jwt.InvalidTokenError as e:
+        raise TokenInvalido("Token inválido") from e
+    if claims["typ"] != tipo:
+        raise TokenInvalido("Tipo de token incorrecto")
+    if claims["jti"] in _revocados:
+        raise TokenInvalido("Token revocado")
+    return claims
+
+def expira(claims: dict) -> datetime:
+    return datetime.fromtimestamp(claims["exp"], tz=timezone.utc)
+
+def marcar_revocado(jti: str, exp: float):
+    """Revocación local inmediata (el INSERT en la tabla la propaga al resto)"""
+    _revocados[jti] = exp
+
+def _no_autenticado(detalle: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detalle, headers={"WWW-Authenticate": "Bearer"})
+
+async def usuario_actual(request: Request,
+                         credenciales: HTTPAuthorizationCredentials = Depends(bearer)) -> dict:
+    """Dependencia: claims del access token del header Authorization, sin tocar la BD"""
+    if credenciales is None:
+        raise _no_autenticado("No autenticado")
+    try:
+        claims = decodificar(credenciales.credentials, "access")
+    except TokenInvalido as e:
+        raise _no_autenticado(str(e))
+    request.state.usuario_id = int(claims["sub"])
+    return claims
+
+
+async def sincronizar_revocados():
+    """Recarga periódica de la lista de revocados (y purga de los vencidos)"""
+    from crud_async import get_tokens_revocados, purgar_tokens_revocados
+    from database import session_scope
+    while True:
+        try:
+            async with session_scope() as db:
+                await purgar_tokens_revocados(db)
+                vigentes = await get_tokens_revocados(db)
+            _revocados.clear()
+            _revocados.update(vigentes)
+        except Exception:
+            logger.exception("No se pudo sincronizar la lista de tokens revocados")
+        await asyncio.sleep(config.REVOCADOS_SYNC_SEGUNDOS)
+
+CLAVE_POR_DEFECTO = "your-secret-key-here"
+CLAVE_MIN_BYTES = 32  # RFC 7518 §3.2: HS256 requiere una clave de al menos 256 bits
+
+def validar_clave():
+    """En producción no se arranca con una clave conocida o corta: cualquiera podría firmar tokens"""
+    if config.ENVIRONMENT != "production":
+        return
+    clave = config.SECRET_KEY or ""
+    if clave == CLAVE_POR_DEFECTO or len(clave.encode()) < CLAVE_MIN_BYTES:
+        raise RuntimeError(f"SECRET_KEY debe definirse con al menos {CLAVE_MIN_BYTES} bytes aleatorios")
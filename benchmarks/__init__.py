@@ -0,0 +1,6 @@
+"""
+Benchmarks de carga y latencia de la API
+
+    python -m benchmarks.seed --usuarios 10000 --barberos 50 --citas 1000000
+    python -m benchmarks.run --modo inproceso --guardar benchmarks/baselines/inproceso.json
+"""
@@ -0,0 +1,462 @@
+"""
+Benchmark de latencia y throughput por ruta
+
+Modos:
+- inproceso: la app ASGI de main.py con httpx.ASGITransport (incluye el
+  lifespan). Mide la API sin red ni servidor HTTP.
+- uvicorn: levanta `uvicorn main:app` en un puerto libre y le pega por HTTP.
+- --url: contra un servidor ya levantado (el modo se ignora).
+
+Cada escenario reporta p50/p95/p99 (ms), errores y requests por segundo.
+--guardar escribe un baseline JSON; --comparar contrasta contra uno anterior
+y termina con código 1 si el p95 de alguna ruta empeora más que --umbral.
+
+Necesita datos sembrados con `python -m benchmarks.seed`. Las escrituras
+usan fechas desde FECHA_ESCRITURA y se borran al terminar. Todas las
+requests salen de la misma IP, así que el rate limiting de auth se desactiva
+(con --url hay que levantar el servidor con LIMITES_ACTIVOS=false).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from sqlalchemy import text
+
+import auth
+from benchmarks.seed import CONTRASEÑA, DOMINIO, DURACION, PREFIJO_BARBERO
+from config import config
+from database import get_direct_engine
+
+RAIZ = Path(__file__).resolve().parent.parent
+FECHA_ESCRITURA = date(2200, 1, 1)
+
+
+@dataclass
+class Contexto:
+    """Ids reales tomados de la BD para construir las requests"""
+    usuarios: list
+    emails: list
+    barberos: list
+    citas: list
+    dias: list  # (id_barbero, fecha) con citas
+    ejecucion: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+    revocados: list = field(default_factory=list)  # jti que refresh/logout dejan en tokens_revocados
+    _slot: int = 0
+
+    def slot(self):
+        """(id_barbero, fecha, hora) libre para escrituras; nunca se repite en la ejecución"""
+        apertura = int(config.HORA_APERTURA[:2]) * 60
+        slots_dia = (int(config.HORA_CIERRE[:2]) * 60 - apertura) // DURACION
+        n, self._slot = self._slot, self._slot + 1
+        id_barbero = self.barberos[n % len(self.barberos)]
+        n //= len(self.barberos)
+        minuto = apertura + (n % slots_dia) * DURACION
+        fecha = FECHA_ESCRITURA + timedelta(days=n // slots_dia)
+        return id_barbero, fecha.isoformat(), f"{minuto // 60:02d}:{minuto % 60:02d}:00"
+
+    def tokens(self, revocar: bool = False) -> dict:
+        """Par access/refresh de un usuario al azar, firmado igual que en /login/"""
+        tokens = auth.crear_tokens(random.choice(self.usuarios))
+        if revocar:
+            self.revocados += [auth.decodificar(tokens["access_token"], "access")["jti"],
+                               auth.decodificar(tokens["refresh_token"], "refresh")["jti"]]
+        return tokens
+
+    def autorizacion(self) -> dict:
+        return {"Authorization": f"Bearer {self.tokens()['access_token']}"}
+
+    def cita_nueva(self):
+        id_barbero, fecha, hora = self.slot()
+        return {"id_barbero": id_barbero, "fecha": fecha, "hora": hora,
+                "servicio": "Corte", "duracion_minutos": DURACION}
+
+
+@dataclass
+class Escenario:
+    ruta: str  # "MÉTODO /path" tal como está declarada en main.py
+    hacer: Callable[[httpx.AsyncClient, Contexto, object], Awaitable[httpx.Response]]
+    preparar: Optional[Callable[[httpx.AsyncClient, Contexto, int], Awaitable[list]]] = None
+    esperado: tuple = (200,)
+    peso: float = 1.0  # Fracción de --requests (el login es caro por bcrypt)
+    nombre: str = ""
+
+    def __post_init__(self):
+        self.nombre = self.nombre or self.ruta
+
+
+def cargar_contexto(muestra: int = 500) -> Contexto:
+    with get_direct_engine().connect() as conn:
+        def columna(sql, **params):
+            return [fila[0] for fila in conn.execute(text(sql), params)]
+
+        usuarios = columna(
+            "SELECT DISTINCT id_usuario FROM citas TABLESAMPLE SYSTEM (1) LIMIT :n", n=muestra
+        ) or columna("SELECT id_usuario FROM citas LIMIT :n", n=muestra)
+        emails = columna("SELECT email FROM usuarios WHERE email LIKE :dominio LIMIT :n",
+                         dominio="%" + DOMINIO, n=muestra)
+        barberos = columna("SELECT id_barbero FROM barberos WHERE nombre LIKE :prefijo",
+                           prefijo=PREFIJO_BARBERO + "%")
+        citas = columna("SELECT id_cita FROM citas TABLESAMPLE SYSTEM (1) LIMIT :n", n=muestra) \
+            or columna("SELECT id_cita FROM citas LIMIT :n", n=muestra)
+        dias = [tuple(fila) for fila in conn.execute(text(
+            "SELECT DISTINCT id_barbero, fecha FROM citas WHERE fecha < :limite LIMIT :n"
+        ), {"limite": FECHA_ESCRITURA, "n": muestra})]
+    if not (usuarios and emails and barberos and citas):
+        sys.exit("✗ Sin datos de benchmark. Ejecuta primero: python -m benchmarks.seed")
+    return Contexto(usuarios, emails, barberos, citas, dias)
+
+
+def limpiar_escrituras(ctx: Contexto):
+    with get_direct_engine().begin() as conn:
+        conn.execute(text("DELETE FROM citas WHERE fecha >= :fecha"), {"fecha": FECHA_ESCRITURA})
+        # Sin citas desde FECHA_ESCRITURA, el rollup reconstruido de esas fechas queda vacío
+        conn.execute(text("DELETE FROM ocupacion_diaria WHERE fecha >= :fecha"), {"fecha": FECHA_ESCRITURA})
+        conn.execute(text("DELETE FROM usuarios WHERE email LIKE :patron"),
+                     {"patron": f"run-{ctx.ejecucion}-%"})
+        if ctx.revocados:
+            conn.execute(text("DELETE FROM tokens_revocados WHERE jti = ANY(:jtis)"), {"jtis": ctx.revocados})
+
+
+# ---- Escenarios: uno por ruta de main.py ----
+
+async def _crear_citas(cliente, ctx, n):
+    ids = []
+    for _ in range(n):
+        r = await cliente.post("/citas/", headers=ctx.autorizacion(), json=ctx.cita_nueva())
+        r.raise_for_status()
+        ids.append(r.json()["id_cita"])
+    return ids
+
+async def _etags_citas(cliente, ctx, n):
+    etags = []
+    for id_cita in ctx.citas[:min(n, 50)]:
+        r = await cliente.get(f"/citas/{id_cita}")
+        etags.append((id_cita, r.headers["etag"]))
+    return etags
+
+async def _pares_tokens(cliente, ctx, n):
+    return [ctx.tokens(revocar=True) for _ in range(n)]
+
+def _dia(ctx):
+    id_barbero, fecha = random.choice(ctx.dias)
+    return id_barbero, fecha.isoformat()
+
+def _disponibilidad(c, ctx, i):
+    id_barbero, fecha = _dia(ctx)
+    return c.get(f"/barberos/{id_barbero}/disponibilidad", params={"fecha": fecha})
+
+def _ocupacion(c, ctx, i):
+    # Un año desde un día con citas sembradas: el rango que llena el seed
+    id_barbero, fecha = random.choice(ctx.dias)
+    return c.get("/stats/ocupacion", params={
+        "desde": fecha.isoformat(), "hasta": (fecha + timedelta(days=364)).isoformat(), "id_barbero": id_barbero,
+    })
+
+ESCENARIOS = [
+    Escenario(
+        "POST /registro/",
+        lambda c, ctx, i: c.post("/registro/", json={
+            "nombre": "Bench", "email": f"run-{ctx.ejecucion}-{i}{DOMINIO}", "contraseña": CONTRASEÑA,
+        }),
+        peso=0.2,
+    ),
+    Escenario(
+        "POST /login/",
+        lambda c, ctx, i: c.post("/login/", json={
+            "email": random.choice(ctx.emails), "contraseña": CONTRASEÑA,
+        }),
+        peso=0.2,
+    ),
+    Escenario(
+        "POST /token/refresh",
+        lambda c, ctx, tokens: c.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}),
+        preparar=_pares_tokens,
+    ),
+    Escenario(
+        "POST /logout/",
+        lambda c, ctx, tokens: c.post("/logout/", headers={"Authorization": f"Bearer {tokens['access_token']}"},
+                                      json={"refresh_token": tokens["refresh_token"]}),
+        preparar=_pares_tokens,
+    ),
+    Escenario(
+        "GET /perfil/{usuario_id}",
+        lambda c, ctx, i: c.get(f"/perfil/{random.choice(ctx.usuarios)}", params={"limit": 50}),
+    ),
+    Escenario(
+        "POST /citas/",
+        lambda c, ctx, i: c.post("/citas/", headers=ctx.autorizacion(), json=ctx.cita_nueva()),
+    ),
+    Escenario(
+        "POST /citas/batch",
+        lambda c, ctx, i: c.post("/citas/batch", headers=ctx.autorizacion(),
+                                 json=[ctx.cita_nueva() for _ in range(10)]),
+    ),
+    Escenario(
+        "GET /citas/",
+        lambda c, ctx, i: c.get("/citas/", params={"id_barbero": random.choice(ctx.barberos), "limit": 50}),
+    ),
+    Escenario(
+        "GET /citas/export",
+        lambda c, ctx, i: c.get("/citas/export", params=dict(zip(("id_barbero", "fecha_desde"), _dia(ctx)))),
+        peso=0.2,
+    ),
+    Escenario(
+        "GET /citas/{cita_id}",
+        lambda c, ctx, i: c.get(f"/citas/{random.choice(ctx.citas)}"),
+    ),
+    Escenario(
+        "GET /citas/{cita_id}",
+        lambda c, ctx, etag: c.get(f"/citas/{etag[0]}", headers={"If-None-Match": etag[1]}),
+        preparar=_etags_citas,
+        esperado=(304,),
+        nombre="GET /citas/{cita_id} (304)",
+    ),
+    Escenario(
+        "PUT /citas/{cita_id}",
+        lambda c, ctx, id_cita: c.put(f"/citas/{id_cita}", json=ctx.cita_nueva()),
+        preparar=_crear_citas,
+    ),
+    Escenario(
+        "DELETE /citas/{cita_id}",
+        lambda c, ctx, id_cita: c.delete(f"/citas/{id_cita}"),
+        preparar=_crear_citas,
+    ),
+    Escenario(
+        "GET /barberos/{id_barbero}/disponibilidad",
+        _disponibilidad,
+    ),
+    Escenario(
+        "GET /stats/ocupacion",
+        _ocupacion,
+    ),
+    Escenario(
+        "GET /cache/stats",
+        lambda c, ctx, i: c.get("/cache/stats"),
+    ),
+    Escenario(
+        "GET /healthz",
+        lambda c, ctx, i: c.get("/healthz"),
+    ),
+    Escenario(
+        "GET /readyz",
+        lambda c, ctx, i: c.get("/readyz"),
+    ),
+    Escenario(
+        "GET /metrics",
+        lambda c, ctx, i: c.get("/metrics"),
+    ),
+]
+
+
+def percentil(ordenadas: list, p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    k = (len(ordenadas) - 1) * p
+    i = int(k)
+    j = min(i + 1, len(ordenadas) - 1)
+    return ordenadas[i] + (ordenadas[j] - ordenadas[i]) * (k - i)
+
+
+async def medir(cliente, ctx, escenario: Escenario, total: int, concurrencia: int) -> dict:
+    n = max(1, int(total * escenario.peso))
+    # Ids creados por preparar() se consumen una vez; si no hay, el argumento es el índice
+    argumentos = await escenario.preparar(cliente, ctx, n) if escenario.preparar else list(range(n))
+    if escenario.preparar and len(argumentos) < n:
+        argumentos = (argumentos * (n // len(argumentos) + 1))[:n]
+    pendientes = iter(argumentos)
+    latencias, errores = [], 0
+
+    async def trabajador():
+        nonlocal errores
+        for argumento in pendientes:
+            t0 = time.perf_counter()
+            try:
+                respuesta = await escenario.hacer(cliente, ctx, argumento)
+                await respuesta.aread()
+                ok = respuesta.status_code in escenario.esperado
+            except httpx.HTTPError:
+                ok = False
+            latencias.append((time.perf_counter() - t0) * 1000)
+            errores += not ok
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - t0
+    latencias.sort()
+    return {
+        "n": len(latencias),
+        "errores": errores,
+        "p50_ms": round(percentil(latencias, 0.50), 2),
+        "p95_ms": round(percentil(latencias, 0.95), 2),
+        "p99_ms": round(percentil(latencias, 0.99), 2),
+        "rps": round(len(latencias) / duracion, 1) if duracion else 0.0,
+    }
+
+
+def rutas_app() -> set:
+    from fastapi.routing import APIRoute
+    from main import app
+    return {f"{metodo} {r.path}" for r in app.routes if isinstance(r, APIRoute) for metodo in r.methods}
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _esperar_servidor(url: str, proceso, inicio: float, timeout: float = 60) -> float:
+    """Espera el primer 200 de /healthz; retorna los ms desde que se lanzó el proceso"""
+    limite = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as cliente:
+        while time.monotonic() < limite:
+            if proceso.poll() is not None:
+                sys.exit("✗ uvicorn terminó antes de aceptar conexiones")
+            try:
+                if (await cliente.get("/healthz")).status_code == 200:
+                    return round((time.perf_counter() - inicio) * 1000, 1)
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+    sys.exit(f"✗ uvicorn no respondió en {timeout:.0f}s")
+
+
+async def ejecutar(args) -> tuple:
+    """Retorna (resultados por escenario, ms de arranque de uvicorn o None)"""
+    ctx = cargar_contexto()
+    limpiar_escrituras(ctx)
+    seleccion = [e for e in ESCENARIOS if not args.rutas or any(r in e.nombre for r in args.rutas)]
+    proceso = arranque_ms = None
+    limites = httpx.Limits(max_connections=args.concurrencia)
+
+    if args.url:
+        cliente = httpx.AsyncClient(base_url=args.url, limits=limites, timeout=60)
+        lifespan = None
+    elif args.modo == "uvicorn":
+        puerto = _puerto_libre()
+        inicio = time.perf_counter()
+        proceso = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=RAIZ, env={**os.environ, "LIMITES_ACTIVOS": "false", "WEB_CONCURRENCY": str(args.workers)},
+        )
+        url = f"http://127.0.0.1:{puerto}"
+        arranque_ms = await _esperar_servidor(url, proceso, inicio)
+        print(f"{'Arranque hasta el primer 200 de /healthz':<45} {arranque_ms:.0f} ms "
+              f"(objetivo {config.ARRANQUE_OBJETIVO_MS:.0f} ms)")
+        cliente = httpx.AsyncClient(base_url=url, limits=limites, timeout=60)
+        lifespan = None
+    else:
+        from main import app
+        config.LIMITES_ACTIVOS = False
+        cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                    base_url="http://bench", timeout=60)
+        lifespan = app.router.lifespan_context(app)
+
+    resultados = {}
+    try:
+        if lifespan:
+            await lifespan.__aenter__()
+        async with cliente:
+            for escenario in seleccion:
+                resultados[escenario.nombre] = r = await medir(
+                    cliente, ctx, escenario, args.requests, args.concurrencia
+                )
+                print(f"{escenario.nombre:<45} n={r['n']:<5} err={r['errores']:<4} "
+                      f"p50={r['p50_ms']:>8.2f} p95={r['p95_ms']:>8.2f} p99={r['p99_ms']:>8.2f} ms "
+                      f"{r['rps']:>8.1f} req/s")
+    finally:
+        if lifespan:
+            await lifespan.__aexit__(None, None, None)
+        if proceso:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+        limpiar_escrituras(ctx)
+
+    sin_escenario = rutas_app() - {e.ruta for e in ESCENARIOS}
+    if sin_escenario:
+        print(f"⚠ Rutas sin escenario: {', '.join(sorted(sin_escenario))}")
+    return resultados, arranque_ms
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def comparar(actual: dict, baseline: dict, umbral: float) -> list:
+    """Rutas cuyo p95 empeoró más de `umbral` (0.2 = 20%) respecto al baseline"""
+    regresiones = []
+    for nombre, anterior in baseline["rutas"].items():
+        nuevo = actual.get(nombre)
+        if nuevo and anterior["p95_ms"] and nuevo["p95_ms"] > anterior["p95_ms"] * (1 + umbral):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} → {nuevo['p95_ms']} ms")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia (p50/p95/p99) y throughput por ruta")
+    parser.add_argument("--modo", choices=["inproceso", "uvicorn"], default="inproceso")
+    parser.add_argument("--url", help="Servidor ya levantado (ignora --modo)")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn")
+    parser.add_argument("--requests", type=int, default=500, help="Requests por escenario")
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--rutas", nargs="*", help="Solo escenarios cuyo nombre contenga estos textos")
+    parser.add_argument("--guardar", type=Path, help="Archivo JSON donde guardar el resultado")
+    parser.add_argument("--comparar", type=Path, help="Baseline JSON contra el que comparar")
+    parser.add_argument("--umbral", type=float, default=0.2, help="Regresión tolerada del p95")
+    args = parser.parse_args()
+
+    resultados, arranque_ms = asyncio.run(ejecutar(args))
+    reporte = {
+        "meta": {
+            "commit": _commit(),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "modo": "url" if args.url else args.modo,
+            "db_async": config.DB_ASYNC,
+            "requests": args.requests,
+            "concurrencia": args.concurrencia,
+            "python": platform.python_version(),
+            "arranque_ms": arranque_ms,
+        },
+        "rutas": resultados,
+    }
+    if args.guardar:
+        args.guardar.parent.mkdir(parents=True, exist_ok=True)
+        args.guardar.write_text(json.dumps(reporte, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"✓ Baseline guardado en {args.guardar}")
+    if args.comparar:
+        baseline = json.loads(args.comparar.read_text(encoding="utf-8"))
+        for clave in ("modo", "db_async", "concurrencia"):
+            if baseline["meta"].get(clave) != reporte["meta"][clave]:
+                print(f"⚠ El baseline usa {clave}={baseline['meta'].get(clave)}; "
+                      f"esta ejecución {reporte['meta'][clave]}")
+        regresiones = comparar(resultados, baseline, args.umbral)
+        for regresion in regresiones:
+            print(f"✗ {regresion}")
+        if regresiones:
+            sys.exit(1)
+        print(f"✓ Sin regresiones de p95 mayores a {args.umbral:.0%} respecto a {args.comparar}")
+    if arranque_ms and arranque_ms > config.ARRANQUE_OBJETIVO_MS:
+        sys.exit(f"✗ Arranque de {arranque_ms:.0f} ms supera el objetivo de {config.ARRANQUE_OBJETIVO_MS:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Generador de datos sintéticos para los benchmarks
+
+Carga usuarios, barberos y citas con COPY (psycopg2 copy_expert) sobre la
+conexión directa, sin pasar por el ORM: un millón de citas tarda segundos.
+Las citas se reparten por barbero en slots consecutivos de DURACION minutos
+dentro del horario de atención, así nunca violan el constraint de exclusión.
+Antes del COPY se crean las particiones mensuales de las fechas sembradas:
+sin ellas todo caería en citas_default y las consultas no podarían.
+
+Todos los datos generados se reconocen por el dominio de email
+(@bench.barber-api.com) y el prefijo de nombre de barbero, y --limpiar los elimina.
+Ni el COPY ni los DELETE pasan por los deltas de crud: al terminar se
+reconstruye el rollup ocupacion_diaria de las fechas tocadas.
+
+    python -m benchmarks.seed --usuarios 10000 --barberos 50 --citas 1000000
+    python -m benchmarks.seed --limpiar
+"""
+
+import argparse
+import io
+import random
+import time
+from datetime import date, timedelta
+
+from config import config
+from crud import reconstruir_ocupacion
+from database import SessionLocal, get_direct_engine
+import hashing
+
+DOMINIO = "@bench.barber-api.com"
+PREFIJO_BARBERO = "Bench "
+CONTRASEÑA = "bench-1234"
+FECHA_INICIO = date(2030, 1, 1)
+DURACION = 30
+ESTADOS = ["pendiente", "confirmada", "completada", "cancelada"]
+SERVICIOS = ["Corte", "Barba", "Corte + Barba", "Afeitado", None]
+
+
+class _CopyBuffer(io.RawIOBase):
+    """Adapta un iterador de líneas al objeto file-like que espera copy_expert"""
+
+    def __init__(self, lineas):
+        self._lineas = lineas
+        self._resto = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        partes, total = [self._resto], len(self._resto)
+        while total < len(destino):
+            linea = next(self._lineas, None)
+            if linea is None:
+                break
+            partes.append(linea.encode())
+            total += len(partes[-1])
+        self._resto = b"".join(partes)
+        n = min(len(destino), len(self._resto))
+        destino[:n] = self._resto[:n]
+        self._resto = self._resto[n:]
+        return n
+
+
+def _copy(cursor, tabla: str, columnas: list, lineas):
+    cursor.copy_expert(
+        f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN",
+        io.BufferedReader(_CopyBuffer(lineas), buffer_size=1 << 20),
+    )
+
+
+def _minutos(hhmm: str) -> int:
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+
+def _reconstruir_ocupacion(desde: date, hasta: date) -> int:
+    db = SessionLocal(bind=get_direct_engine())
+    try:
+        return reconstruir_ocupacion(db, desde, hasta)
+    finally:
+        db.close()
+
+
+def limpiar(cursor):
+    """Elimina los datos generados; retorna (desde, hasta) de las citas borradas o None"""
+    cursor.execute(
+        "WITH borradas AS ("
+        " DELETE FROM citas WHERE id_usuario IN (SELECT id_usuario FROM usuarios WHERE email LIKE %s)"
+        " OR id_barbero IN (SELECT id_barbero FROM barberos WHERE nombre LIKE %s) RETURNING fecha"
+        ") SELECT min(fecha), max(fecha) FROM borradas",
+        ("%" + DOMINIO, PREFIJO_BARBERO + "%"),
+    )
+    desde, hasta = cursor.fetchone()
+    # Antes que los barberos: ocupacion_diaria los referencia
+    cursor.execute(
+        "DELETE FROM ocupacion_diaria WHERE id_barbero IN (SELECT id_barbero FROM barberos WHERE nombre LIKE %s)",
+        (PREFIJO_BARBERO + "%",),
+    )
+    cursor.execute("DELETE FROM usuarios WHERE email LIKE %s", ("%" + DOMINIO,))
+    cursor.execute("DELETE FROM barberos WHERE nombre LIKE %s", (PREFIJO_BARBERO + "%",))
+    return (desde, hasta) if desde else None
+
+
+def seed(usuarios: int, barberos: int, citas: int, semilla: int = 42):
+    rnd = random.Random(semilla)
+    etiqueta = format(int(time.time()), "x")  # Permite sembrar varias veces sin chocar en el email
+    hashed = hashing.pwd_context.hash(CONTRASEÑA)  # Un solo hash para todos: el login es comparable
+
+    apertura, cierre = _minutos(config.HORA_APERTURA), _minutos(config.HORA_CIERRE)
+    slots_dia = (cierre - apertura) // DURACION
+
+    conexion = get_direct_engine().raw_connection()
+    try:
+        cursor = conexion.cursor()
+        t0 = time.perf_counter()
+
+        _copy(cursor, "usuarios", ["nombre", "email", "contraseña", "telefono", "activo"], (
+            f"Usuario {i}\tbench-{etiqueta}-{i}{DOMINIO}\t{hashed}\t9{i:08d}\tt\n"
+            for i in range(usuarios)
+        ))
+        _copy(cursor, "barberos", ["nombre"], (
+            f"{PREFIJO_BARBERO}{etiqueta}-{i}\n" for i in range(barberos)
+        ))
+        cursor.execute("SELECT id_usuario FROM usuarios WHERE email LIKE %s",
+                       (f"bench-{etiqueta}-%{DOMINIO}",))
+        ids_usuario = [fila[0] for fila in cursor.fetchall()]
+        cursor.execute("SELECT id_barbero FROM barberos WHERE nombre LIKE %s",
+                       (f"{PREFIJO_BARBERO}{etiqueta}-%",))
+        ids_barbero = [fila[0] for fila in cursor.fetchall()]
+
+        def filas_citas():
+            for k in range(citas):
+                # Slot n-ésimo del barbero k % barberos: día y hora sin solapamientos
+                n = k // barberos
+                fecha = FECHA_INICIO + timedelta(days=n // slots_dia)
+                minuto = apertura + (n % slots_dia) * DURACION
+                servicio = rnd.choice(SERVICIOS)
+                yield (
+                    f"{rnd.choice(ids_usuario)}\t{ids_barbero[k % barberos]}\t{fecha.isoformat()}\t"
+                    f"{minuto // 60:02d}:{minuto % 60:02d}:00\t{rnd.choice(ESTADOS)}\t"
+                    f"{servicio if servicio else chr(92) + 'N'}\t{DURACION}\n"
+                )
+
+        ultima = FECHA_INICIO + timedelta(days=(citas - 1) // barberos // slots_dia) if citas else None
+        if citas:
+            cursor.execute("SELECT crear_particiones_citas(%s, %s)", (FECHA_INICIO, ultima))
+            _copy(cursor, "citas", ["id_usuario", "id_barbero", "fecha", "hora", "estado",
+                                    "servicio", "duracion_minutos"], filas_citas())
+        conexion.commit()
+        cursor.execute("ANALYZE usuarios; ANALYZE barberos; ANALYZE citas")
+        conexion.commit()
+        if citas:
+            _reconstruir_ocupacion(FECHA_INICIO, ultima)
+        print(f"✓ {usuarios} usuarios, {barberos} barberos y {citas} citas "
+              f"en {time.perf_counter() - t0:.1f}s (etiqueta {etiqueta})")
+    finally:
+        conexion.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga datos sintéticos con COPY")
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--barberos", type=int, default=20)
+    parser.add_argument("--citas", type=int, default=100_000)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--limpiar", action="store_true",
+                        help="Solo elimina los datos generados por ejecuciones anteriores")
+    args = parser.parse_args()
+
+    if args.limpiar:
+        conexion = get_direct_engine().raw_connection()
+        try:
+            rango = limpiar(conexion.cursor())
+            conexion.commit()
+        finally:
+            conexion.close()
+        if rango:
+            _reconstruir_ocupacion(*rango)
+        print("✓ Datos de benchmark eliminados")
+        return
+    if args.citas and not (args.usuarios and args.barberos):
+        parser.error("--citas requiere al menos un usuario y un barbero")
+    seed(args.usuarios, args.barberos, args.citas, args.semilla)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+CPU de serialización por cada 1000 citas (sin base de datos)
+
+Compara el camino anterior de `listar_citas` (objetos ORM validados con
+`from_attributes` por el response_model y codificados con json de la
+stdlib, como hace FastAPI) con el camino rápido de serializacion.py (dicts
+desde las filas + orjson) y, si los paquetes están instalados, MessagePack
+y la compresión gzip/brotli del resultado.
+
+    python -m benchmarks.serializacion --citas 1000 --repeticiones 200
+"""
+
+import argparse
+import json
+import timeit
+from datetime import date, time, timedelta
+
+import orjson
+from pydantic import TypeAdapter
+
+import compresion
+import serializacion
+from crud import CITA_CAMPOS
+from models import Cita
+from schemas import CitaPagina
+
+
+def _filas(n: int) -> list:
+    inicio = date(2030, 1, 1)
+    return [
+        (i, 1 + i % 2000, 1 + i % 20, inicio + timedelta(days=i // 22), time(9 + i % 22 // 2, i % 2 * 30),
+         "pendiente", "corte" if i % 3 else None, 30)
+        for i in range(1, n + 1)
+    ]
+
+def _antes(objetos: list, adapter: TypeAdapter) -> bytes:
+    pagina = adapter.validate_python({"items": objetos, "next_cursor": None}, from_attributes=True)
+    contenido = adapter.dump_python(pagina, mode="json")
+    return json.dumps(contenido, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+def _despues(filas: list) -> bytes:
+    return orjson.dumps({"items": [dict(zip(CITA_CAMPOS, fila)) for fila in filas], "next_cursor": None})
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU de serialización por 1000 citas")
+    parser.add_argument("--citas", type=int, default=1000)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    filas = _filas(args.citas)
+    objetos = [Cita(**dict(zip(CITA_CAMPOS, fila))) for fila in filas]
+    adapter = TypeAdapter(CitaPagina)
+    assert json.loads(_antes(objetos, adapter)) == json.loads(_despues(filas)), "Las salidas difieren"
+    cuerpo = _despues(filas)
+    contenido = {"items": [dict(zip(CITA_CAMPOS, fila)) for fila in filas], "next_cursor": None}
+
+    casos = {
+        "antes: from_attributes + json": lambda: _antes(objetos, adapter),
+        "después: filas + orjson": lambda: _despues(filas),
+    }
+    if serializacion.msgpack is not None:
+        casos["después: filas + msgpack"] = lambda: serializacion.msgpack.packb(
+            {"items": [dict(zip(CITA_CAMPOS, fila)) for fila in filas], "next_cursor": None},
+            default=serializacion._iso)
+    casos["gzip del cuerpo JSON"] = lambda: compresion._Gzip().comprimir(cuerpo, True)
+    if compresion.brotli is not None:
+        casos["brotli del cuerpo JSON"] = lambda: compresion._Brotli().comprimir(cuerpo, True)
+
+    print(f"{args.citas} citas, JSON de {len(cuerpo):,} bytes; ms por cada 1000 citas (mejor de 5)")
+    for nombre, caso in casos.items():
+        segundos = min(timeit.repeat(caso, number=args.repeticiones, repeat=5)) / args.repeticiones
+        print(f"  {nombre:32} {segundos * 1000 * 1000 / args.citas:8.3f} ms")
+    print(f"  tamaños: gzip {len(compresion._Gzip().comprimir(cuerpo, True)):,} bytes"
+          + (f", brotli {len(compresion._Brotli().comprimir(cuerpo, True)):,} bytes" if compresion.brotli else "")
+          + (f", msgpack {len(serializacion.msgpack.packb(contenido, default=serializacion._iso)):,} bytes"
+             if serializacion.msgpack else ""))
+
+
+if __name__ == "__main__":
+    main()
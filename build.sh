@@ -8,4 +8,7 @@ pip install -r requirements.txt
 # Ejecutar migraciones de Alembic
 alembic upgrade head
 
+# Sembrar datos estáticos (idempotente, fuera del arranque de la app)
+python migrate.py seed
+
 echo "✓ Build completado - Migraciones aplicadas"
@@ -0,0 +1,157 @@
+"""
+Caché de lectura para usuarios y perfiles
+
+- MemoryCache (default): TTL + LRU en el proceso. Cada worker tiene la
+  suya, por eso el TTL acota cuánto puede durar un dato invalidado en otro
+  worker.
+- RedisCache: cualquier servidor compatible con Redis (CACHE_URL),
+  compartido entre workers. Requiere el paquete `redis`.
+
+Otro backend solo tiene que implementar CacheBackend. Los valores
+cacheados son dicts planos (nunca objetos ORM, que pertenecen a una sesión).
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from config import config
+
+
+class CacheBackend:
+    """Interfaz mínima de un backend de caché"""
+
+    def get(self, clave: str):
+        """Retorna el valor o None si no existe o expiró"""
+        raise NotImplementedError
+
+    def set(self, clave: str, valor, ttl: float):
+        raise NotImplementedError
+
+    def delete(self, *claves: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache(CacheBackend):
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()  # clave -> (expira_en, valor)
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return entrada[1]
+
+    def set(self, clave, valor, ttl):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def delete(self, *claves):
+        with self._lock:
+            for clave in claves:
+                self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class RedisCache(CacheBackend):
+    def __init__(self, url: str, prefijo: str = "barber:"):
+        import redis  # Dependencia opcional, solo con CACHE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefijo = prefijo
+
+    def get(self, clave):
+        valor = self._redis.get(self._prefijo + clave)
+        return pickle.loads(valor) if valor is not None else None
+
+    def set(self, clave, valor, ttl):
+        self._redis.set(self._prefijo + clave, pickle.dumps(valor), px=int(ttl * 1000))
+
+    def delete(self, *claves):
+        if claves:
+            self._redis.delete(*(self._prefijo + clave for clave in claves))
+
+    def clear(self):
+        for clave in self._redis.scan_iter(self._prefijo + "*"):
+            self._redis.delete(clave)
+
+
+class Cache:
+    """Fachada con contadores de aciertos/fallos sobre un CacheBackend"""
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave: str):
+        valor = self.backend.get(clave)
+        if valor is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return valor
+
+    def set(self, clave: str, valor, ttl: float = None):
+        self.backend.set(clave, valor, ttl or self.ttl)
+
+    def invalidar(self, *claves: str):
+        self.backend.delete(*claves)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entradas": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Claves
+def clave_usuario(usuario_id: int) -> str:
+    return f"usuario:{usuario_id}"
+
+def clave_perfil(usuario_id: int) -> str:
+    return f"perfil:{usuario_id}"
+
+def clave_cita_etag(cita_id: int) -> str:
+    return f"cita_etag:{cita_id}"
+
+def clave_primario_usuario(usuario_id: int) -> str:
+    return f"primario:usuario:{usuario_id}"
+
+def clave_primario_cita(cita_id: int) -> str:
+    return f"primario:cita:{cita_id}"
+
+
+def _crear_backend() -> CacheBackend:
+    if config.CACHE_BACKEND == "redis":
+        return RedisCache(config.CACHE_URL)
+    return MemoryCache(config.CACHE_MAX_ENTRADAS)
+
+cache = Cache(_crear_backend(), config.CACHE_TTL_SEGUNDOS)
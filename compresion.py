@@ -0,0 +1,122 @@
+"""
+Compresión de respuestas (brotli o gzip según Accept-Encoding)
+
+Middleware ASGI puro. Solo comprime cuerpos de al menos COMPRESION_MIN_BYTES
+(en los chicos el header y la CPU cuestan más de lo que se ahorra); las
+respuestas en streaming (exportación) se comprimen por bloque con flush, así
+el cliente sigue recibiendo datos a medida que se generan. Los streams SSE
+no se comprimen: cada conexión abierta retendría un compresor en memoria.
+
+brotli es opcional: sin el paquete `brotli` se usa gzip.
+
+El ETag de una respuesta comprimida lleva la codificación ("c1-v3-br", ver
+etags.py): un ETag fuerte no puede repetirse entre representaciones con
+distintos bytes.
+"""
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import etags
+from config import config
+
+try:
+    import brotli  # Dependencia opcional
+except ImportError:
+    brotli = None
+
+# Tipos que ya vienen comprimidos o no ganan nada
+_NO_COMPRIMIBLES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+class _Gzip:
+    nombre = "gzip"
+
+    def __init__(self):
+        self._z = zlib.compressobj(config.GZIP_NIVEL, zlib.DEFLATED, 31)
+
+    def comprimir(self, datos: bytes, final: bool) -> bytes:
+        return self._z.compress(datos) + self._z.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _Brotli:
+    nombre = "br"
+
+    def __init__(self):
+        self._c = brotli.Compressor(quality=config.BROTLI_CALIDAD)
+
+    def comprimir(self, datos: bytes, final: bool) -> bytes:
+        return self._c.process(datos) + (self._c.finish() if final else self._c.flush())
+
+
+def elegir_compresor(accept_encoding: str):
+    """Clase del compresor preferido por el cliente, o None (identity)"""
+    aceptadas = set()
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        if parametros.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        aceptadas.add(nombre.strip())
+    if brotli is not None and "br" in aceptadas:
+        return _Brotli
+    if "gzip" in aceptadas:
+        return _Gzip
+    return None
+
+
+class CompresionMiddleware:
+    """Middleware ASGI: comprime las respuestas a partir de un tamaño mínimo"""
+
+    def __init__(self, app, minimo: int = None):
+        self.app = app
+        self.minimo = config.COMPRESION_MIN_BYTES if minimo is None else minimo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        clase = elegir_compresor(Headers(scope=scope).get("accept-encoding", ""))
+        if clase is None:
+            return await self.app(scope, receive, send)
+
+        inicio = None  # http.response.start retenido hasta ver el primer bloque
+        compresor = None
+        directo = False
+
+        async def send_comprimido(mensaje):
+            nonlocal inicio, compresor, directo
+            if directo:
+                return await send(mensaje)
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+                return
+            if mensaje["type"] != "http.response.body":
+                return await send(mensaje)
+
+            cuerpo = mensaje.get("body", b"")
+            final = not mensaje.get("more_body", False)
+            if compresor is None:
+                headers = MutableHeaders(raw=inicio["headers"])
+                tipo = headers.get("content-type", "")
+                if ("content-encoding" in headers or inicio["status"] in (204, 304)
+                        or tipo.startswith(_NO_COMPRIMIBLES) or (final and len(cuerpo) < self.minimo)):
+                    directo = True
+                    await send(inicio)
+                    return await send(mensaje)
+                compresor = clase()
+                headers["Content-Encoding"] = compresor.nombre
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers:
+                    headers["ETag"] = etags.con_codificacion(headers["etag"], compresor.nombre)
+                cuerpo = compresor.comprimir(cuerpo, final)
+                if final:
+                    headers["Content-Length"] = str(len(cuerpo))
+                elif "content-length" in headers:
+                    del headers["Content-Length"]
+                await send(inicio)
+                return await send({"type": "http.response.body", "body": cuerpo, "more_body": not final})
+
+            await send({"type": "http.response.body", "body": compresor.comprimir(cuerpo, final),
+                        "more_body": not final})
+
+        await self.app(scope, receive, send_comprimido)
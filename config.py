@@ -14,6 +14,99 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
     DATABASE_URL = os.getenv("DATABASE_URL")
     DIRECT_URL = os.getenv("DIRECT_URL")
+    # Modo de acceso a BD: async (AsyncEngine + asyncpg) o sync (Session + threadpool)
+    DB_ASYNC = os.getenv("DB_ASYNC", "True").lower() == "true"
+    # Workers de uvicorn (run_server.py la fija para los procesos hijos) y
+    # presupuesto global de conexiones a repartir entre ellos
+    WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    DB_MAX_CONEXIONES = int(os.getenv("DB_MAX_CONEXIONES", 40))
+    # Eventos de citas por SSE (ver eventos.py): "memoria" o "postgres" (LISTEN/NOTIFY entre workers).
+    # Con más de un worker el default es postgres: en memoria cada evento solo llega a su proceso
+    EVENTOS_BACKEND = os.getenv("EVENTOS_BACKEND", "postgres" if WEB_CONCURRENCY > 1 else "memoria")
+    # Conexiones de cada worker al primario fuera del pool: la de LISTEN de eventos.
+    # run_server.py limita los workers para que todos tengan al menos 2 en el pool
+    DB_CONEXIONES_EXTRA = 1 if EVENTOS_BACKEND == "postgres" else 0
+    _CONEXIONES_WORKER = max(2, DB_MAX_CONEXIONES // WEB_CONCURRENCY - DB_CONEXIONES_EXTRA)
+    # 3/8 fijas y el resto overflow: con 1 worker y 40 conexiones, 15 + 25
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", max(1, _CONEXIONES_WORKER * 3 // 8)))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", _CONEXIONES_WORKER - DB_POOL_SIZE))
+    # NullPool: una conexión por checkout (útil detrás de un pooler externo)
+    DB_NULLPOOL = os.getenv("DB_NULLPOOL", "False").lower() == "true"
+    # Réplicas de lectura (URLs separadas por coma) y read-your-writes. Cada réplica
+    # recibe un pool del mismo tamaño por worker: DB_MAX_CONEXIONES es el presupuesto
+    # de cada servidor (las réplicas no abren la conexión de LISTEN)
+    REPLICA_URLS = [url.strip() for url in os.getenv("REPLICA_URLS", "").split(",") if url.strip()]
+    REPLICA_CHECK_SEGUNDOS = float(os.getenv("REPLICA_CHECK_SEGUNDOS", 5))
+    REPLICA_MAX_LAG_SEGUNDOS = float(os.getenv("REPLICA_MAX_LAG_SEGUNDOS", 5))
+    REPLICA_CACHE_TTL_SEGUNDOS = float(os.getenv("REPLICA_CACHE_TTL_SEGUNDOS", 2))
+    LECTURA_PRIMARIO_SEGUNDOS = float(os.getenv("LECTURA_PRIMARIO_SEGUNDOS", 5))
+    # Hashing de contraseñas en pool de procesos (ver hashing.py)
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+    # Por defecto la mitad de los cores, repartida entre los workers de uvicorn
+    HASH_WORKERS = int(os.getenv("HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2 // WEB_CONCURRENCY)))
+    HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", 32))
+    # Tokens JWT firmados con SECRET_KEY
+    ACCESS_TOKEN_MINUTOS = float(os.getenv("ACCESS_TOKEN_MINUTOS", 15))
+    REFRESH_TOKEN_DIAS = float(os.getenv("REFRESH_TOKEN_DIAS", 30))
+    REVOCADOS_SYNC_SEGUNDOS = float(os.getenv("REVOCADOS_SYNC_SEGUNDOS", 30))
+    # Acepta ?usuario_id= sin token en POST /citas/ (clientes anteriores a los tokens).
+    # Opt-in: el id no está firmado y cualquiera puede reservar a nombre de otro
+    AUTH_LEGACY_USUARIO_ID = os.getenv("AUTH_LEGACY_USUARIO_ID", "False").lower() == "true"
+    # Idempotency-Key en POST /citas/, /citas/batch y /registro/ (memoria o bd).
+    # Con más de un worker el default es bd: el reintento puede caer en otro proceso
+    IDEMPOTENCIA_BACKEND = os.getenv("IDEMPOTENCIA_BACKEND", "bd" if WEB_CONCURRENCY > 1 else "memoria")
+    IDEMPOTENCIA_TTL_SEGUNDOS = float(os.getenv("IDEMPOTENCIA_TTL_SEGUNDOS", 86400))
+    IDEMPOTENCIA_ESPERA_SEGUNDOS = float(os.getenv("IDEMPOTENCIA_ESPERA_SEGUNDOS", 30))
+    # PUT /citas/{id} sin If-Match responde 428 (por defecto se acepta: última escritura gana)
+    CITAS_REQUIERE_IF_MATCH = os.getenv("CITAS_REQUIERE_IF_MATCH", "False").lower() == "true"
+    # Rate limiting de /login/ y /registro/ (token bucket: ráfaga + recarga por minuto)
+    LIMITES_ACTIVOS = os.getenv("LIMITES_ACTIVOS", "True").lower() == "true"
+    LIMITES_BACKEND = os.getenv("LIMITES_BACKEND", "memoria")
+    LIMITES_URL = os.getenv("LIMITES_URL", os.getenv("CACHE_URL", "redis://localhost:6379/0"))
+    LIMITES_MAX_CLAVES = int(os.getenv("LIMITES_MAX_CLAVES", 100000))
+    LOGIN_IP_RAFAGA = float(os.getenv("LOGIN_IP_RAFAGA", 20))
+    LOGIN_IP_POR_MINUTO = float(os.getenv("LOGIN_IP_POR_MINUTO", 30))
+    LOGIN_EMAIL_RAFAGA = float(os.getenv("LOGIN_EMAIL_RAFAGA", 5))
+    LOGIN_EMAIL_POR_MINUTO = float(os.getenv("LOGIN_EMAIL_POR_MINUTO", 5))
+    REGISTRO_IP_RAFAGA = float(os.getenv("REGISTRO_IP_RAFAGA", 5))
+    REGISTRO_IP_POR_MINUTO = float(os.getenv("REGISTRO_IP_POR_MINUTO", 5))
+    # Proxies cuyos X-Forwarded-For se aceptan (la IP del cliente para los límites).
+    # Nunca "*": uvicorn tomaría la entrada más a la izquierda, que elige el cliente
+    FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+    # Agenda en memoria y horario de atención (ver agenda.py)
+    HORA_APERTURA = os.getenv("HORA_APERTURA", "09:00")
+    HORA_CIERRE = os.getenv("HORA_CIERRE", "20:00")
+    SLOT_MINUTOS = int(os.getenv("SLOT_MINUTOS", 15))
+    AGENDA_MAX_DIAS = int(os.getenv("AGENDA_MAX_DIAS", 2048))
+    AGENDA_TTL_SEGUNDOS = float(os.getenv("AGENDA_TTL_SEGUNDOS", 30))
+    OCUPACION_MAX_DIAS = int(os.getenv("OCUPACION_MAX_DIAS", 366))  # Rango de GET /stats/ocupacion
+    # Eventos de citas por SSE (EVENTOS_BACKEND más arriba, junto al presupuesto de conexiones)
+    STREAM_COLA_MAX = int(os.getenv("STREAM_COLA_MAX", 64))  # Eventos pendientes antes de expulsar al cliente
+    STREAM_MAX_SUSCRIPTORES = int(os.getenv("STREAM_MAX_SUSCRIPTORES", 10000))  # Por worker
+    STREAM_PING_SEGUNDOS = float(os.getenv("STREAM_PING_SEGUNDOS", 15))
+    STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", 3000))
+    # Particiones mensuales de citas: creación anticipada y archivo (migrate.py archivar)
+    PARTICIONES_MESES_ADELANTE = int(os.getenv("PARTICIONES_MESES_ADELANTE", 3))
+    PARTICIONES_CHECK_SEGUNDOS = float(os.getenv("PARTICIONES_CHECK_SEGUNDOS", 3600))
+    ARCHIVO_MESES = int(os.getenv("ARCHIVO_MESES", 24))
+    ARCHIVO_ESQUEMA = os.getenv("ARCHIVO_ESQUEMA", "archivo")
+    # Caché de usuarios y perfiles (ver cache.py): "memoria" o "redis"
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memoria")
+    CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+    CACHE_TTL_SEGUNDOS = float(os.getenv("CACHE_TTL_SEGUNDOS", 30))
+    CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", 10000))
+    # Instrumentación de SQL (ver consultas.py)
+    SQL_LENTA_MS = float(os.getenv("SQL_LENTA_MS", 200))
+    SQL_PRESUPUESTO = int(os.getenv("SQL_PRESUPUESTO", 10))
+    SQL_PRESUPUESTO_ESTRICTO = os.getenv("SQL_PRESUPUESTO_ESTRICTO", "False").lower() == "true"
+    # Tiempo objetivo desde el import de main hasta aceptar requests
+    ARRANQUE_OBJETIVO_MS = float(os.getenv("ARRANQUE_OBJETIVO_MS", 1500))
+    # Compresión de respuestas (brotli si el paquete está instalado, si no gzip)
+    COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", 1024))
+    GZIP_NIVEL = int(os.getenv("GZIP_NIVEL", 6))
+    BROTLI_CALIDAD = int(os.getenv("BROTLI_CALIDAD", 4))
+    # Valida las respuestas del camino rápido (orjson) contra su esquema
+    VALIDAR_RESPUESTAS = os.getenv("VALIDAR_RESPUESTAS", "False").lower() == "true"
 
 class DevelopmentConfig(Config):
     """Configuración para desarrollo"""
@@ -24,6 +117,10 @@ class ProductionConfig(Config):
     """Configuración para producción"""
     DEBUG = False
     ENVIRONMENT = "production"
+    # En Render la app solo es accesible a través de su proxy, que conecta desde
+    # la red privada; uvicorn usa la entrada no confiable más a la derecha de
+    # X-Forwarded-For (la que agregó el proxy), no la que manda el cliente
+    FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16")
 
 # Seleccionar configuración según el entorno
 if os.getenv("ENVIRONMENT") == "production":
@@ -0,0 +1,118 @@
+"""
+Instrumentación de SQL por request
+
+Los eventos before/after_cursor_execute de los motores sync y async cuentan
+y cronometran cada statement y lo suman a las EstadisticasSQL de la request
+en curso (ContextVar; el objeto es mutable para que lo vean también el
+threadpool y run_sync). ConsultasMiddleware agrega el resultado en el header
+`Server-Timing: db;dur=<ms>;desc="<n> consultas"`.
+
+- Statements más lentos que SQL_LENTA_MS se loguean con la ruta.
+- Cada ruta tiene un presupuesto de consultas (SQL_PRESUPUESTO, o el que
+  declare con `dependencies=[Depends(presupuesto(n))]`). Excederlo se loguea;
+  con SQL_PRESUPUESTO_ESTRICTO=true la consulta extra lanza
+  PresupuestoExcedido, pensado para tests que detecten N+1.
+"""
+
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class PresupuestoExcedido(Exception):
+    """La request ejecutó más consultas que su presupuesto (modo estricto)"""
+
+
+class EstadisticasSQL:
+    __slots__ = ("consultas", "segundos", "presupuesto", "_scope")
+
+    def __init__(self, scope=None):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.presupuesto = config.SQL_PRESUPUESTO
+        self._scope = scope
+
+    @property
+    def ruta(self) -> str:
+        ruta = (self._scope or {}).get("route")
+        return ruta.path if ruta is not None else "-"
+
+
+_actual: ContextVar = ContextVar("estadisticas_sql", default=None)
+
+
+def actual():
+    """EstadisticasSQL de la request en curso, o None fuera de una request"""
+    return _actual.get()
+
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    estadisticas = _actual.get()
+    if (estadisticas is not None and config.SQL_PRESUPUESTO_ESTRICTO
+            and estadisticas.consultas >= estadisticas.presupuesto):
+        raise PresupuestoExcedido(
+            f"{estadisticas.ruta}: más de {estadisticas.presupuesto} consultas; siguiente: {statement[:200]}"
+        )
+    if context is not None:
+        context._inicio_consulta = time.perf_counter()
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_inicio_consulta", None)
+    if inicio is None:
+        return
+    segundos = time.perf_counter() - inicio
+    estadisticas = _actual.get()
+    if estadisticas is not None:
+        estadisticas.consultas += 1
+        estadisticas.segundos += segundos
+    if segundos * 1000 >= config.SQL_LENTA_MS:
+        logger.warning("Consulta lenta (%.1f ms) en %s: %s", segundos * 1000,
+                       estadisticas.ruta if estadisticas else "-", " ".join(statement.split())[:1000])
+
+def instrumentar(engine):
+    """Registra los eventos en un Engine sync (para AsyncEngine, pasar .sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _antes)
+    event.listen(engine, "after_cursor_execute", _despues)
+
+
+def presupuesto(n: int):
+    """Dependencia de ruta que fija su presupuesto de consultas"""
+    async def fijar_presupuesto():
+        estadisticas = _actual.get()
+        if estadisticas is not None:
+            estadisticas.presupuesto = n
+    return fijar_presupuesto
+
+
+class ConsultasMiddleware:
+    """Middleware ASGI: abre las estadísticas de la request y agrega Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        estadisticas = EstadisticasSQL(scope)
+        token = _actual.set(estadisticas)
+
+        async def send_con_timing(mensaje):
+            if mensaje["type"] == "http.response.start":
+                valor = f'db;dur={estadisticas.segundos * 1000:.1f};desc="{estadisticas.consultas} consultas"'
+                mensaje["headers"] = [*mensaje.get("headers", []), (b"server-timing", valor.encode())]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_con_timing)
+        finally:
+            _actual.reset(token)
+            if estadisticas.consultas > estadisticas.presupuesto:
+                logger.warning("%s %s ejecutó %d consultas (presupuesto %d)", scope["method"],
+                               estadisticas.ruta, estadisticas.consultas, estadisticas.presupuesto)
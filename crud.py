@@ -1,30 +1,44 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from datetime import datetime, timedelta
-from models import Cliente, Barbero, Cita, Usuario
-from schemas import CitaCreate, CitaUpdate, UsuarioCreate, UsuarioLogin
-from passlib.context import CryptContext
-
-# Optimizar bcrypt con rounds reducidos para performance en producción
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-    deprecated="auto",
-    bcrypt__rounds=10  # Default es 12, reducir a 10 acelera el hash
-)
+from sqlalchemy import (or_, tuple_, select, func, insert, update, delete, values, column, text,
+                        literal_column)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from datetime import datetime, timedelta, date, time
+import base64
+import bisect
+import re
+from collections import namedtuple
+from models import Cliente, Barbero, Cita, CitaFecha, Usuario, TokenRevocado, Idempotencia, OcupacionDiaria
+from schemas import CitaCreate, CitaUpdate, CitaFiltros, UsuarioCreate
+import hashing
+import eventos
+from agenda import agenda, a_minutos, a_hora, huecos_libres, buscar_solapamiento
+from cache import cache, clave_usuario, clave_perfil, clave_cita_etag
+from etags import etag_cita, etag_perfil, PrecondicionFallida
+from config import config
 
 # CRUD Usuarios
-def create_usuario(db: Session, usuario: UsuarioCreate):
-    hashed_password = pwd_context.hash(usuario.contraseña)
-    db_usuario = Usuario(
-        nombre=usuario.nombre,
-        email=usuario.email,
-        contraseña=hashed_password,
-        telefono=usuario.telefono
-    )
-    db.add(db_usuario)
+def create_usuario(db: Session, usuario: UsuarioCreate, hashed_password: str = None):
+    """
+    INSERT ... ON CONFLICT (email) DO NOTHING RETURNING: un solo round trip y
+    sin carrera entre la comprobación del email y el insert. Retorna el
+    usuario (dict) o None si el email ya estaba registrado.
+    """
+    if hashed_password is None:
+        hashed_password = hashing.hash_password_sync(usuario.contraseña)
+    fila = db.execute(
+        pg_insert(Usuario)
+        .values(
+            nombre=usuario.nombre,
+            email=usuario.email,
+            contraseña=hashed_password,
+            telefono=usuario.telefono
+        )
+        .on_conflict_do_nothing(index_elements=[Usuario.email])
+        .returning(Usuario.id_usuario, Usuario.nombre, Usuario.email, Usuario.telefono)
+    ).first()
     db.commit()
-    db.refresh(db_usuario)
-    return db_usuario
+    return dict(fila._mapping) if fila else None
 
 def get_usuario_by_email(db: Session, email: str):
     return db.query(Usuario).filter(Usuario.email == email).first()
@@ -32,112 +46,862 @@ def get_usuario_by_email(db: Session, email: str):
 def get_usuario_by_id(db: Session, usuario_id: int):
     return db.query(Usuario).filter(Usuario.id_usuario == usuario_id).first()
 
+def get_usuario_cached(db: Session, usuario_id: int):
+    """Datos públicos del usuario (dict) pasando por la caché; None si no existe"""
+    clave = clave_usuario(usuario_id)
+    usuario = cache.get(clave)
+    if usuario is None:
+        db_usuario = get_usuario_by_id(db, usuario_id)
+        if db_usuario is None:
+            return None
+        usuario = {
+            "id_usuario": db_usuario.id_usuario,
+            "nombre": db_usuario.nombre,
+            "email": db_usuario.email,
+            "telefono": db_usuario.telefono,
+            "version": db_usuario.version
+        }
+        cache.set(clave, usuario)
+    return usuario
+
+def _ttl_cache(db: Session):
+    """
+    Lo leído de una réplica puede venir atrasado respecto de una invalidación
+    reciente: se cachea con un TTL corto (None = el TTL normal)
+    """
+    return config.REPLICA_CACHE_TTL_SEGUNDOS if db.info.get("replica") else None
+
+def _cargar_perfil(db: Session, usuario_id: int, limit: int = None, desde=None):
+    """
+    Usuario + citas en un solo SELECT (LEFT JOIN por Usuario.citas), solo con
+    las columnas que necesita PerfilUsuario y sin hidratar objetos ORM. Con
+    limit trae las más recientes (ORDER BY descendente) y las devuelve en
+    orden cronológico.
+    """
+    citas_join = Usuario.citas.and_(Cita.fecha >= desde) if desde else Usuario.citas
+    stmt = (
+        select(
+            Usuario.nombre, Usuario.email, Usuario.telefono,
+            Usuario.version.label("version_usuario"),
+            *CITA_COLUMNAS, Cita.version.label("version_cita"),
+        )
+        .select_from(Usuario)
+        .outerjoin(citas_join)
+        .where(Usuario.id_usuario == usuario_id)
+        .order_by(Cita.fecha.desc(), Cita.hora.desc(), Cita.id_cita.desc())
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+    filas = db.execute(stmt).all()[::-1]
+    if not filas:
+        return None
+    
+    primera = filas[0]
+    filas_citas = [f for f in filas if f.id_cita is not None]
+    return {
+        "usuario": {
+            "id_usuario": usuario_id,
+            "nombre": primera.nombre,
+            "email": primera.email,
+            "telefono": primera.telefono
+        },
+        "version_usuario": primera.version_usuario,
+        "citas": [{campo: getattr(f, campo) for campo in CITA_CAMPOS} for f in filas_citas],
+        "versiones": [f.version_cita for f in filas_citas],
+    }
+
+def _armar_perfil(usuario_id: int, entrada: dict, limit: int = None, desde=None):
+    pares = list(zip(entrada["citas"], entrada["versiones"]))
+    if desde:
+        pares = [(c, v) for c, v in pares if c["fecha"] >= desde]
+    if limit:
+        pares = pares[-limit:]  # Las más recientes, como _cargar_perfil
+    perfil = {**entrada["usuario"], "citas": [c for c, _ in pares]}
+    etag = etag_perfil(usuario_id, entrada["version_usuario"], ((c["id_cita"], v) for c, v in pares))
+    return perfil, etag
+
+def get_perfil(db: Session, usuario_id: int, limit: int = None, desde=None):
+    """
+    (PerfilUsuario como dict, ETag); None si el usuario no existe.
+
+    Solo se cachea el perfil completo; con él en caché cualquier combinación
+    de limit/desde se arma en memoria sin tocar la base de datos. Sin caché,
+    una consulta con limit/desde trae solo las citas pedidas.
+    """
+    entrada = cache.get(clave_perfil(usuario_id))
+    if entrada is None:
+        if limit is None and desde is None:
+            entrada = _cargar_perfil(db, usuario_id)
+            if entrada is not None:
+                cache.set(clave_perfil(usuario_id), entrada, _ttl_cache(db))
+        else:
+            entrada = _cargar_perfil(db, usuario_id, limit, desde)
+        if entrada is None:
+            return None
+    return _armar_perfil(usuario_id, entrada, limit, desde)
+
+def invalidar_usuario(usuario_id: int):
+    cache.invalidar(clave_usuario(usuario_id), clave_perfil(usuario_id))
+
+def invalidar_perfil(usuario_id: int):
+    cache.invalidar(clave_perfil(usuario_id))
+
 def authenticate_usuario(db: Session, email: str, contraseña: str):
     usuario = get_usuario_by_email(db, email)
     if not usuario:
         return None
-    if not pwd_context.verify(contraseña, usuario.contraseña):
+    if not hashing.verify_password_sync(contraseña, usuario.contraseña):
         return None
     return usuario
 
+def update_contraseña(db: Session, usuario_id: int, hashed_password: str):
+    db.query(Usuario).filter(Usuario.id_usuario == usuario_id).update(
+        {Usuario.contraseña: hashed_password, Usuario.version: Usuario.version + 1},
+        synchronize_session=False
+    )
+    db.commit()
+    invalidar_usuario(usuario_id)
+
+# Tokens revocados
+def revocar_token(db: Session, jti: str, expira) -> bool:
+    """True si el jti no estaba revocado (un refresh reutilizado retorna False)"""
+    fila = db.execute(
+        pg_insert(TokenRevocado).values(jti=jti, expira=expira)
+        .on_conflict_do_nothing(index_elements=[TokenRevocado.jti])
+        .returning(TokenRevocado.jti)
+    ).first()
+    db.commit()
+    return fila is not None
+
+def get_tokens_revocados(db: Session) -> dict:
+    """{jti: exp en epoch} de los revocados que todavía no vencen"""
+    filas = db.execute(
+        select(TokenRevocado.jti, TokenRevocado.expira).where(TokenRevocado.expira > func.now())
+    ).all()
+    return {jti: expira.timestamp() for jti, expira in filas}
+
+def purgar_tokens_revocados(db: Session):
+    db.execute(delete(TokenRevocado).where(TokenRevocado.expira <= func.now()))
+    db.commit()
+
+# Idempotency-Key (IDEMPOTENCIA_BACKEND=bd)
+def reservar_idempotencia(db: Session, clave: str, huella: str) -> bool:
+    """
+    True si esta petición queda a cargo de la clave: no existía, venció, o
+    su dueña lleva más de IDEMPOTENCIA_ESPERA_SEGUNDOS sin guardar respuesta
+    (el worker murió a mitad de camino).
+    """
+    ahora = func.now()
+    stmt = pg_insert(Idempotencia).values(
+        clave=clave, huella=huella,
+        expira=ahora + timedelta(seconds=config.IDEMPOTENCIA_TTL_SEGUNDOS),
+    )
+    fila = db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[Idempotencia.clave],
+            set_={"huella": stmt.excluded.huella, "status": None, "headers": None, "cuerpo": None,
+                  "creada": ahora, "expira": stmt.excluded.expira},
+            where=(Idempotencia.expira < ahora) | (
+                Idempotencia.status.is_(None)
+                & (Idempotencia.creada < ahora - timedelta(seconds=config.IDEMPOTENCIA_ESPERA_SEGUNDOS))
+            ),
+        ).returning(Idempotencia.clave)
+    ).first()
+    db.commit()
+    return fila is not None
+
+def get_idempotencia(db: Session, clave: str):
+    fila = db.execute(
+        select(Idempotencia.huella, Idempotencia.status, Idempotencia.headers, Idempotencia.cuerpo)
+        .where(Idempotencia.clave == clave)
+    ).first()
+    return dict(fila._mapping) if fila else None
+
+def guardar_idempotencia(db: Session, clave: str, status: int, headers: list, cuerpo: bytes):
+    db.execute(
+        update(Idempotencia).where(Idempotencia.clave == clave)
+        .values(status=status, headers=headers, cuerpo=cuerpo)
+    )
+    # Las claves vencidas se purgan de paso, sin una tarea aparte
+    db.execute(delete(Idempotencia).where(Idempotencia.expira < func.now()))
+    db.commit()
+
+def liberar_idempotencia(db: Session, clave: str):
+    db.execute(delete(Idempotencia).where(Idempotencia.clave == clave, Idempotencia.status.is_(None)))
+    db.commit()
+
 # CRUD Citas
-def verificar_disponibilidad_barbero(db: Session, id_barbero: int, fecha, hora, duracion_minutos: int) -> tuple[bool, dict]:
+# SQLSTATE de exclusion_violation: el constraint de solapamiento de la partición rechazó la cita
+EXCLUSION_VIOLATION = "23P01"
+# serialization_failure: en READ COMMITTED solo la lanza un UPDATE cuya fila otra
+# transacción movió de partición (cambio de mes); basta con reintentar
+SERIALIZATION_FAILURE = "40001"
+# check_violation: solo la lanza ck_citas_dentro_del_mes
+CHECK_VIOLATION = "23514"
+FUERA_DEL_MES = "La cita no puede terminar después del fin de su mes"
+
+# Mismo predicado que el índice parcial ix_citas_activas_barbero_fecha. Va como
+# literal y no como parámetro: con asyncpg (statements preparados) el planner
+# solo puede usar el índice parcial si ve 'cancelada' en el SQL.
+CITA_ACTIVA = Cita.estado != literal_column("'cancelada'")
+
+def _sqlstate(error: DBAPIError):
+    orig = error.orig
+    # psycopg2 expone pgcode; el adaptador de asyncpg, sqlstate
+    return getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+
+def es_conflicto_horario(error: IntegrityError) -> bool:
+    return _sqlstate(error) == EXCLUSION_VIOLATION
+
+def fuera_del_mes(fecha, hora, duracion_minutos: int) -> bool:
+    """
+    True si la cita terminaría en el mes siguiente. El constraint de
+    solapamiento es por partición mensual: ck_citas_dentro_del_mes lo
+    prohíbe y create_cita / create_citas_batch lo rechazan antes del INSERT.
+    """
+    fin = datetime.combine(fecha, hora) + timedelta(minutes=duracion_minutos)
+    return fin > datetime.combine(_inicio_mes(fecha, 1), time())
+
+def verificar_disponibilidad_barbero(db: Session, id_barbero: int, fecha, hora, duracion_minutos: int,
+                                     excluir_id_cita: int = None) -> tuple[bool, dict]:
     """
     Verifica si el barbero está disponible considerando la duración real de la cita.
+    El solapamiento lo resuelve Postgres con el índice GiST del constraint.
     Retorna (disponible: bool, info_conflicto: dict)
     """
     # Calcular hora de inicio y fin de la nueva cita
     hora_inicio_dt = datetime.combine(fecha, hora)
     hora_fin_dt = hora_inicio_dt + timedelta(minutes=duracion_minutos)
     
-    # Buscar todas las citas del barbero en la misma fecha (excepto canceladas)
-    citas_existentes = db.query(Cita).filter(
-        and_(
-            Cita.id_barbero == id_barbero,
-            Cita.fecha == fecha,
-            Cita.estado != "cancelada"
-        )
-    ).all()
+    # El rango de fechas (una cita del día anterior puede cruzar la medianoche)
+    # deja a Postgres podar las particiones que no pueden solaparse
+    query = db.query(Cita.id_cita, Cita.hora, Cita.duracion_minutos, Cita.servicio, Cita.fecha).filter(
+        Cita.id_barbero == id_barbero,
+        Cita.fecha.between(fecha - timedelta(days=1), hora_fin_dt.date()),
+        CITA_ACTIVA,
+        Cita.rango.op("&&")(func.tsrange(hora_inicio_dt, hora_fin_dt)),
+    )
+    if excluir_id_cita is not None:
+        query = query.filter(Cita.id_cita != excluir_id_cita)
+    cita_existente = query.order_by(Cita.hora).first()
     
-    # Verificar solapamiento con cada cita existente
-    for cita_existente in citas_existentes:
-        cita_inicio_dt = datetime.combine(fecha, cita_existente.hora)
-        cita_fin_dt = cita_inicio_dt + timedelta(minutes=cita_existente.duracion_minutos)
-        
-        # Hay solapamiento si:
-        # - La nueva cita empieza antes de que termine la existente Y
-        # - La nueva cita termina después de que empiece la existente
-        if hora_inicio_dt < cita_fin_dt and hora_fin_dt > cita_inicio_dt:
-            return False, {
-                "id": cita_existente.id_cita,
-                "hora_inicio": cita_existente.hora.strftime("%H:%M:%S"),
-                "hora_fin": cita_fin_dt.time().strftime("%H:%M:%S"),
-                "servicio": cita_existente.servicio or "No especificado"
-            }
+    if cita_existente is None:
+        return True, {}
     
-    return True, {}
+    cita_fin_dt = datetime.combine(cita_existente.fecha, cita_existente.hora) + \
+        timedelta(minutes=cita_existente.duracion_minutos or 30)
+    return False, {
+        "id": cita_existente.id_cita,
+        "hora_inicio": cita_existente.hora.strftime("%H:%M:%S"),
+        "hora_fin": cita_fin_dt.time().strftime("%H:%M:%S"),
+        "servicio": cita_existente.servicio or "No especificado"
+    }
 
-def create_cita(db: Session, usuario_id: int, cita: CitaCreate):
-    # Validar disponibilidad del barbero con duración real
-    disponible, cita_conflicto = verificar_disponibilidad_barbero(
-        db, cita.id_barbero, cita.fecha, cita.hora, cita.duracion_minutos
+# Rollup de ocupación (ocupacion_diaria)
+def _sumar_ocupacion(db: Session, nuevas=(), anteriores=()):
+    """
+    Suma las citas `nuevas` y resta las `anteriores` (objetos con id_barbero,
+    fecha, servicio, estado y duracion_minutos) en un solo UPSERT. Se llama
+    antes del commit de la escritura, así el rollup nunca queda desfasado.
+    Las filas que quedan en cero se ignoran al leer y las borra la reconstrucción.
+    """
+    deltas = {}
+    for signo, filas in ((1, nuevas), (-1, anteriores)):
+        for fila in filas:
+            clave = (fila.id_barbero, fila.fecha, fila.servicio or "")
+            delta = deltas.setdefault(clave, [0, 0, 0])
+            if fila.estado == "cancelada":
+                delta[1] += signo
+            else:
+                delta[0] += signo
+                delta[2] += signo * (fila.duracion_minutos or 30)
+    # Claves siempre en el mismo orden: dos escrituras concurrentes bloquean
+    # las filas del rollup en la misma secuencia y no pueden caer en deadlock
+    valores = [
+        {"id_barbero": id_barbero, "fecha": fecha, "servicio": servicio,
+         "citas": citas, "canceladas": canceladas, "minutos": minutos}
+        for (id_barbero, fecha, servicio), (citas, canceladas, minutos) in sorted(deltas.items())
+        if citas or canceladas or minutos
+    ]
+    if not valores:
+        return
+    stmt = pg_insert(OcupacionDiaria).values(valores)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[OcupacionDiaria.id_barbero, OcupacionDiaria.fecha, OcupacionDiaria.servicio],
+        set_={
+            "citas": OcupacionDiaria.citas + stmt.excluded.citas,
+            "canceladas": OcupacionDiaria.canceladas + stmt.excluded.canceladas,
+            "minutos": OcupacionDiaria.minutos + stmt.excluded.minutos,
+        },
+    ))
+
+def reconstruir_ocupacion(db: Session, desde=None, hasta=None) -> int:
+    """
+    Recalcula el rollup desde citas (backfill o corrección) y retorna las
+    filas escritas. El LOCK hace esperar a las escrituras de citas
+    concurrentes hasta el commit, así ningún delta se pierde ni se cuenta dos veces.
+
+    Los meses anteriores a la partición adjunta más antigua están archivados:
+    sus citas ya no están en `citas` y el rollup es su único historial. Sin
+    `desde` se empieza en esa partición; un `desde` anterior lanza ValueError.
+    """
+    particiones = _particiones_mensuales(db)
+    if particiones:
+        piso = particiones[0][1]
+        if desde is None:
+            desde = piso
+        elif desde < piso:
+            raise ValueError(f"Los meses anteriores a {piso} están archivados: su ocupación no se puede reconstruir")
+    db.execute(text("LOCK TABLE ocupacion_diaria IN SHARE ROW EXCLUSIVE MODE"))
+    rango = []
+    if desde is not None:
+        rango.append(Cita.fecha >= desde)
+    if hasta is not None:
+        rango.append(Cita.fecha <= hasta)
+    borrar = delete(OcupacionDiaria)
+    if desde is not None:
+        borrar = borrar.where(OcupacionDiaria.fecha >= desde)
+    if hasta is not None:
+        borrar = borrar.where(OcupacionDiaria.fecha <= hasta)
+    db.execute(borrar)
+    activa = Cita.estado.is_distinct_from("cancelada")  # Como en Python: estado NULL cuenta como activa
+    agregado = (
+        select(
+            Cita.id_barbero, Cita.fecha, func.coalesce(Cita.servicio, ""),
+            func.count().filter(activa),
+            func.count().filter(~activa),
+            func.coalesce(func.sum(func.coalesce(Cita.duracion_minutos, 30)).filter(activa), 0),
+        )
+        .where(*rango)
+        .group_by(Cita.id_barbero, Cita.fecha, func.coalesce(Cita.servicio, ""))
     )
-    
-    if not disponible:
-        return None, cita_conflicto  # Retorna None y datos del conflicto
-    
-    db_cita = Cita(
-        id_usuario=usuario_id,
-        id_barbero=cita.id_barbero,
-        fecha=cita.fecha,
-        hora=cita.hora,
-        estado=cita.estado,
-        servicio=cita.servicio,
-        duracion_minutos=cita.duracion_minutos
+    filas = db.execute(
+        insert(OcupacionDiaria).from_select(
+            ["id_barbero", "fecha", "servicio", "citas", "canceladas", "minutos"], agregado
+        )
+    ).rowcount
+    db.commit()
+    return filas
+
+def get_ocupacion(db: Session, desde, hasta, id_barbero: int = None):
+    """
+    Ocupación por barbero, día y servicio leyendo solo el rollup: el costo
+    depende de barberos x días del rango, no del tamaño de citas.
+    """
+    stmt = (
+        select(OcupacionDiaria.id_barbero, OcupacionDiaria.fecha, OcupacionDiaria.servicio,
+               OcupacionDiaria.citas, OcupacionDiaria.canceladas, OcupacionDiaria.minutos)
+        .where(OcupacionDiaria.fecha.between(desde, hasta),
+               or_(OcupacionDiaria.citas != 0, OcupacionDiaria.canceladas != 0))
+        .order_by(OcupacionDiaria.id_barbero, OcupacionDiaria.fecha, OcupacionDiaria.servicio)
     )
-    db.add(db_cita)
+    if id_barbero is not None:
+        stmt = stmt.where(OcupacionDiaria.id_barbero == id_barbero)
+    filas = db.execute(stmt).all()
+
+    jornada = (a_minutos(time.fromisoformat(config.HORA_CIERRE))
+               - a_minutos(time.fromisoformat(config.HORA_APERTURA)))
+    dias_rango = (hasta - desde).days + 1
+    barberos = {}
+    for fila in filas:
+        barbero = barberos.setdefault(fila.id_barbero, {
+            "id_barbero": fila.id_barbero, "citas": 0, "canceladas": 0, "minutos": 0,
+            "dias": {}, "servicios": {},
+        })
+        dia = barbero["dias"].setdefault(fila.fecha, {"fecha": fila.fecha, "citas": 0, "canceladas": 0, "minutos": 0})
+        servicio = barbero["servicios"].setdefault(fila.servicio, {
+            "servicio": fila.servicio or None, "citas": 0, "canceladas": 0, "minutos": 0,
+        })
+        for destino in (barbero, dia, servicio):
+            destino["citas"] += fila.citas
+            destino["canceladas"] += fila.canceladas
+            destino["minutos"] += fila.minutos
+    for barbero in barberos.values():
+        barbero["ocupacion"] = round(barbero["minutos"] / (jornada * dias_rango), 4)
+        barbero["dias"] = list(barbero["dias"].values())
+        for dia in barbero["dias"]:
+            dia["ocupacion"] = round(dia["minutos"] / jornada, 4)
+        barbero["servicios"] = list(barbero["servicios"].values())
+    return {"desde": desde, "hasta": hasta, "minutos_jornada": jornada, "barberos": list(barberos.values())}
+
+# Particiones mensuales de citas (ver migración f3b7c92d4e18)
+def _inicio_mes(fecha: date, meses: int = 0) -> date:
+    total = fecha.year * 12 + fecha.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+def crear_particiones(db: Session, meses: int = None) -> int:
+    """
+    Asegura una partición por mes desde el actual hasta `meses` adelante y
+    retorna cuántas creó. Sin particiones faltantes no ejecuta DDL.
+    """
+    meses = config.PARTICIONES_MESES_ADELANTE if meses is None else meses
+    hoy = date.today()
+    creadas = db.scalar(select(func.crear_particiones_citas(hoy, _inicio_mes(hoy, meses))))
+    db.commit()
+    return creadas
+
+def _particiones_mensuales(db: Session) -> list:
+    """(nombre, primer día del mes) de las particiones mensuales adjuntas a citas, en orden"""
+    nombres = db.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'citas'::regclass ORDER BY c.relname"
+    )).all()
+    particiones = []
+    for nombre in nombres:
+        mes = re.fullmatch(r"citas_(\d{4})_(\d{2})", nombre)
+        if mes is not None:
+            particiones.append((nombre, date(int(mes[1]), int(mes[2]), 1)))
+    return particiones
+
+def archivar_particiones(db: Session, meses: int = None, eliminar: bool = False) -> list[str]:
+    """
+    Separa de `citas` las particiones de meses anteriores a la retención y
+    las mueve al esquema ARCHIVO_ESQUEMA (o las elimina). Las consultas dejan
+    de recorrerlas. Sus filas de ocupacion_diaria quedan como único
+    historial: reconstruir_ocupacion no vuelve a tocar esos meses.
+    """
+    meses = config.ARCHIVO_MESES if meses is None else meses
+    limite = _inicio_mes(date.today(), -meses)
+    if not eliminar:
+        db.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{config.ARCHIVO_ESQUEMA}"'))
+    archivadas = []
+    for nombre, mes in _particiones_mensuales(db):
+        if mes >= limite:
+            continue
+        db.execute(text(f'ALTER TABLE citas DETACH PARTITION "{nombre}"'))
+        if eliminar:
+            db.execute(text(f'DROP TABLE "{nombre}"'))
+        else:
+            db.execute(text(f'ALTER TABLE "{nombre}" SET SCHEMA "{config.ARCHIVO_ESQUEMA}"'))
+        db.commit()  # Una transacción por partición: el lock sobre citas dura lo mínimo
+        archivadas.append(nombre)
+    if archivadas:
+        # Las citas archivadas ya no se buscan por id (404); el trigger no ve el DETACH
+        db.execute(delete(CitaFecha).where(CitaFecha.fecha < limite))
     db.commit()
-    db.refresh(db_cita)
+    return archivadas
+
+def create_cita(db: Session, usuario_id: int, cita: CitaCreate):
+    # Un solo INSERT ... RETURNING: el constraint de exclusión garantiza que no haya doble reserva
+    if fuera_del_mes(cita.fecha, cita.hora, cita.duracion_minutos):
+        raise ValueError(FUERA_DEL_MES)
+    try:
+        db_cita = db.execute(
+            insert(Cita)
+            .values(
+                id_usuario=usuario_id,
+                id_barbero=cita.id_barbero,
+                fecha=cita.fecha,
+                hora=cita.hora,
+                estado=cita.estado,
+                servicio=cita.servicio,
+                duracion_minutos=cita.duracion_minutos
+            )
+            .returning(*CITA_COLUMNAS)
+        ).one()
+        _sumar_ocupacion(db, nuevas=[db_cita])
+        db_cita = db_cita._asdict()
+        eventos.emitir(db, [eventos.evento("creada", db_cita)])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if not es_conflicto_horario(e):
+            raise
+        # Solo en el caso de conflicto se consulta la cita existente para el payload 409
+        _, cita_conflicto = verificar_disponibilidad_barbero(
+            db, cita.id_barbero, cita.fecha, cita.hora, cita.duracion_minutos
+        )
+        return None, cita_conflicto  # Retorna None y datos del conflicto
+    invalidar_perfil(usuario_id)
+    if db_cita["estado"] != "cancelada":
+        agenda.agregar(db_cita["id_barbero"], db_cita["fecha"], db_cita["hora"],
+                       db_cita["duracion_minutos"] or 30, db_cita["id_cita"])
     return db_cita, {}
 
-def get_citas(db: Session):
-    return db.query(Cita).all()
+def _info_intervalo(inicio: int, fin: int, servicio) -> dict:
+    return {
+        "hora_inicio": a_hora(inicio).strftime("%H:%M:%S"),
+        "hora_fin": a_hora(fin % (24 * 60)).strftime("%H:%M:%S"),
+        "servicio": servicio or "No especificado"
+    }
+
+def create_citas_batch(db: Session, usuario_id: int, citas: list[CitaCreate], _reintento: bool = True):
+    """
+    Crea varias citas en una transacción. Retorna (creadas, conflictos).
+
+    1. Un SELECT trae las citas activas de todos los (id_barbero, fecha) del lote.
+    2. Cada cita se valida en memoria contra esas citas y contra las ya
+       aceptadas del mismo lote (intervalos ordenados + bisect).
+    3. Las válidas se insertan con un único INSERT ... RETURNING multi-fila.
+    """
+    for indice, cita in enumerate(citas):
+        if fuera_del_mes(cita.fecha, cita.hora, cita.duracion_minutos):
+            raise ValueError(f"Cita {indice}: {FUERA_DEL_MES.lower()}")
+    grupos = {(c.id_barbero, c.fecha) for c in citas}
+    ocupados = {grupo: [] for grupo in grupos}  # (inicio, fin, id_cita | None, info)
+    filas = db.execute(
+        select(Cita.id_barbero, Cita.fecha, Cita.hora, Cita.duracion_minutos,
+               Cita.id_cita, Cita.servicio)
+        .where(tuple_(Cita.id_barbero, Cita.fecha).in_(list(grupos)))
+        .where(CITA_ACTIVA)
+    ).all()
+    for id_barbero, fecha, hora, duracion, id_cita, servicio in filas:
+        inicio = a_minutos(hora)
+        fin = inicio + (duracion or 30)
+        ocupados[(id_barbero, fecha)].append(
+            (inicio, fin, id_cita, {"id": id_cita, **_info_intervalo(inicio, fin, servicio)})
+        )
+    for intervalos in ocupados.values():
+        intervalos.sort(key=lambda iv: iv[0])
+
+    aceptadas, conflictos = [], []
+    for indice, cita in enumerate(citas):
+        if cita.estado != "cancelada":
+            intervalos = ocupados[(cita.id_barbero, cita.fecha)]
+            inicio = a_minutos(cita.hora)
+            fin = inicio + cita.duracion_minutos
+            solapa = buscar_solapamiento(intervalos, inicio, fin)
+            if solapa:
+                conflictos.append({"indice": indice, "cita_existente": solapa[3]})
+                continue
+            bisect.insort(intervalos, (inicio, fin, None,
+                                       {"indice": indice, **_info_intervalo(inicio, fin, cita.servicio)}),
+                          key=lambda iv: iv[0])
+        aceptadas.append((indice, cita))
+
+    if not aceptadas:
+        return [], conflictos
+
+    try:
+        creadas = db.execute(
+            insert(Cita).returning(*CITA_COLUMNAS, sort_by_parameter_order=True),
+            [{"id_usuario": usuario_id, **cita.model_dump()} for _, cita in aceptadas],
+        ).all()
+        _sumar_ocupacion(db, nuevas=creadas)
+        eventos.emitir(db, [eventos.evento("creada", fila._asdict()) for fila in creadas])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if not es_conflicto_horario(e):
+            raise
+        # Otra request reservó entre el SELECT y el INSERT: se valida de nuevo una vez
+        if _reintento:
+            return create_citas_batch(db, usuario_id, citas, _reintento=False)
+        return [], sorted(
+            conflictos + [{"indice": indice, "cita_existente": {}} for indice, _ in aceptadas],
+            key=lambda c: c["indice"],
+        )
+
+    invalidar_perfil(usuario_id)
+    for fila in creadas:
+        if fila.estado != "cancelada":
+            agenda.agregar(fila.id_barbero, fila.fecha, fila.hora,
+                           fila.duracion_minutos or 30, fila.id_cita)
+    return [fila._asdict() for fila in creadas], conflictos
+
+def barbero_existe(db: Session, id_barbero: int) -> bool:
+    return db.get(Barbero, id_barbero) is not None
+
+def _intervalos_dia(db: Session, id_barbero: int, fecha):
+    """Carga de la agenda ante un miss del índice; None si el barbero no existe"""
+    if db.get(Barbero, id_barbero) is None:
+        return None
+    filas = db.query(Cita.hora, Cita.duracion_minutos, Cita.id_cita).filter(
+        Cita.id_barbero == id_barbero,
+        Cita.fecha == fecha,
+        CITA_ACTIVA,
+    ).all()
+    return [
+        (a_minutos(hora), a_minutos(hora) + (duracion or 30), id_cita)
+        for hora, duracion, id_cita in filas
+    ]
+
+def get_disponibilidad(db: Session, id_barbero: int, fecha, duracion_minutos: int):
+    """Horarios de inicio libres del barbero en la fecha; None si el barbero no existe"""
+    intervalos = agenda.obtener(
+        id_barbero, fecha, lambda: _intervalos_dia(db, id_barbero, fecha), _ttl_cache(db)
+    )
+    if intervalos is None:
+        return None
+    apertura = a_minutos(time.fromisoformat(config.HORA_APERTURA))
+    cierre = a_minutos(time.fromisoformat(config.HORA_CIERRE))
+    libres = huecos_libres(intervalos, apertura, cierre, duracion_minutos, config.SLOT_MINUTOS)
+    return [a_hora(m) for m in libres]
+
+# Paginación keyset sobre (fecha, hora, id_cita)
+def encode_cursor(cita: Cita) -> str:
+    raw = f"{cita.fecha.isoformat()}|{cita.hora.isoformat()}|{cita.id_cita}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """Lanza ValueError si el cursor no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        fecha, hora, id_cita = raw.split("|")
+        return date.fromisoformat(fecha), time.fromisoformat(hora), int(id_cita)
+    except Exception as e:
+        raise ValueError("Cursor inválido") from e
+
+def filtrar_citas(query, filtros: CitaFiltros):
+    if filtros.id_barbero is not None:
+        query = query.filter(Cita.id_barbero == filtros.id_barbero)
+    if filtros.id_usuario is not None:
+        query = query.filter(Cita.id_usuario == filtros.id_usuario)
+    if filtros.estado is not None:
+        query = query.filter(Cita.estado == filtros.estado)
+    if filtros.fecha_desde is not None:
+        query = query.filter(Cita.fecha >= filtros.fecha_desde)
+    if filtros.fecha_hasta is not None:
+        query = query.filter(Cita.fecha <= filtros.fecha_hasta)
+    return query
+
+# Columnas de CitaRead, para consultas que no necesitan objetos ORM
+CITA_COLUMNAS = (
+    Cita.id_cita, Cita.id_usuario, Cita.id_barbero, Cita.fecha,
+    Cita.hora, Cita.estado, Cita.servicio, Cita.duracion_minutos,
+)
+CITA_CAMPOS = [columna.key for columna in CITA_COLUMNAS]
+
+def select_citas_export(filtros: CitaFiltros, batch_size: int = 1000):
+    """
+    SELECT de solo columnas (sin identity map) con yield_per, que activa un
+    cursor del lado del servidor: la memoria no depende del total de filas.
+    """
+    stmt = filtrar_citas(select(*CITA_COLUMNAS), filtros)
+    return stmt.order_by(Cita.fecha, Cita.hora, Cita.id_cita).execution_options(
+        yield_per=batch_size
+    )
+
+def get_citas(db: Session, filtros: CitaFiltros, limit: int = 50, cursor: str = None):
+    """
+    Retorna (citas como dicts, next_cursor). Se pide una fila extra para
+    saber si hay otra página sin hacer COUNT. Solo columnas, sin objetos ORM.
+    """
+    stmt = filtrar_citas(select(*CITA_COLUMNAS), filtros)
+    if cursor:
+        stmt = stmt.where(
+            tuple_(Cita.fecha, Cita.hora, Cita.id_cita) > decode_cursor(cursor)
+        )
+    filas = db.execute(stmt.order_by(Cita.fecha, Cita.hora, Cita.id_cita).limit(limit + 1)).all()
+    
+    next_cursor = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        next_cursor = encode_cursor(filas[-1])
+    return [dict(zip(CITA_CAMPOS, fila)) for fila in filas], next_cursor
+
+def _fecha_cita(db: Session, cita_id: int):
+    """
+    Fecha de la cita según citas_fechas (búsqueda por PK), o None si no
+    existe. Filtrar citas por id y fecha poda a una partición; solo por id,
+    Postgres planifica y recorre todas.
+    """
+    return db.execute(select(CitaFecha.fecha).where(CitaFecha.id_cita == cita_id)).scalar()
+
+def _bloquear_cita(db: Session, cita_id: int, fecha):
+    """
+    SELECT ... FOR UPDATE de la cita por (id_cita, fecha). Si otra escritura
+    la cambió de mes entremedio (0 filas, o 40001 si la movió mientras
+    esperábamos el lock), vuelve a buscar la fecha. Retorna la fecha de la
+    fila bloqueada, o None si la cita ya no existe.
+    """
+    while fecha is not None:
+        try:
+            bloqueada = db.execute(
+                select(Cita.id_cita).where(Cita.id_cita == cita_id, Cita.fecha == fecha).with_for_update()
+            ).first()
+            if bloqueada is not None:
+                return fecha
+        except DBAPIError as e:
+            db.rollback()
+            if _sqlstate(e) != SERIALIZATION_FAILURE:
+                raise
+        fecha = _fecha_cita(db, cita_id)
+    return None
 
 def get_cita(db: Session, cita_id: int):
-    return db.query(Cita).filter(Cita.id_cita == cita_id).first()
+    """Retorna (cita, ETag) o (None, None); el ETag queda en caché para responder 304 sin BD"""
+    fecha = _fecha_cita(db, cita_id)
+    if fecha is None:
+        return None, None
+    db_cita = db.query(Cita).filter(Cita.id_cita == cita_id, Cita.fecha == fecha).first()
+    if db_cita is None:
+        return None, None
+    etag = etag_cita(db_cita.id_cita, db_cita.version)
+    cache.set(clave_cita_etag(cita_id), etag, _ttl_cache(db))
+    return db_cita, etag
+
+def etag_cita_cached(cita_id: int):
+    """ETag vigente de la cita según la caché, o None si no se conoce"""
+    return cache.get(clave_cita_etag(cita_id))
 
 def get_citas_usuario(db: Session, usuario_id: int):
     return db.query(Cita).filter(Cita.id_usuario == usuario_id).all()
 
-def update_cita(db: Session, cita_id: int, cita: CitaUpdate):
-    db_cita = db.query(Cita).filter(Cita.id_cita == cita_id).first()
-    if db_cita:
-        cita_data = cita.dict(exclude_unset=True)
-        for key, value in cita_data.items():
-            if value is not None:
-                setattr(db_cita, key, value)
-        db.commit()
-        db.refresh(db_cita)
-    return db_cita
+_Anterior = namedtuple("_Anterior", "id_barbero fecha servicio estado duracion_minutos")
+# Campos que definen el horario ocupado: solo si alguno cambia hay que revalidar solapamientos
+CAMPOS_HORARIO = ("id_barbero", "fecha", "hora", "duracion_minutos", "estado")
+# Intentos sin lock de update_cita antes de tomar FOR UPDATE (ver update_cita)
+UPDATE_REINTENTOS = 3
+
+def _evento_actualizada(fila) -> dict:
+    """Evento de update_cita; lleva el horario anterior si cambió"""
+    cita = {campo: getattr(fila, campo) for campo in CITA_CAMPOS}
+    tipo = ("cancelada" if cita["estado"] == "cancelada" and fila.estado_anterior != "cancelada"
+            else "actualizada")
+    anterior = {
+        "id_barbero": fila.id_barbero_anterior, "fecha": fila.fecha_anterior, "hora": fila.hora_anterior,
+        "duracion_minutos": fila.duracion_minutos_anterior,
+    }
+    horario_igual = all(cita[campo] == valor for campo, valor in anterior.items())
+    return eventos.evento(tipo, cita, None if horario_igual else anterior)
+
+def update_cita(db: Session, cita_id: int, cita: CitaUpdate, versiones: list[int] = None):
+    """
+    Retorna (cita, info_conflicto); la cita incluye su nueva `version`.
+    (None, {}) si la cita no existe y (None, info) si el nuevo horario
+    choca con otra cita del barbero.
+
+    Un solo UPDATE ... RETURNING. El FROM sobre la misma fila aporta los
+    valores anteriores (para el índice de agenda y el rollup de ocupación)
+    sin un SELECT previo. En READ COMMITTED, si otra escritura confirma
+    antes, Postgres re-evalúa la fila destino pero no vuelve a leer esa
+    subconsulta: `version = anterior.version` descarta el UPDATE con valores
+    anteriores viejos (0 filas) y se reintenta. El último intento bloquea
+    antes la fila con un SELECT ... FOR UPDATE aparte (el snapshot del
+    UPDATE que sigue ya ve la última versión) para garantizar que termina.
+    Cada intento busca la fecha en citas_fechas para podar particiones.
+
+    Concurrencia optimista: con `versiones` (del If-Match) el UPDATE lleva
+    `WHERE version IN (...)` y, si otra escritura ganó, lanza
+    PrecondicionFallida con el ETag vigente. No se toman locks de fila antes
+    del UPDATE, así las ediciones de un mismo barbero no se serializan. El
+    solapamiento lo revalida el constraint de exclusión, que Postgres solo
+    evalúa cuando cambia el horario (un cambio de servicio es un HOT update
+    que no toca sus índices).
+    """
+    cambios = {k: v for k, v in cita.dict(exclude_unset=True).items() if v is not None}
+    for intento in range(UPDATE_REINTENTOS + 1):
+        fecha = _fecha_cita(db, cita_id)
+        if intento == UPDATE_REINTENTOS:
+            fecha = _bloquear_cita(db, cita_id, fecha)
+        if fecha is None:
+            return None, {}
+        anterior = (
+            select(Cita.id_cita, Cita.id_barbero, Cita.fecha, Cita.hora, Cita.servicio, Cita.estado,
+                   Cita.duracion_minutos, Cita.version)
+            .where(Cita.id_cita == cita_id, Cita.fecha == fecha)
+            .subquery("anterior")
+        )
+        sentencia = update(Cita).where(Cita.id_cita == anterior.c.id_cita, Cita.fecha == fecha,
+                                       Cita.version == anterior.c.version)
+        if versiones is not None:
+            sentencia = sentencia.where(Cita.version.in_(versiones))
+        try:
+            fila = db.execute(
+                sentencia
+                .values(**cambios, version=Cita.version + 1)
+                .returning(*CITA_COLUMNAS, Cita.version,
+                           *[columna.label(f"{columna.key}_anterior") for columna in anterior.c
+                             if columna.key not in ("id_cita", "version")])
+            ).first()
+            if fila is not None:
+                _sumar_ocupacion(db, nuevas=[fila], anteriores=[_Anterior(
+                    fila.id_barbero_anterior, fila.fecha_anterior, fila.servicio_anterior,
+                    fila.estado_anterior, fila.duracion_minutos_anterior,
+                )])
+                eventos.emitir(db, [_evento_actualizada(fila)])
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            if _sqlstate(e) == CHECK_VIOLATION:
+                raise ValueError(FUERA_DEL_MES)
+            if not es_conflicto_horario(e):
+                raise
+            # El UPDATE falló completo: el horario en conflicto sale de la cita actual + cambios
+            actual = db.execute(
+                select(Cita.id_barbero, Cita.fecha, Cita.hora, Cita.duracion_minutos)
+                .where(Cita.id_cita == cita_id, Cita.fecha == _fecha_cita(db, cita_id))
+            ).first()
+            if actual is None:
+                continue  # Se borró o cambió de mes tras el conflicto: se reintenta
+            actual = actual._asdict()
+            actual.update(cambios)
+            _, cita_conflicto = verificar_disponibilidad_barbero(
+                db, actual["id_barbero"], actual["fecha"], actual["hora"],
+                actual["duracion_minutos"] or 30, excluir_id_cita=cita_id
+            )
+            return None, cita_conflicto
+        except DBAPIError as e:
+            db.rollback()
+            if _sqlstate(e) != SERIALIZATION_FAILURE or intento == UPDATE_REINTENTOS:
+                raise
+            continue
+        if fila is not None:
+            break
+        # 0 filas: cambió de versión (If-Match), la leímos vieja, o se borró o cambió
+        # de mes (la siguiente vuelta lo resuelve con citas_fechas)
+        version = db.execute(
+            select(Cita.version).where(Cita.id_cita == cita_id, Cita.fecha == fecha)
+        ).scalar()
+        if version is not None and versiones is not None and version not in versiones:
+            raise PrecondicionFallida(etag_cita(cita_id, version))
+    else:
+        # Solo si el conflicto del último intento vino de una fila que ya no está
+        return None, {}
+    db_cita = {campo: getattr(fila, campo) for campo in CITA_CAMPOS}
+    db_cita["version"] = fila.version
+    invalidar_perfil(db_cita["id_usuario"])
+    cache.invalidar(clave_cita_etag(cita_id))
+    if any(db_cita[campo] != getattr(fila, f"{campo}_anterior") for campo in CAMPOS_HORARIO):
+        agenda.quitar(fila.id_barbero_anterior, fila.fecha_anterior, cita_id)
+        if db_cita["estado"] != "cancelada":
+            agenda.agregar(db_cita["id_barbero"], db_cita["fecha"], db_cita["hora"],
+                           db_cita["duracion_minutos"] or 30, cita_id)
+    return db_cita, {}
 
 def delete_cita(db: Session, cita_id: int):
-    db_cita = db.query(Cita).filter(Cita.id_cita == cita_id).first()
-    if db_cita:
-        db.delete(db_cita)
-        db.commit()
-        return True
-    return False
+    # DELETE ... RETURNING: los datos para invalidar cachés salen del mismo statement.
+    # Un segundo intento por si otra escritura la cambió de mes entre la búsqueda y el DELETE
+    fila = None
+    for _ in range(2):
+        fecha = _fecha_cita(db, cita_id)
+        if fecha is None:
+            break
+        fila = db.execute(
+            delete(Cita)
+            .where(Cita.id_cita == cita_id, Cita.fecha == fecha)
+            .returning(*CITA_COLUMNAS)
+        ).first()
+        if fila is not None:
+            break
+    if fila is not None:
+        _sumar_ocupacion(db, anteriores=[fila])
+        eventos.emitir(db, [eventos.evento("eliminada", fila._asdict())])
+    db.commit()
+    if fila is None:
+        return False
+    invalidar_perfil(fila.id_usuario)
+    cache.invalidar(clave_cita_etag(cita_id))
+    agenda.quitar(fila.id_barbero, fila.fecha, cita_id)
+    return True
 
 # Datos estáticos
+def _insertar_si_vacia(db: Session, modelo, columnas: list, filas: list):
+    """INSERT ... SELECT ... WHERE NOT EXISTS: siembra la tabla solo si está vacía, en un statement"""
+    semilla = values(*(column(c, modelo.__table__.c[c].type) for c in columnas), name="semilla").data(filas)
+    db.execute(
+        insert(modelo).from_select(columnas, select(semilla).where(~select(modelo).exists()))
+    )
+
 def init_static_data(db: Session):
-    if db.query(Cliente).count() == 0:
-        db.add_all([
-            Cliente(nombre="Juan Perez", telefono="123456789"),
-            Cliente(nombre="Maria Lopez", telefono="987654321")
-        ])
-    if db.query(Barbero).count() == 0:
-        db.add_all([
-            Barbero(nombre="Carlos"),
-            Barbero(nombre="Luis")
-        ])
+    """Idempotente: se ejecuta con `python migrate.py seed` (build), no en cada arranque"""
+    _insertar_si_vacia(db, Cliente, ["nombre", "telefono"], [
+        ("Juan Perez", "123456789"),
+        ("Maria Lopez", "987654321")
+    ])
+    _insertar_si_vacia(db, Barbero, ["nombre"], [
+        ("Carlos",),
+        ("Luis",)
+    ])
     db.commit()
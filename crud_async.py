@@ -0,0 +1,130 @@
+"""
+Versiones async de las funciones de crud.py
+
+Cada función recibe la sesión de la dependencia `get_session`:
+- AsyncSession (DB_ASYNC=true): la función sync de crud.py se ejecuta con
+  `run_sync`, que usa el driver asyncpg sin bloquear el event loop ni
+  ocupar un hilo del threadpool.
+- Session (DB_ASYNC=false): la función se ejecuta en el threadpool de
+  Starlette, igual que las rutas sync originales (modo de comparación A/B).
+
+Así la lógica de negocio vive en un solo lugar (crud.py).
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import crud
+import hashing
+from database import session_scope
+from schemas import CitaCreate, CitaUpdate, CitaFiltros, UsuarioCreate
+
+
+async def _run(db, fn, *args):
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+# CRUD Usuarios
+async def create_usuario(db, usuario: UsuarioCreate):
+    # bcrypt corre en el pool de procesos, nunca en el event loop
+    hashed_password = await hashing.hash_password(usuario.contraseña)
+    return await _run(db, crud.create_usuario, usuario, hashed_password)
+
+async def get_usuario_by_email(db, email: str):
+    return await _run(db, crud.get_usuario_by_email, email)
+
+async def get_usuario_cached(db, usuario_id: int):
+    return await _run(db, crud.get_usuario_cached, usuario_id)
+
+async def get_perfil(db, usuario_id: int, limit: int = None, desde=None):
+    return await _run(db, crud.get_perfil, usuario_id, limit, desde)
+
+async def authenticate_usuario(db, email: str, contraseña: str):
+    usuario = await get_usuario_by_email(db, email)
+    if not usuario:
+        return None
+    if not await hashing.verify_password(contraseña, usuario.contraseña):
+        return None
+    return usuario
+
+async def rehash_contraseña(usuario_id: int, contraseña: str):
+    """Re-hashea con el coste actual; se ejecuta como tarea en segundo plano tras el login"""
+    try:
+        hashed_password = await hashing.hash_password(contraseña)
+    except hashing.HashingSaturado:
+        return  # Se reintentará en el próximo login
+    async with session_scope() as db:
+        await _run(db, crud.update_contraseña, usuario_id, hashed_password)
+
+# Tokens revocados
+async def revocar_token(db, jti: str, expira):
+    return await _run(db, crud.revocar_token, jti, expira)
+
+async def get_tokens_revocados(db):
+    return await _run(db, crud.get_tokens_revocados)
+
+async def purgar_tokens_revocados(db):
+    return await _run(db, crud.purgar_tokens_revocados)
+
+async def barbero_existe(db, id_barbero: int):
+    return await _run(db, crud.barbero_existe, id_barbero)
+
+# Estadísticas
+async def get_ocupacion(db, desde, hasta, id_barbero: int = None):
+    return await _run(db, crud.get_ocupacion, desde, hasta, id_barbero)
+
+# Particiones
+async def crear_particiones(db, meses: int = None):
+    return await _run(db, crud.crear_particiones, meses)
+
+# Idempotency-Key
+async def reservar_idempotencia(db, clave: str, huella: str):
+    return await _run(db, crud.reservar_idempotencia, clave, huella)
+
+async def get_idempotencia(db, clave: str):
+    return await _run(db, crud.get_idempotencia, clave)
+
+async def guardar_idempotencia(db, clave: str, status: int, headers: list, cuerpo: bytes):
+    return await _run(db, crud.guardar_idempotencia, clave, status, headers, cuerpo)
+
+async def liberar_idempotencia(db, clave: str):
+    return await _run(db, crud.liberar_idempotencia, clave)
+
+# CRUD Citas
+async def create_cita(db, usuario_id: int, cita: CitaCreate):
+    return await _run(db, crud.create_cita, usuario_id, cita)
+
+async def get_citas(db, filtros: CitaFiltros, limit: int = 50, cursor: str = None):
+    return await _run(db, crud.get_citas, filtros, limit, cursor)
+
+async def create_citas_batch(db, usuario_id: int, citas: list[CitaCreate]):
+    return await _run(db, crud.create_citas_batch, usuario_id, citas)
+
+async def get_disponibilidad(db, id_barbero: int, fecha, duracion_minutos: int):
+    return await _run(db, crud.get_disponibilidad, id_barbero, fecha, duracion_minutos)
+
+async def stream_citas(filtros: CitaFiltros, batch_size: int = 1000):
+    """
+    Genera lotes de filas para la exportación. Abre su propia sesión porque
+    el StreamingResponse sigue leyendo después de que termina la ruta.
+    """
+    stmt = crud.select_citas_export(filtros, batch_size)
+    async with session_scope(lectura=True) as db:
+        if isinstance(db, AsyncSession):
+            result = await db.stream(stmt)
+            async for lote in result.partitions():
+                yield lote
+        else:
+            result = await run_in_threadpool(db.execute, stmt)
+            while lote := await run_in_threadpool(result.fetchmany, batch_size):
+                yield lote
+
+async def get_cita(db, cita_id: int):
+    return await _run(db, crud.get_cita, cita_id)
+
+async def update_cita(db, cita_id: int, cita: CitaUpdate, versiones: list[int] = None):
+    return await _run(db, crud.update_cita, cita_id, cita, versiones)
+
+async def delete_cita(db, cita_id: int):
+    return await _run(db, crud.delete_cita, cita_id)
@@ -1,19 +1,36 @@
+import asyncio
+import itertools
+import logging
+import math
 import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, event, pool
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event, pool, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from config import config
+import auth
+import consultas
+import metricas
+from cache import cache, clave_primario_cita, clave_primario_usuario
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # URLs de conexión
 DATABASE_URL = os.getenv("DATABASE_URL", "")  # Pool de conexión para aplicación
 DIRECT_URL = os.getenv("DIRECT_URL", "")      # Conexión directa para migraciones
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL no está configurada en .env")
 
 # Limpiar la URL de parámetros no soportados por psycopg2
 def clean_database_url(url):
@@ -42,38 +59,372 @@ def clean_database_url(url):
     
     return clean_url
 
-# Limpiar URLs
-DATABASE_URL_CLEAN = clean_database_url(DATABASE_URL)
-DIRECT_URL_CLEAN = clean_database_url(DIRECT_URL) if DIRECT_URL else DATABASE_URL_CLEAN
-
-# Configuración del motor para producción con Supabase
-engine = create_engine(
-    DATABASE_URL_CLEAN,
-    poolclass=pool.QueuePool,
-    pool_size=15,
-    max_overflow=25,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    connect_args={
-        "connect_timeout": 10,
-        "application_name": "barbershop_api"
-    },
-    echo=False,
-)
-
-# Motor directo para migraciones (sin pool)
-direct_engine = create_engine(
-    DIRECT_URL_CLEAN,
-    poolclass=pool.NullPool,
-    echo=False,
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def to_async_url(url):
+    """Convierte una URL postgresql:// de psycopg2 al driver asyncpg"""
+    parsed = urlparse(url)
+    params = parse_qs(parsed.query)
+    # asyncpg no entiende sslmode, usa ssl con los mismos valores
+    if 'sslmode' in params:
+        params['ssl'] = params.pop('sslmode')
+
+    return urlunparse((
+        'postgresql+asyncpg',
+        parsed.netloc,
+        parsed.path,
+        parsed.params,
+        urlencode(params, doseq=True),
+        parsed.fragment
+    ))
+
+def uses_pgbouncer(url):
+    """Indica si la URL apunta a un pooler PgBouncer (pgbouncer=true)"""
+    params = parse_qs(urlparse(url).query)
+    return params.get('pgbouncer', ['false'])[0].lower() == 'true'
+
+class _CheckoutMedido:
+    """Registra en metricas.ESPERA_CHECKOUT cuánto tarda cada checkout (incluye abrir conexiones nuevas)"""
+    etiqueta = ""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metricas.ESPERA_CHECKOUT.labels(self.etiqueta).observe(time.perf_counter() - inicio)
+
+class QueuePoolMedido(_CheckoutMedido, pool.QueuePool):
+    etiqueta = "sync"
+
+class AsyncQueuePoolMedido(_CheckoutMedido, pool.AsyncAdaptedQueuePool):
+    etiqueta = "async"
+
+def _pool_medido(base, etiqueta: str):
+    """Subclase de `base` con otra etiqueta de métricas (sobrevive a pool.recreate())"""
+    return type(base.__name__, (base,), {"etiqueta": etiqueta})
+
+def _url_app():
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL no está configurada en .env")
+    return clean_database_url(DATABASE_URL)
+
+def _url_directa():
+    return clean_database_url(DIRECT_URL) if DIRECT_URL else _url_app()
+
+# Los motores se crean en el primer uso: importar este módulo no abre
+# conexiones ni exige DATABASE_URL (arranque rápido, scripts y tests)
+_motores = {}
+_lock_motores = threading.Lock()
+
+def _motor(nombre, crear):
+    motor = _motores.get(nombre)
+    if motor is None:
+        with _lock_motores:
+            motor = _motores.get(nombre)
+            if motor is None:
+                motor = _motores[nombre] = crear()
+    return motor
+
+def _opciones_pool(poolclass, url: str = None):
+    """
+    Pool de este proceso. El tamaño sale del presupuesto global repartido
+    entre workers (config.DB_POOL_SIZE / DB_MAX_OVERFLOW, ver run_server.py).
+    """
+    if config.DB_NULLPOOL:
+        return {"poolclass": pool.NullPool}
+    opciones = {
+        "poolclass": poolclass,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": 3600,
+    }
+    if uses_pgbouncer(url or DATABASE_URL):
+        # El pooler ya multiplexa las conexiones al servidor: pool fijo sin
+        # overflow (abrir/cerrar contra el pooler es lo caro) y reciclado corto
+        opciones.update(
+            pool_size=config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW,
+            max_overflow=0,
+            pool_recycle=300,
+        )
+    return opciones
+
+def _crear_engine(url: str = None, etiqueta: str = "sync"):
+    # Configuración del motor para producción con Supabase
+    url = url or DATABASE_URL
+    motor = create_engine(
+        clean_database_url(url) if url != DATABASE_URL else _url_app(),
+        **_opciones_pool(_pool_medido(QueuePoolMedido, etiqueta), url),
+        connect_args={
+            "connect_timeout": 10,
+            "application_name": "barbershop_api"
+        },
+        echo=False,
+    )
+    consultas.instrumentar(motor)
+    metricas.registrar_pool(etiqueta, motor.pool)
+    return motor
+
+def _crear_direct_engine():
+    # Motor directo para migraciones (sin pool)
+    return create_engine(
+        _url_directa(),
+        poolclass=pool.NullPool,
+        echo=False,
+    )
+
+def _crear_async_engine(url: str = None, etiqueta: str = "async"):
+    # Motor async (asyncpg) con el mismo presupuesto de pool que el motor sync
+    url = url or DATABASE_URL
+    async_connect_args = {
+        "timeout": 10,
+        "server_settings": {"application_name": "barbershop_api"},
+    }
+    if uses_pgbouncer(url):
+        # PgBouncer en modo transacción no soporta prepared statements con nombre:
+        # sin caché y con nombres únicos para que no choquen entre conexiones
+        async_connect_args["statement_cache_size"] = 0
+        async_connect_args["prepared_statement_cache_size"] = 0
+        async_connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+
+    motor = create_async_engine(
+        to_async_url(clean_database_url(url) if url != DATABASE_URL else _url_app()),
+        **_opciones_pool(_pool_medido(AsyncQueuePoolMedido, etiqueta), url),
+        connect_args=async_connect_args,
+        echo=False,
+    )
+    consultas.instrumentar(motor.sync_engine)
+    metricas.registrar_pool(etiqueta, motor.sync_engine.pool)
+    return motor
+
+def get_engine():
+    return _motor("engine", _crear_engine)
+
+def get_direct_engine():
+    return _motor("direct_engine", _crear_direct_engine)
+
+def get_async_engine():
+    return _motor("async_engine", _crear_async_engine)
+
+def __getattr__(nombre):
+    # Compatibilidad: `from database import engine` sigue funcionando (y crea el motor en ese momento)
+    fabricas = {"engine": get_engine, "direct_engine": get_direct_engine, "async_engine": get_async_engine}
+    if nombre in fabricas:
+        return fabricas[nombre]()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+async def dispose():
+    """Cierra los pools de los motores que llegaron a crearse"""
+    with _lock_motores:
+        motores = list(_motores.values())
+        _motores.clear()
+    for motor in motores:
+        if isinstance(motor, AsyncEngine):
+            await motor.dispose()
+        else:
+            motor.dispose()
+
+async def _escalar(motor, sql: str, timeout: float):
+    """Valor de una consulta escalar en `motor` (Engine o AsyncEngine), con timeout"""
+    if isinstance(motor, AsyncEngine):
+        async def _consulta():
+            async with motor.connect() as conn:
+                return (await conn.execute(text(sql))).scalar()
+        return await asyncio.wait_for(_consulta(), timeout)
+
+    def _consulta():
+        with motor.connect() as conn:
+            return conn.execute(text(sql)).scalar()
+    return await asyncio.wait_for(run_in_threadpool(_consulta), timeout)
+
+async def ping(timeout: float = 2.0) -> bool:
+    """SELECT 1 a través del pool de la app: True si hay una conexión viva"""
+    try:
+        await _escalar(get_async_engine() if DB_ASYNC else get_engine(), "SELECT 1", timeout)
+        return True
+    except Exception:
+        return False
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+# expire_on_commit=False: los objetos se serializan fuera del contexto async
+AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+DB_ASYNC = config.DB_ASYNC
+
 def get_db():
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        yield db
+
+# Dependencia usada por las rutas: DB_ASYNC=false vuelve al camino sync (A/B)
+get_session = get_async_db if DB_ASYNC else get_db
+
+@asynccontextmanager
+async def session_scope(lectura: bool = False):
+    """
+    Sesión fuera de una request (startup, tareas en segundo plano).
+    lectura=True la abre contra una réplica sana si las hay.
+    """
+    replica = elegir_replica() if lectura else None
+    async with _sesion(replica) as db:
+        yield db
+
+# ============= RÉPLICAS DE LECTURA =============
+#
+# Con REPLICA_URLS las rutas de solo lectura usan get_read_session: una
+# réplica sana por round-robin. Las escrituras (y la validación de
+# solapamiento de create_cita) siguen en el primario vía get_session.
+# Tras una escritura el cliente lee del primario durante
+# LECTURA_PRIMARIO_SEGUNDOS para ver sus cambios: la cookie cubre a los
+# navegadores; al usuario del token y a la cita escrita los fija la caché
+# (con CACHE_BACKEND=redis, compartida por todos los workers).
+
+# Retraso de replicación; 0 en el primario o si la réplica aplicó todo lo recibido
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+COOKIE_PRIMARIO = "leer_primario"
+
+class Replica:
+    def __init__(self, indice: int, url: str):
+        self.etiqueta = f"replica{indice}"
+        self.url = url
+        self.sana = True
+        self.lag_segundos = 0.0
+
+    @property
+    def motor(self):
+        crear = _crear_async_engine if DB_ASYNC else _crear_engine
+        return _motor(self.etiqueta, lambda: crear(self.url, self.etiqueta))
+
+_replicas = [Replica(i, url) for i, url in enumerate(config.REPLICA_URLS)]
+_turno = itertools.count()
+
+def hay_replicas() -> bool:
+    return bool(_replicas)
+
+def elegir_replica():
+    """Siguiente réplica sana (round-robin), o None para leer del primario"""
+    sanas = [replica for replica in _replicas if replica.sana]
+    if not sanas:
+        return None
+    return sanas[next(_turno) % len(sanas)]
+
+def estado_replicas() -> list:
+    return [{"replica": r.etiqueta, "sana": r.sana, "lag_segundos": round(r.lag_segundos, 3)}
+            for r in _replicas]
+
+async def _verificar(replica: Replica):
+    try:
+        replica.lag_segundos = float(await _escalar(replica.motor, LAG_SQL, timeout=2.0) or 0)
+        replica.sana = replica.lag_segundos <= config.REPLICA_MAX_LAG_SEGUNDOS
+    except Exception:
+        replica.sana = False
+
+async def vigilar_replicas():
+    """Health check periódico (conexión + lag); se lanza desde el lifespan"""
+    while True:
+        await asyncio.gather(*(_verificar(replica) for replica in _replicas))
+        await asyncio.sleep(config.REPLICA_CHECK_SEGUNDOS)
+
+async def mantener_particiones():
+    """Crea por adelantado las particiones de citas que falten; se lanza desde el lifespan"""
+    from crud_async import crear_particiones
+    while True:
+        try:
+            async with session_scope() as db:
+                creadas = await crear_particiones(db)
+            if creadas:
+                logger.info("Particiones de citas creadas: %d", creadas)
+        except Exception:
+            logger.exception("No se pudieron crear las particiones de citas")
+        await asyncio.sleep(config.PARTICIONES_CHECK_SEGUNDOS)
+
+def validar_replicas():
+    """Con la caché en memoria, una lectura que cae en otro worker no ve la escritura fijada"""
+    if _replicas and config.CACHE_BACKEND == "memoria" and config.WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            f"REPLICA_URLS con {config.WEB_CONCURRENCY} workers requiere CACHE_BACKEND=redis "
+            "(read-your-writes)"
+        )
+
+def _usuario_del_token(request: Request):
+    """usuario_id del access token, si viene uno válido (las lecturas no lo exigen)"""
+    esquema, _, token = request.headers.get("authorization", "").partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        return None
+    try:
+        return int(auth.decodificar(token, "access")["sub"])
+    except auth.TokenInvalido:
+        return None
+
+def _claves_primario(request: Request, usuario_id=None) -> list:
+    """Claves de caché que fijan esta petición al primario: su usuario y la cita de la ruta"""
+    claves = []
+    if usuario_id is not None:
+        claves.append(clave_primario_usuario(usuario_id))
+    cita_id = request.path_params.get("cita_id")
+    if cita_id is not None:
+        claves.append(clave_primario_cita(cita_id))
+    return claves
+
+def _fijado(request: Request) -> bool:
+    # Directo al backend: estas consultas no cuentan en el hit ratio de la caché
+    return any(cache.backend.get(clave) for clave in _claves_primario(request, _usuario_del_token(request)))
+
+async def marcar_escritura(request: Request, response: Response):
+    """Dependencia de las rutas de escritura: el cliente lee del primario por un rato"""
+    if _replicas:
+        response.set_cookie(COOKIE_PRIMARIO, "1", max_age=math.ceil(config.LECTURA_PRIMARIO_SEGUNDOS),
+                            httponly=True, samesite="lax")
+    yield
+    if not _replicas:
+        return
+    # Tras la ruta: el usuario sale del token (request.state si la ruta lo
+    # validó) o, sin token, del ?usuario_id= legacy que validó la ruta
+    usuario_id = getattr(request.state, "usuario_id", None) or _usuario_del_token(request)
+    if usuario_id is None and str(request.query_params.get("usuario_id", "")).isdigit():
+        usuario_id = int(request.query_params["usuario_id"])
+    for clave in _claves_primario(request, usuario_id):
+        cache.backend.set(clave, True, config.LECTURA_PRIMARIO_SEGUNDOS)
+
+@asynccontextmanager
+async def _sesion(replica: Replica = None):
+    """Sesión (async o sync según DB_ASYNC) contra la réplica o, si es None, el primario"""
+    info = {"replica": replica is not None}
+    if DB_ASYNC:
+        motor = replica.motor if replica else get_async_engine()
+        async with AsyncSessionLocal(bind=motor, info=info) as db:
+            yield db
+    else:
+        db = SessionLocal(bind=replica.motor if replica else get_engine(), info=info)
+        try:
+            yield db
+        finally:
+            db.close()
+
+async def get_read_session(request: Request):
+    """
+    Dependencia de las rutas de solo lectura. Lee del primario si no hay
+    réplicas sanas o si el cliente/usuario escribió hace poco.
+    """
+    replica = None
+    if _replicas and not request.cookies.get(COOKIE_PRIMARIO) and not _fijado(request):
+        replica = elegir_replica()
+    try:
+        async with _sesion(replica) as db:
+            yield db
+    except (OperationalError, OSError):
+        # Falla de conexión: fuera de la rotación hasta el próximo health check
+        if replica is not None:
+            replica.sana = False
+        raise
@@ -0,0 +1,72 @@
+"""
+ETags fuertes a partir de la columna `version` de usuarios y citas
+
+Una cita cambia de ETag cuando cambia su versión. El perfil depende de la
+versión del usuario y del conjunto (id_cita, version) de sus citas, así que
+crear, modificar o eliminar una cita también cambia el ETag del perfil.
+
+PUT /citas/{id} acepta el ETag de la cita en If-Match para hacer
+compare-and-swap sobre `version` (412 si otra escritura se adelantó).
+
+Una respuesta comprimida es otra representación: compresion.py agrega la
+codificación al ETag ("c1-v3-br"). Al comparar se ignora ese sufijo, así el
+ETag de una respuesta comprimida sirve igual en If-None-Match e If-Match.
+"""
+
+import hashlib
+import re
+
+_ETAG_CITA = re.compile(r'"c(\d+)-v(\d+)"')
+_SUFIJO_CODIFICACION = re.compile(r'-(?:br|gzip)"$')
+
+
+class PrecondicionFallida(Exception):
+    """If-Match no coincide con la versión actual (412); `etag` es el vigente"""
+
+    def __init__(self, etag: str):
+        super().__init__(etag)
+        self.etag = etag
+
+
+def etag_cita(id_cita: int, version: int) -> str:
+    return f'"c{id_cita}-v{version}"'
+
+def etag_perfil(id_usuario: int, version_usuario: int, citas_versiones) -> str:
+    """`citas_versiones`: iterable de (id_cita, version)"""
+    h = hashlib.sha1(str(version_usuario).encode())
+    for id_cita, version in sorted(citas_versiones):
+        h.update(f"|{id_cita}.{version}".encode())
+    return f'"p{id_usuario}-{h.hexdigest()[:16]}"'
+
+def con_codificacion(etag: str, codificacion: str) -> str:
+    """ETag de la representación comprimida con `codificacion` (Content-Encoding)"""
+    return f'{etag[:-1]}-{codificacion}"' if etag.endswith('"') else etag
+
+def sin_codificacion(etag: str) -> str:
+    return _SUFIJO_CODIFICACION.sub('"', etag)
+
+def coincide(if_none_match: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110 §13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        sin_codificacion(candidato.strip().removeprefix("W/")) == etag
+        for candidato in if_none_match.split(",")
+    )
+
+def versiones_if_match(if_match: str, id_cita: int):
+    """
+    Versiones de la cita aceptadas por un If-Match (comparación fuerte,
+    RFC 9110 §13.1.1). None si es "*" (basta con que exista); una lista
+    vacía si ningún ETag corresponde a la cita.
+    """
+    if if_match.strip() == "*":
+        return None
+    versiones = []
+    for candidato in if_match.split(","):
+        coincidencia = _ETAG_CITA.fullmatch(sin_codificacion(candidato.strip()))
+        if coincidencia and int(coincidencia.group(1)) == id_cita:
+            versiones.append(int(coincidencia.group(2)))
+    return versiones
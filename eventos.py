@@ -0,0 +1,257 @@
+"""
+Eventos de citas en tiempo real (Server-Sent Events)
+
+crud.create_cita, create_citas_batch, update_cita y delete_cita llaman a
+`emitir` dentro de su transacción; los eventos salen solo si hace commit:
+
+- EVENTOS_BACKEND=memoria (default con un worker): se guardan en
+  session.info y se reparten en este proceso tras el commit. Con más de un
+  worker la app no arranca con este backend (`validar_backend`).
+- EVENTOS_BACKEND=postgres (default con WEB_CONCURRENCY > 1): `pg_notify`
+  en la misma transacción (Postgres
+  los entrega al confirmar) y cada worker los recibe con LISTEN en una
+  conexión asyncpg dedicada (`escuchar`, lanzada desde el lifespan). LISTEN
+  no funciona a través de PgBouncer en modo transacción: usa DIRECT_URL.
+
+Cada suscriptor tiene una cola acotada (STREAM_COLA_MAX). Un cliente que
+no la vacía a tiempo se expulsa: su stream se cierra y EventSource
+reconecta solo, así un consumidor lento nunca retiene memoria ni frena al
+resto. Un suscriptor ocioso no cuesta más que su cola; el keep-alive lo
+envía una única tarea (`latir`) para todos.
+"""
+
+import asyncio
+import logging
+
+import orjson
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import metricas
+from config import config
+
+logger = logging.getLogger(__name__)
+
+CANAL_PG = "citas_eventos"
+# pg_notify acepta hasta 8000 bytes por payload; los lotes grandes se parten
+MAX_PAYLOAD = 7500
+PING = object()
+# Lo que ve el stream público de un barbero: ocupación de su agenda, sin datos del cliente
+CAMPOS_BARBERO = ("id_cita", "id_barbero", "fecha", "hora", "duracion_minutos", "estado")
+
+
+class StreamSaturado(Exception):
+    """Se alcanzó STREAM_MAX_SUSCRIPTORES en este worker"""
+
+
+def canal_barbero(id_barbero: int) -> str:
+    return f"barbero:{id_barbero}"
+
+def canal_usuario(id_usuario: int) -> str:
+    return f"usuario:{id_usuario}"
+
+
+def evento(tipo: str, cita: dict, anterior: dict = None) -> dict:
+    """`tipo`: creada, actualizada, cancelada o eliminada. `anterior`: horario previo en un cambio"""
+    return {"tipo": tipo, "cita": cita, "anterior": anterior}
+
+def _destinos(ev: dict):
+    """(canal, datos) a los que va un evento"""
+    cita = ev["cita"]
+    publico = {campo: cita[campo] for campo in CAMPOS_BARBERO if campo in cita}
+    if ev["anterior"]:
+        publico["anterior"] = ev["anterior"]
+    yield canal_barbero(cita["id_barbero"]), publico
+    anterior = ev["anterior"]
+    if anterior and anterior["id_barbero"] != cita["id_barbero"]:
+        yield canal_barbero(anterior["id_barbero"]), publico
+    if cita.get("id_usuario") is not None:
+        yield canal_usuario(cita["id_usuario"]), dict(cita, anterior=anterior) if anterior else cita
+
+
+class Suscriptor:
+    __slots__ = ("canal", "cola", "expulsado")
+
+    def __init__(self, canal: str, maximo: int):
+        self.canal = canal
+        self.cola = asyncio.Queue(maximo)
+        self.expulsado = False
+
+
+class Broadcaster:
+    """Reparto en proceso por canal; todo corre en el event loop de la app"""
+
+    def __init__(self, max_cola: int, max_suscriptores: int):
+        self.max_cola = max_cola
+        self.max_suscriptores = max_suscriptores
+        self._canales = {}  # canal -> set de Suscriptor
+        self._total = 0
+        self._loop = None
+
+    def __len__(self):
+        return self._total
+
+    def suscribir(self, canal: str) -> Suscriptor:
+        if self._total >= self.max_suscriptores:
+            raise StreamSaturado()
+        self._loop = asyncio.get_running_loop()
+        suscriptor = Suscriptor(canal, self.max_cola)
+        self._canales.setdefault(canal, set()).add(suscriptor)
+        self._total += 1
+        return suscriptor
+
+    def desuscribir(self, suscriptor: Suscriptor):
+        suscriptores = self._canales.get(suscriptor.canal)
+        if suscriptores is None or suscriptor not in suscriptores:
+            return
+        suscriptores.discard(suscriptor)
+        self._total -= 1
+        if not suscriptores:
+            del self._canales[suscriptor.canal]
+
+    def _expulsar(self, suscriptor: Suscriptor, motivo: str):
+        suscriptor.expulsado = True
+        self.desuscribir(suscriptor)
+        metricas.STREAM_EXPULSADOS.labels(motivo).inc()
+        # Despierta al consumidor si esperaba en la cola (una vacía nunca está llena)
+        if suscriptor.cola.empty():
+            suscriptor.cola.put_nowait(PING)
+
+    def _entregar(self, suscriptor: Suscriptor, mensaje):
+        try:
+            suscriptor.cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            self._expulsar(suscriptor, "lento")
+
+    def repartir(self, eventos: list):
+        """Reparte en este proceso. Solo desde el event loop"""
+        for ev in eventos:
+            for canal, datos in _destinos(ev):
+                for suscriptor in list(self._canales.get(canal, ())):
+                    self._entregar(suscriptor, (ev["tipo"], datos))
+
+    def publicar(self, eventos: list):
+        """Como `repartir`, pero desde cualquier hilo (threadpool de crud_async)"""
+        if self._loop is None or not self._total:
+            return
+        self._loop.call_soon_threadsafe(self.repartir, eventos)
+
+    def latido(self):
+        for suscriptores in list(self._canales.values()):
+            for suscriptor in list(suscriptores):
+                self._entregar(suscriptor, PING)
+
+    def expulsar_todos(self, motivo: str):
+        for suscriptores in list(self._canales.values()):
+            for suscriptor in list(suscriptores):
+                self._expulsar(suscriptor, motivo)
+
+
+broadcaster = Broadcaster(config.STREAM_COLA_MAX, config.STREAM_MAX_SUSCRIPTORES)
+metricas.registrar_stream(broadcaster.__len__)
+
+
+# ============= EMISIÓN (dentro de la transacción de crud) =============
+
+def _payloads(eventos: list) -> list[str]:
+    """JSON de listas de eventos, cada uno bajo MAX_PAYLOAD bytes"""
+    payloads, actual, tamaño = [], [], 2
+    for ev in eventos:
+        codificado = orjson.dumps(ev)
+        if actual and tamaño + len(codificado) + 1 > MAX_PAYLOAD:
+            payloads.append(b"[" + b",".join(actual) + b"]")
+            actual, tamaño = [], 2
+        actual.append(codificado)
+        tamaño += len(codificado) + 1
+    if actual:
+        payloads.append(b"[" + b",".join(actual) + b"]")
+    return [payload.decode() for payload in payloads]
+
+def validar_backend():
+    """En memoria, un evento solo llega a los suscriptores del worker que hizo la escritura"""
+    if config.EVENTOS_BACKEND == "memoria" and config.WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            f"EVENTOS_BACKEND=memoria no sirve con {config.WEB_CONCURRENCY} workers: usar postgres"
+        )
+
+def emitir(db: Session, eventos: list):
+    """Encola los eventos de la escritura en curso; salen solo si la transacción hace commit"""
+    if not eventos:
+        return
+    if config.EVENTOS_BACKEND == "postgres":
+        db.execute(
+            text("SELECT pg_notify(:canal, p) FROM unnest(CAST(:payloads AS text[])) AS p"),
+            {"canal": CANAL_PG, "payloads": _payloads(eventos)},
+        )
+    else:
+        db.info.setdefault("eventos", []).extend(eventos)
+
+@event.listens_for(Session, "after_commit")
+def _tras_commit(session):
+    eventos = session.info.pop("eventos", None)
+    if eventos:
+        broadcaster.publicar(eventos)
+
+@event.listens_for(Session, "after_rollback")
+def _tras_rollback(session):
+    session.info.pop("eventos", None)
+
+
+# ============= STREAM SSE =============
+
+def _sse(tipo: str, datos) -> bytes:
+    return b"event: " + tipo.encode() + b"\ndata: " + orjson.dumps(datos) + b"\n\n"
+
+async def stream(suscriptor: Suscriptor):
+    """Cuerpo de la StreamingResponse; la desuscripción corre también si el cliente corta"""
+    try:
+        yield f"retry: {config.STREAM_RETRY_MS}\n\n".encode()
+        while not suscriptor.expulsado:
+            mensaje = await suscriptor.cola.get()
+            if suscriptor.expulsado:
+                break
+            yield b": ping\n\n" if mensaje is PING else _sse(*mensaje)
+    finally:
+        broadcaster.desuscribir(suscriptor)
+
+
+# ============= TAREAS DEL LIFESPAN =============
+
+async def latir():
+    """Keep-alive para proxies y detección de clientes caídos, un timer para todos"""
+    while True:
+        await asyncio.sleep(config.STREAM_PING_SEGUNDOS)
+        broadcaster.latido()
+
+async def escuchar():
+    """LISTEN en una conexión dedicada, con reconexión; solo con EVENTOS_BACKEND=postgres"""
+    import asyncpg
+    from database import _url_directa
+
+    def al_notificar(conexion, pid, canal, payload):
+        try:
+            broadcaster.repartir(orjson.loads(payload))
+        except Exception:
+            logger.exception("Evento de citas inválido: %.200s", payload)
+
+    primera = True
+    while True:
+        conexion = None
+        try:
+            conexion = await asyncpg.connect(_url_directa())
+            await conexion.add_listener(CANAL_PG, al_notificar)
+            if not primera:
+                # Lo notificado mientras no escuchábamos se perdió: que los clientes reconecten y recarguen
+                broadcaster.expulsar_todos("reconexion")
+            primera = False
+            while not conexion.is_closed():
+                await asyncio.sleep(config.STREAM_PING_SEGUNDOS)
+                await conexion.execute("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("LISTEN %s interrumpido; reintentando", CANAL_PG)
+            await asyncio.sleep(1)
+        finally:
+            if conexion is not None and not conexion.is_closed():
+                await conexion.close()
@@ -0,0 +1,35 @@
+"""
+Formatos de exportación de citas (NDJSON y CSV) para StreamingResponse
+
+Reciben los lotes de crud_async.stream_citas y emiten un bloque de texto
+por lote, así nunca se arma el archivo completo en memoria.
+"""
+
+import csv
+import io
+import json
+
+COLUMNAS = ["id_cita", "id_usuario", "id_barbero", "fecha", "hora",
+            "estado", "servicio", "duracion_minutos"]
+
+def _valor(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+async def ndjson(lotes):
+    async for lote in lotes:
+        yield "".join(
+            json.dumps({col: _valor(v) for col, v in zip(COLUMNAS, fila)},
+                       ensure_ascii=False) + "\n"
+            for fila in lote
+        )
+
+async def csv_(lotes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS)
+    yield buffer.getvalue()
+    async for lote in lotes:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_valor(v) for v in fila] for fila in lote)
+        yield buffer.getvalue()
@@ -0,0 +1,120 @@
+"""
+Hashing de contraseñas (bcrypt) fuera del camino de la request
+
+bcrypt consume 100-300 ms de CPU por llamada. Ejecutarlo en el proceso
+del servidor (event loop o threadpool) bloquea al resto de endpoints
+durante una ráfaga de logins, así que se delega a un pool de procesos
+de tamaño fijo con un límite de trabajos pendientes. Si la cola está
+llena se lanza HashingSaturado y la API responde 503.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+from config import config
+import metricas
+
+# min_rounds = rounds: los hashes antiguos (10 rounds) quedan marcados
+# por needs_update() y se re-hashean tras el siguiente login exitoso
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=config.BCRYPT_ROUNDS,
+)
+
+class HashingSaturado(Exception):
+    """La cola del pool de hashing alcanzó HASH_MAX_PENDIENTES"""
+
+_executor = None
+_lock = threading.Lock()
+_pendientes = 0
+
+# Funciones ejecutadas en los procesos del pool
+def _hash(contraseña: str) -> str:
+    return pwd_context.hash(contraseña)
+
+def _verify(contraseña: str, hashed: str) -> bool:
+    return pwd_context.verify(contraseña, hashed)
+
+def _cronometrado(fn, *args):
+    """Corre en el proceso del pool: retorna (resultado, segundos de CPU de bcrypt)"""
+    inicio = time.perf_counter()
+    resultado = fn(*args)
+    return resultado, time.perf_counter() - inicio
+
+def _registrar(operacion: str, resultado_y_duracion):
+    resultado, segundos = resultado_y_duracion
+    metricas.DURACION_BCRYPT.labels(operacion).observe(segundos)
+    return resultado
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn: no heredar hilos ni conexiones abiertas del servidor
+            _executor = ProcessPoolExecutor(
+                max_workers=config.HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+def _liberar(_future=None):
+    global _pendientes
+    with _lock:
+        _pendientes -= 1
+
+def _submit(fn, *args):
+    global _pendientes
+    executor = _get_executor()
+    with _lock:
+        if _pendientes >= config.HASH_MAX_PENDIENTES:
+            raise HashingSaturado()
+        _pendientes += 1
+    try:
+        future = executor.submit(_cronometrado, fn, *args)
+    except Exception:
+        _liberar()
+        raise
+    future.add_done_callback(_liberar)
+    return future
+
+def pendientes() -> int:
+    """Trabajos de hashing en ejecución o en cola"""
+    return _pendientes
+
+async def hash_password(contraseña: str) -> str:
+    return _registrar("hash", await asyncio.wrap_future(_submit(_hash, contraseña)))
+
+async def verify_password(contraseña: str, hashed: str) -> bool:
+    return _registrar("verify", await asyncio.wrap_future(_submit(_verify, contraseña, hashed)))
+
+def hash_password_sync(contraseña: str) -> str:
+    """Para llamadas desde código sync (threadpool, scripts)"""
+    return _registrar("hash", _submit(_hash, contraseña).result())
+
+def verify_password_sync(contraseña: str, hashed: str) -> bool:
+    return _registrar("verify", _submit(_verify, contraseña, hashed).result())
+
+metricas.registrar_hashing(pendientes)
+
+def needs_update(hashed: str) -> bool:
+    return pwd_context.needs_update(hashed)
+
+def warmup():
+    """Arranca los procesos del pool para que el primer login no pague el spawn"""
+    executor = _get_executor()
+    for _ in range(config.HASH_WORKERS):
+        executor.submit(int)
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,259 @@
+"""
+Idempotency-Key para POST /citas/, /citas/batch y /registro/
+
+La app Flutter reintenta tras un timeout. Con el header `Idempotency-Key`
+el reintento recibe la respuesta original (header `Idempotent-Replayed:
+true`) sin volver a ejecutar bcrypt ni la validación de solapamiento, en
+lugar de un 409 contra su propio primer intento.
+
+- La clave se asocia a método, ruta y header Authorization; la huella
+  (query string + cuerpo) debe coincidir: la misma clave con otra petición
+  responde 422.
+- Un duplicado que llega mientras el original se ejecuta espera su
+  resultado hasta IDEMPOTENCIA_ESPERA_SEGUNDOS (luego 409).
+- Solo se guardan resultados definitivos: 2xx y los rechazos de dominio
+  (ESTADOS_DEFINITIVOS: validación, conflicto, no encontrado). Un 5xx o un
+  rechazo transitorio previo a la ruta (429 del rate limit, 503 de
+  admisión, 401, 412/428 de precondiciones) libera la clave para que el
+  reintento se ejecute de nuevo.
+
+Backends (IDEMPOTENCIA_BACKEND):
+- MemoryIdempotencia (default con un worker): por proceso, la espera usa
+  asyncio.Event. Con más de un worker la app no arranca con él.
+- TablaIdempotencia (default con WEB_CONCURRENCY > 1): tabla `idempotencia`
+  compartida entre workers; la espera consulta la fila hasta que el
+  original guarda su respuesta.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from starlette.datastructures import Headers
+
+from config import config
+
+RUTAS = {"/citas/", "/citas/batch", "/registro/"}
+MAX_LARGO_CLAVE = 255
+# Headers de la respuesta original que no se repiten
+_NO_GUARDAR = {b"server-timing", b"set-cookie"}
+# 4xx que repetir la misma petición volvería a producir
+ESTADOS_DEFINITIVOS = {400, 404, 409, 422}
+
+
+class HuellaDistinta(Exception):
+    """La clave ya se usó con otra petición"""
+
+class EnProceso(Exception):
+    """La petición original sigue ejecutándose tras la espera máxima"""
+
+
+@dataclass
+class Respuesta:
+    status: int
+    headers: list  # [(nombre, valor)] en bytes, como en ASGI
+    cuerpo: bytes
+
+
+class IdempotenciaBackend:
+    """Interfaz de un almacén de claves de idempotencia"""
+
+    async def obtener_o_reservar(self, clave: str, huella: str) -> Optional[Respuesta]:
+        """
+        None si esta petición queda a cargo de ejecutar la ruta; la respuesta
+        guardada si ya hay una. Lanza HuellaDistinta o EnProceso.
+        """
+        raise NotImplementedError
+
+    async def guardar(self, clave: str, respuesta: Respuesta):
+        raise NotImplementedError
+
+    async def liberar(self, clave: str):
+        """Descarta la reserva (la ruta falló): el próximo intento se ejecuta"""
+        raise NotImplementedError
+
+
+@dataclass
+class _Entrada:
+    huella: str
+    expira: float
+    respuesta: Optional[Respuesta] = None
+    listo: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class MemoryIdempotencia(IdempotenciaBackend):
+    def __init__(self, max_claves: int = 10000):
+        self.max_claves = max_claves
+        self._entradas = {}  # clave -> _Entrada; solo se toca desde el event loop
+
+    def _purgar(self, ahora: float):
+        for clave in [c for c, e in self._entradas.items() if e.expira < ahora and e.listo.is_set()]:
+            del self._entradas[clave]
+
+    async def obtener_o_reservar(self, clave, huella):
+        limite = time.monotonic() + config.IDEMPOTENCIA_ESPERA_SEGUNDOS
+        while True:
+            ahora = time.monotonic()
+            entrada = self._entradas.get(clave)
+            if entrada is None or (entrada.expira < ahora and entrada.listo.is_set()):
+                if len(self._entradas) >= self.max_claves:
+                    self._purgar(ahora)
+                self._entradas[clave] = _Entrada(huella, ahora + config.IDEMPOTENCIA_TTL_SEGUNDOS)
+                return None
+            if entrada.huella != huella:
+                raise HuellaDistinta()
+            if entrada.respuesta is not None:
+                return entrada.respuesta
+            try:
+                await asyncio.wait_for(entrada.listo.wait(), max(0.0, limite - ahora))
+            except asyncio.TimeoutError:
+                raise EnProceso()
+
+    async def guardar(self, clave, respuesta):
+        entrada = self._entradas[clave]
+        entrada.respuesta = respuesta
+        entrada.expira = time.monotonic() + config.IDEMPOTENCIA_TTL_SEGUNDOS
+        entrada.listo.set()
+
+    async def liberar(self, clave):
+        entrada = self._entradas.pop(clave, None)
+        if entrada is not None:
+            entrada.listo.set()
+
+
+class TablaIdempotencia(IdempotenciaBackend):
+    """Tabla `idempotencia` (migración de Alembic) para varios workers"""
+
+    async def obtener_o_reservar(self, clave, huella):
+        import crud_async
+        from database import session_scope
+        limite = time.monotonic() + config.IDEMPOTENCIA_ESPERA_SEGUNDOS
+        pausa = 0.05
+        while True:
+            async with session_scope() as db:
+                if await crud_async.reservar_idempotencia(db, clave, huella):
+                    return None
+                fila = await crud_async.get_idempotencia(db, clave)
+            if fila is None:
+                continue  # Liberada entre el INSERT y el SELECT
+            if fila["huella"] != huella:
+                raise HuellaDistinta()
+            if fila["status"] is not None:
+                return Respuesta(fila["status"], [(k.encode("latin-1"), v.encode("latin-1"))
+                                                  for k, v in fila["headers"]], fila["cuerpo"])
+            if time.monotonic() + pausa > limite:
+                raise EnProceso()
+            await asyncio.sleep(pausa)
+            pausa = min(pausa * 2, 0.5)
+
+    async def guardar(self, clave, respuesta):
+        import crud_async
+        from database import session_scope
+        headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in respuesta.headers]
+        async with session_scope() as db:
+            await crud_async.guardar_idempotencia(db, clave, respuesta.status, headers, respuesta.cuerpo)
+
+    async def liberar(self, clave):
+        import crud_async
+        from database import session_scope
+        async with session_scope() as db:
+            await crud_async.liberar_idempotencia(db, clave)
+
+
+def validar_backend():
+    """En memoria, un reintento que cae en otro worker no ve la clave y se ejecuta de nuevo"""
+    if config.IDEMPOTENCIA_BACKEND == "memoria" and config.WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            f"IDEMPOTENCIA_BACKEND=memoria no sirve con {config.WEB_CONCURRENCY} workers: usar bd"
+        )
+
+def _crear_backend() -> IdempotenciaBackend:
+    if config.IDEMPOTENCIA_BACKEND == "bd":
+        return TablaIdempotencia()
+    return MemoryIdempotencia()
+
+backend = _crear_backend()
+
+
+async def _responder_json(send, status: int, contenido: dict):
+    cuerpo = json.dumps(contenido, ensure_ascii=False).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+async def _leer_cuerpo(receive) -> bytes:
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect":
+            break
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body", False):
+            break
+    return b"".join(partes)
+
+
+class IdempotenciaMiddleware:
+    """Middleware ASGI: responde los reintentos con la respuesta guardada"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in RUTAS:
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        clave_cliente = headers.get("idempotency-key")
+        if clave_cliente is None:
+            return await self.app(scope, receive, send)
+        if not clave_cliente or len(clave_cliente) > MAX_LARGO_CLAVE:
+            return await _responder_json(send, 400, {"detail": "Idempotency-Key inválida"})
+
+        cuerpo = await _leer_cuerpo(receive)
+        clave = hashlib.sha256("|".join((
+            scope["method"], scope["path"], clave_cliente, headers.get("authorization", ""),
+        )).encode()).hexdigest()
+        huella = hashlib.sha256(scope["query_string"] + b"|" + cuerpo).hexdigest()
+
+        try:
+            guardada = await backend.obtener_o_reservar(clave, huella)
+        except HuellaDistinta:
+            return await _responder_json(send, 422, {"detail": "Idempotency-Key ya usada con otra petición"})
+        except EnProceso:
+            return await _responder_json(send, 409, {"detail": "La petición original sigue en proceso"})
+        if guardada is not None:
+            await send({"type": "http.response.start", "status": guardada.status,
+                        "headers": [*guardada.headers, (b"idempotent-replayed", b"true")]})
+            return await send({"type": "http.response.body", "body": guardada.cuerpo})
+
+        entregado = False
+        async def receive_con_cuerpo():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            return await receive()
+
+        inicio, partes = None, []
+        async def send_capturando(mensaje):
+            nonlocal inicio
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+            elif mensaje["type"] == "http.response.body":
+                partes.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive_con_cuerpo, send_capturando)
+        except BaseException:
+            await backend.liberar(clave)
+            raise
+        if inicio is None or not (200 <= inicio["status"] < 300 or inicio["status"] in ESTADOS_DEFINITIVOS):
+            await backend.liberar(clave)
+        else:
+            headers_guardados = [(k, v) for k, v in inicio.get("headers", []) if k.lower() not in _NO_GUARDAR]
+            await backend.guardar(clave, Respuesta(inicio["status"], headers_guardados, b"".join(partes)))
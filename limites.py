@@ -0,0 +1,183 @@
+"""
+Rate limiting (token bucket) y control de admisión de las rutas de auth
+
+/login/ y /registro/ no requieren autenticación y cada una cuesta un bcrypt,
+así que una ráfaga (credential stuffing o reintentos de la app) se rechaza
+antes de tocar la BD o el pool de hashing:
+
+- Token bucket por IP y por email: `capacidad` requests de ráfaga que se
+  recargan a `por_minuto`. Excederlo responde 429 con Retry-After.
+- Admisión de hashing: si el pool ya tiene HASH_MAX_PENDIENTES trabajos se
+  responde 503 de inmediato, sin consultar al usuario en la BD.
+
+Backends (LIMITES_BACKEND):
+- MemoryLimites (default): por proceso; con varios workers cada uno lleva
+  su propia cuenta.
+- RedisLimites: compartido entre workers (LIMITES_URL). Requiere `redis`.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+
+import hashing
+import metricas
+from config import config
+
+
+class LimiteExcedido(Exception):
+    """Se agotaron los tokens de una regla; `reintentar_en` en segundos"""
+
+    def __init__(self, regla: str, reintentar_en: float):
+        super().__init__(regla)
+        self.regla = regla
+        self.reintentar_en = reintentar_en
+
+
+@dataclass(frozen=True)
+class Regla:
+    capacidad: float  # Ráfaga máxima
+    por_minuto: float  # Recarga
+
+    @property
+    def por_segundo(self) -> float:
+        return self.por_minuto / 60
+
+
+REGLAS = {
+    "login_ip": Regla(config.LOGIN_IP_RAFAGA, config.LOGIN_IP_POR_MINUTO),
+    "login_email": Regla(config.LOGIN_EMAIL_RAFAGA, config.LOGIN_EMAIL_POR_MINUTO),
+    "registro_ip": Regla(config.REGISTRO_IP_RAFAGA, config.REGISTRO_IP_POR_MINUTO),
+}
+
+
+class LimitesBackend:
+    """Interfaz de un almacén de buckets"""
+
+    bloqueante = False  # True si consumir() hace I/O (se ejecuta en el threadpool)
+
+    def consumir(self, clave: str, regla: Regla) -> float:
+        """Toma un token: retorna 0 si se admite o los segundos hasta el próximo token"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryLimites(LimitesBackend):
+    def __init__(self, max_claves: int):
+        self.max_claves = max_claves
+        self._buckets = OrderedDict()  # clave -> (tokens, time.monotonic())
+        self._lock = threading.Lock()
+
+    def consumir(self, clave, regla):
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, ultimo = self._buckets.get(clave, (regla.capacidad, ahora))
+            tokens = min(regla.capacidad, tokens + (ahora - ultimo) * regla.por_segundo)
+            espera = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                espera = (1 - tokens) / regla.por_segundo
+            self._buckets[clave] = (tokens, ahora)
+            self._buckets.move_to_end(clave)
+            # Un bucket desalojado equivale a uno lleno: solo pasa con más claves activas que el máximo
+            while len(self._buckets) > self.max_claves:
+                self._buckets.popitem(last=False)
+            return espera
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Recarga + consumo atómicos en Redis; la clave expira cuando el bucket estaría lleno
+_SCRIPT_REDIS = """
+local capacidad = tonumber(ARGV[1])
+local por_segundo = tonumber(ARGV[2])
+local ahora = tonumber(ARGV[3])
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(estado[1]) or capacidad
+local ultimo = tonumber(estado[2]) or ahora
+tokens = math.min(capacidad, tokens + math.max(0, ahora - ultimo) * por_segundo)
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    espera = (1 - tokens) / por_segundo
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', ahora)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacidad / por_segundo * 1000))
+return tostring(espera)
+"""
+
+class RedisLimites(LimitesBackend):
+    bloqueante = True
+
+    def __init__(self, url: str, prefijo: str = "barber:limite:"):
+        import redis  # Dependencia opcional, solo con LIMITES_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+        self._script = self._redis.register_script(_SCRIPT_REDIS)
+        self._prefijo = prefijo
+
+    def consumir(self, clave, regla):
+        return float(self._script(keys=[self._prefijo + clave],
+                                  args=[regla.capacidad, regla.por_segundo, time.time()]))
+
+    def clear(self):
+        for clave in self._redis.scan_iter(self._prefijo + "*"):
+            self._redis.delete(clave)
+
+
+def _crear_backend() -> LimitesBackend:
+    if config.LIMITES_BACKEND == "redis":
+        return RedisLimites(config.LIMITES_URL)
+    return MemoryLimites(config.LIMITES_MAX_CLAVES)
+
+backend = _crear_backend()
+
+
+async def consumir(nombre_regla: str, valor: str):
+    """Lanza LimiteExcedido si `valor` (IP, email) agotó los tokens de la regla"""
+    if not config.LIMITES_ACTIVOS:
+        return
+    regla = REGLAS[nombre_regla]
+    clave = f"{nombre_regla}:{valor}"
+    if backend.bloqueante:
+        espera = await run_in_threadpool(backend.consumir, clave, regla)
+    else:
+        espera = backend.consumir(clave, regla)
+    if espera > 0:
+        metricas.RATE_LIMIT.labels(nombre_regla).inc()
+        raise LimiteExcedido(nombre_regla, espera)
+
+def clave_email(email: str) -> str:
+    """Los emails no se guardan en claro en el almacén de buckets"""
+    return hashlib.sha256(email.strip().lower().encode()).hexdigest()[:32]
+
+def ip_cliente(request: Request) -> str:
+    """
+    IP del cliente. Detrás de un proxy, uvicorn la toma de X-Forwarded-For
+    solo si la conexión viene de FORWARDED_ALLOW_IPS, y usa el primer salto no
+    confiable desde la derecha: las entradas que agrega el cliente no cuentan.
+    """
+    return request.client.host if request.client else "desconocida"
+
+
+def limitar_ip(nombre_regla: str):
+    """Dependencia de ruta: token bucket por IP"""
+    async def limite_ip(request: Request):
+        await consumir(nombre_regla, ip_cliente(request))
+    return limite_ip
+
+async def admitir_hashing():
+    """Dependencia de ruta: 503 inmediato si el pool de bcrypt está lleno"""
+    if hashing.pendientes() >= config.HASH_MAX_PENDIENTES:
+        metricas.RATE_LIMIT.labels("hashing").inc()
+        raise hashing.HashingSaturado()
@@ -1,28 +1,81 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import time
+_INICIO = time.perf_counter()  # Referencia para medir el arranque (ver lifespan y /healthz)
+
+import asyncio
+import logging
+import math
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request, Query, Body
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from contextlib import asynccontextmanager
+from typing import Literal, Optional
+from datetime import date
 
-from database import engine, get_db, Base
-from models import Cliente, Barbero, Cita, Usuario
-from schemas import (CitaCreate, CitaRead, CitaUpdate, UsuarioCreate, 
-                     UsuarioLogin, UsuarioRead, PerfilUsuario)
-from crud import (create_cita, get_citas, get_cita, update_cita, delete_cita, 
-                  init_static_data, create_usuario, authenticate_usuario, 
-                  get_usuario_by_email, get_usuario_by_id, get_citas_usuario)
+import auth
+import database
+import etags
+import eventos
+import exportar
+import hashing
+import idempotencia
+import limites
+import metricas
+import serializacion
+from cache import cache
+from compresion import CompresionMiddleware
+from idempotencia import IdempotenciaMiddleware
+from consultas import ConsultasMiddleware, PresupuestoExcedido, presupuesto
+from config import config
+from database import get_session, get_read_session, marcar_escritura
+from schemas import (CitaCreate, CitaRead, CitaUpdate, CitaFiltros, CitaPagina,
+                     CitaBatchResultado, UsuarioCreate, UsuarioLogin, UsuarioRead,
+                     PerfilUsuario, Disponibilidad, TokenRefresh, Logout, Ocupacion)
+from crud_async import (create_cita, get_citas, get_cita, update_cita, delete_cita, 
+                        create_usuario, authenticate_usuario,
+                        rehash_contraseña, stream_citas, get_disponibilidad,
+                        create_citas_batch, get_usuario_cached, get_perfil, revocar_token,
+                        get_ocupacion, barbero_existe)
+from crud import etag_cita_cached
 
 # Las tablas se crean ahora vía Alembic migrations
 # Base.metadata.create_all(bind=engine)  # Comentado: usar 'alembic upgrade head' en su lugar
+# Los datos estáticos se siembran en el build: python migrate.py seed
+
+logger = logging.getLogger(__name__)
+arranque_ms = None
 
-# Inicializar datos estáticos en startup
+# El arranque no toca la base de datos: la primera conexión se abre en
+# segundo plano y /readyz recién responde 200 cuando el pool tiene una viva
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    db = next(get_db())
-    try:
-        init_static_data(db)
-    finally:
-        db.close()
+    global arranque_ms
+    auth.validar_clave()
+    eventos.validar_backend()
+    idempotencia.validar_backend()
+    database.validar_replicas()
+    hashing.warmup()
+    calentar_pool = asyncio.create_task(database.ping(timeout=10))
+    vigilar_replicas = asyncio.create_task(database.vigilar_replicas()) if database.hay_replicas() else None
+    sincronizar_revocados = asyncio.create_task(auth.sincronizar_revocados())
+    mantener_particiones = asyncio.create_task(database.mantener_particiones())
+    latir = asyncio.create_task(eventos.latir())
+    escuchar = asyncio.create_task(eventos.escuchar()) if config.EVENTOS_BACKEND == "postgres" else None
+    arranque_ms = round((time.perf_counter() - _INICIO) * 1000, 1)
+    if arranque_ms > config.ARRANQUE_OBJETIVO_MS:
+        logger.warning("Arranque en %.0f ms (objetivo %.0f ms)", arranque_ms, config.ARRANQUE_OBJETIVO_MS)
     yield
+    calentar_pool.cancel()
+    if vigilar_replicas:
+        vigilar_replicas.cancel()
+    sincronizar_revocados.cancel()
+    mantener_particiones.cancel()
+    latir.cancel()
+    if escuchar:
+        escuchar.cancel()
+    # Cierra los streams abiertos para que el apagado no espere a los clientes
+    eventos.broadcaster.expulsar_todos("apagado")
+    hashing.shutdown()
+    await database.dispose()
 
 app = FastAPI(lifespan=lifespan, title="Barber API", version="1.0")
 
@@ -34,84 +87,342 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Conteo/tiempo de SQL por request (header Server-Timing)
+app.add_middleware(ConsultasMiddleware)
+# Reintentos con Idempotency-Key (fuera de ConsultasMiddleware: sus consultas no cuentan en el presupuesto)
+app.add_middleware(IdempotenciaMiddleware)
+# brotli/gzip para respuestas >= COMPRESION_MIN_BYTES
+app.add_middleware(CompresionMiddleware)
+# Métricas Prometheus (el más externo: mide también CORS y errores)
+app.add_middleware(metricas.MetricasMiddleware)
+
+@app.exception_handler(hashing.HashingSaturado)
+async def hashing_saturado_handler(request: Request, exc: hashing.HashingSaturado):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servicio saturado, intenta nuevamente en unos segundos"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(limites.LimiteExcedido)
+async def limite_excedido_handler(request: Request, exc: limites.LimiteExcedido):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Demasiados intentos, intenta nuevamente más tarde"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.reintentar_en)))},
+    )
+
+@app.exception_handler(eventos.StreamSaturado)
+async def stream_saturado_handler(request: Request, exc: eventos.StreamSaturado):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Demasiadas conexiones en tiempo real, intenta nuevamente en unos segundos"},
+        headers={"Retry-After": str(math.ceil(config.STREAM_RETRY_MS / 1000))},
+    )
+
+@app.exception_handler(etags.PrecondicionFallida)
+async def precondicion_fallida_handler(request: Request, exc: etags.PrecondicionFallida):
+    return JSONResponse(
+        status_code=412,
+        content={"detail": "La cita fue modificada por otra petición; vuelve a leerla"},
+        headers={"ETag": exc.etag},
+    )
+
+@app.exception_handler(PresupuestoExcedido)
+async def presupuesto_excedido_handler(request: Request, exc: PresupuestoExcedido):
+    return JSONResponse(status_code=500, content={"detail": f"Presupuesto de consultas excedido: {exc}"})
 
 # ============= RUTAS DE AUTENTICACION =============
 
-@app.post("/registro/", response_model=UsuarioRead)
-def registrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
-    usuario_existente = get_usuario_by_email(db, usuario.email)
-    if usuario_existente:
+# Límites antes que cualquier consulta o bcrypt: IP -> admisión de hashing -> email
+@app.post("/registro/", response_model=UsuarioRead, dependencies=[
+    Depends(limites.limitar_ip("registro_ip")), Depends(limites.admitir_hashing),
+    Depends(presupuesto(1)), Depends(marcar_escritura),
+])
+async def registrar_usuario(usuario: UsuarioCreate, db=Depends(get_session)):
+    nuevo_usuario = await create_usuario(db, usuario)
+    if nuevo_usuario is None:
         raise HTTPException(status_code=400, detail="Email ya registrado")
-    return create_usuario(db, usuario)
+    return nuevo_usuario
 
-@app.post("/login/")
-def login_usuario(credenciales: UsuarioLogin, db: Session = Depends(get_db)):
-    usuario = authenticate_usuario(db, credenciales.email, credenciales.contraseña)
+@app.post("/login/", dependencies=[
+    Depends(limites.limitar_ip("login_ip")), Depends(limites.admitir_hashing), Depends(presupuesto(2)),
+])
+async def login_usuario(credenciales: UsuarioLogin, background_tasks: BackgroundTasks,
+                        db=Depends(get_session)):
+    await limites.consumir("login_email", limites.clave_email(credenciales.email))
+    usuario = await authenticate_usuario(db, credenciales.email, credenciales.contraseña)
     if not usuario:
         raise HTTPException(status_code=401, detail="Email o contraseña incorrectos")
+    if hashing.needs_update(usuario.contraseña):
+        background_tasks.add_task(rehash_contraseña, usuario.id_usuario, credenciales.contraseña)
     return {
         "id_usuario": usuario.id_usuario,
         "nombre": usuario.nombre,
         "email": usuario.email,
-        "mensaje": "Login exitoso"
+        "mensaje": "Login exitoso",
+        **auth.crear_tokens(usuario.id_usuario),
     }
 
-@app.get("/perfil/{usuario_id}", response_model=PerfilUsuario)
-def obtener_perfil(usuario_id: int, db: Session = Depends(get_db)):
-    usuario = get_usuario_by_id(db, usuario_id)
-    if not usuario:
+@app.post("/token/refresh", dependencies=[Depends(presupuesto(1))])
+async def refrescar_token(datos: TokenRefresh, db=Depends(get_session)):
+    """Rota el refresh token: el usado queda revocado y no puede volver a usarse"""
+    try:
+        claims = auth.decodificar(datos.refresh_token, "refresh")
+    except auth.TokenInvalido as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    if not await revocar_token(db, claims["jti"], auth.expira(claims)):
+        raise HTTPException(status_code=401, detail="Token revocado", headers={"WWW-Authenticate": "Bearer"})
+    auth.marcar_revocado(claims["jti"], claims["exp"])
+    return auth.crear_tokens(int(claims["sub"]))
+
+@app.post("/logout/", dependencies=[Depends(presupuesto(2))])
+async def logout(datos: Logout = Body(default_factory=Logout), claims: dict = Depends(auth.usuario_actual),
+                 db=Depends(get_session)):
+    revocar = [claims]
+    if datos.refresh_token:
+        try:
+            revocar.append(auth.decodificar(datos.refresh_token, "refresh"))
+        except auth.TokenInvalido:
+            pass  # Vencido o ya revocado: no hay nada que revocar
+    for token in revocar:
+        await revocar_token(db, token["jti"], auth.expira(token))
+        auth.marcar_revocado(token["jti"], token["exp"])
+    return {"ok": True, "mensaje": "Sesión cerrada"}
+
+@app.get("/perfil/{usuario_id}", response_model=PerfilUsuario, dependencies=[Depends(presupuesto(1))])
+async def obtener_perfil(
+    usuario_id: int,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    desde: Optional[date] = None,
+    db=Depends(get_read_session),
+):
+    resultado = await get_perfil(db, usuario_id, limit, desde)
+    if not resultado:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    citas = get_citas_usuario(db, usuario_id)
-    return {
-        "id_usuario": usuario.id_usuario,
-        "nombre": usuario.nombre,
-        "email": usuario.email,
-        "telefono": usuario.telefono,
-        "citas": citas
-    }
+    perfil, etag = resultado
+    if etags.coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return serializacion.responder(request, perfil, PerfilUsuario, headers={"ETag": etag})
 
 # ============= RUTAS CRUD CITAS =============
 
-@app.post("/citas/", response_model=CitaRead)
-def crear_cita_endpoint(usuario_id: int, cita: CitaCreate, db: Session = Depends(get_db)):
-    usuario = get_usuario_by_id(db, usuario_id)
-    if not usuario:
+def conflicto_horario(cita_conflicto: dict) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={
+            "error": "CITA_CONFLICTO",
+            "mensaje": "Ya existe una cita en ese horario",
+            "cita_existente": cita_conflicto
+        }
+    )
+
+async def usuario_autenticado(
+    request: Request,
+    usuario_id: Optional[int] = Query(None, deprecated=True),
+    credenciales=Depends(auth.bearer),
+    db=Depends(get_session),
+) -> int:
+    """
+    Usuario dueño de las citas a crear. Con token el id sale de sus claims
+    firmados (sin consultar la BD); ?usuario_id= solo se acepta sin token y
+    con AUTH_LEGACY_USUARIO_ID=true, validando que el usuario exista.
+    """
+    if credenciales is not None:
+        claims = await auth.usuario_actual(request, credenciales)
+        if usuario_id is not None and usuario_id != int(claims["sub"]):
+            raise HTTPException(status_code=403, detail="usuario_id no coincide con el token")
+        return int(claims["sub"])
+    if usuario_id is None or not config.AUTH_LEGACY_USUARIO_ID:
+        raise HTTPException(status_code=401, detail="No autenticado", headers={"WWW-Authenticate": "Bearer"})
+    # Se cuenta cada uso para saber cuándo se puede retirar el modo legacy
+    metricas.AUTH_LEGACY.inc()
+    logger.info("?usuario_id= sin token en %s (usuario %d)", request.url.path, usuario_id)
+    if not await get_usuario_cached(db, usuario_id):
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    nueva_cita, cita_conflicto = create_cita(db, usuario_id, cita)
+    return usuario_id
+
+@app.post("/citas/", response_model=CitaRead, dependencies=[Depends(presupuesto(4)), Depends(marcar_escritura)])
+async def crear_cita_endpoint(cita: CitaCreate, usuario_id: int = Depends(usuario_autenticado),
+                              db=Depends(get_session)):
+    try:
+        nueva_cita, cita_conflicto = await create_cita(db, usuario_id, cita)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if nueva_cita is None:
-        raise HTTPException(
-            status_code=409,
-            detail={
-                "error": "CITA_CONFLICTO",
-                "mensaje": "Ya existe una cita en ese horario",
-                "cita_existente": cita_conflicto
-            }
-        )
+        metricas.CONFLICTOS.labels("create").inc()
+        raise conflicto_horario(cita_conflicto)
     return nueva_cita
 
-@app.get("/citas/", response_model=list[CitaRead])
-def listar_citas(db: Session = Depends(get_db)):
-    return get_citas(db)
+@app.post("/citas/batch", response_model=CitaBatchResultado, dependencies=[Depends(presupuesto(6)), Depends(marcar_escritura)])
+async def crear_citas_batch_endpoint(
+    citas: list[CitaCreate] = Body(..., min_length=1, max_length=200),
+    usuario_id: int = Depends(usuario_autenticado),
+    db=Depends(get_session),
+):
+    try:
+        creadas, conflictos = await create_citas_batch(db, usuario_id, citas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if conflictos:
+        metricas.CONFLICTOS.labels("batch").inc(len(conflictos))
+    return {"creadas": creadas, "conflictos": conflictos}
+
+@app.get("/citas/", response_model=CitaPagina, dependencies=[Depends(presupuesto(1))])
+async def listar_citas(
+    request: Request,
+    filtros: CitaFiltros = Depends(),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    db=Depends(get_read_session),
+):
+    try:
+        citas, next_cursor = await get_citas(db, filtros, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return serializacion.responder(request, {"items": citas, "next_cursor": next_cursor}, CitaPagina)
+
+@app.get("/citas/export", dependencies=[Depends(presupuesto(1))])
+async def exportar_citas(
+    filtros: CitaFiltros = Depends(),
+    formato: Literal["ndjson", "csv"] = "ndjson",
+):
+    lotes = stream_citas(filtros)
+    if formato == "csv":
+        return StreamingResponse(
+            exportar.csv_(lotes),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="citas.csv"'},
+        )
+    return StreamingResponse(exportar.ndjson(lotes), media_type="application/x-ndjson")
 
-@app.get("/citas/{cita_id}", response_model=CitaRead)
-def obtener_cita(cita_id: int, db: Session = Depends(get_db)):
-    cita = get_cita(db, cita_id)
+@app.get("/citas/{cita_id}", response_model=CitaRead, dependencies=[Depends(presupuesto(2))])
+async def obtener_cita(cita_id: int, request: Request, response: Response,
+                       db=Depends(get_read_session)):
+    if_none_match = request.headers.get("if-none-match")
+    # Si la caché conoce la versión actual, el 304 se responde sin consultar la BD
+    etag = etag_cita_cached(cita_id) if if_none_match else None
+    if etag and etags.coincide(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    cita, etag = await get_cita(db, cita_id)
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
+    if etags.coincide(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return cita
 
-@app.put("/citas/{cita_id}", response_model=CitaRead)
-def actualizar_cita(cita_id: int, cita: CitaUpdate, db: Session = Depends(get_db)):
-    cita_actualizada = update_cita(db, cita_id, cita)
+@app.put("/citas/{cita_id}", response_model=CitaRead, dependencies=[Depends(presupuesto(5)), Depends(marcar_escritura)])
+async def actualizar_cita(cita_id: int, cita: CitaUpdate, request: Request, response: Response,
+                          db=Depends(get_session)):
+    # If-Match con el ETag de GET /citas/{id}: compare-and-swap sobre la versión (412 si cambió)
+    if_match = request.headers.get("if-match")
+    if if_match is None and config.CITAS_REQUIERE_IF_MATCH:
+        raise HTTPException(status_code=428, detail="Se requiere el header If-Match")
+    versiones = etags.versiones_if_match(if_match, cita_id) if if_match is not None else None
+    try:
+        cita_actualizada, cita_conflicto = await update_cita(db, cita_id, cita, versiones)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cita_conflicto:
+        metricas.CONFLICTOS.labels("update").inc()
+        raise conflicto_horario(cita_conflicto)
     if not cita_actualizada:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
+    response.headers["ETag"] = etags.etag_cita(cita_id, cita_actualizada["version"])
     return cita_actualizada
 
-@app.delete("/citas/{cita_id}")
-def eliminar_cita(cita_id: int, db: Session = Depends(get_db)):
-    success = delete_cita(db, cita_id)
+@app.delete("/citas/{cita_id}", dependencies=[Depends(presupuesto(4)), Depends(marcar_escritura)])
+async def eliminar_cita(cita_id: int, db=Depends(get_session)):
+    success = await delete_cita(db, cita_id)
     if not success:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     return {"ok": True, "mensaje": "Cita eliminada exitosamente"}
+
+# ============= DISPONIBILIDAD =============
+
+@app.get("/barberos/{id_barbero}/disponibilidad", response_model=Disponibilidad, dependencies=[Depends(presupuesto(2))])
+async def obtener_disponibilidad(
+    id_barbero: int,
+    fecha: date,
+    duracion: int = Query(30, ge=5, le=480),
+    db=Depends(get_read_session),
+):
+    horarios = await get_disponibilidad(db, id_barbero, fecha, duracion)
+    if horarios is None:
+        raise HTTPException(status_code=404, detail="Barbero no encontrado")
+    return {
+        "id_barbero": id_barbero,
+        "fecha": fecha,
+        "duracion_minutos": duracion,
+        "horarios_libres": horarios
+    }
+
+# ============= TIEMPO REAL (SSE) =============
+
+def _respuesta_stream(suscriptor) -> StreamingResponse:
+    return StreamingResponse(
+        eventos.stream(suscriptor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stream/barberos/{id_barbero}", dependencies=[Depends(presupuesto(1))])
+async def stream_barbero(id_barbero: int):
+    """
+    Citas creadas, actualizadas, canceladas y eliminadas del barbero, para
+    refrescar la disponibilidad sin hacer polling. Sin datos del cliente.
+    """
+    # Sesión solo para validar: el stream no retiene conexiones del pool
+    async with database.session_scope(lectura=True) as db:
+        if not await barbero_existe(db, id_barbero):
+            raise HTTPException(status_code=404, detail="Barbero no encontrado")
+    return _respuesta_stream(eventos.broadcaster.suscribir(eventos.canal_barbero(id_barbero)))
+
+@app.get("/stream/usuario", dependencies=[Depends(presupuesto(0))])
+async def stream_usuario(claims: dict = Depends(auth.usuario_actual)):
+    """Cambios en las citas del usuario del token (Authorization: Bearer)"""
+    return _respuesta_stream(eventos.broadcaster.suscribir(eventos.canal_usuario(int(claims["sub"]))))
+
+# ============= ESTADISTICAS =============
+
+@app.get("/stats/ocupacion", response_model=Ocupacion, dependencies=[Depends(presupuesto(1))])
+async def estadisticas_ocupacion(
+    desde: date,
+    hasta: date,
+    id_barbero: Optional[int] = None,
+    db=Depends(get_read_session),
+):
+    """Minutos reservados, citas y cancelaciones por barbero, día y servicio"""
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="hasta debe ser posterior a desde")
+    if (hasta - desde).days >= config.OCUPACION_MAX_DIAS:
+        raise HTTPException(status_code=400, detail=f"El rango máximo es de {config.OCUPACION_MAX_DIAS} días")
+    return await get_ocupacion(db, desde, hasta, id_barbero)
+
+# ============= OPERACION =============
+
+@app.get("/cache/stats", dependencies=[Depends(presupuesto(0))])
+async def estadisticas_cache():
+    return cache.stats()
+
+@app.get("/healthz", dependencies=[Depends(presupuesto(0))])
+async def healthz():
+    """Liveness: el proceso responde; no consulta la base de datos"""
+    return {"status": "ok", "arranque_ms": arranque_ms}
+
+@app.get("/readyz", dependencies=[Depends(presupuesto(1))])
+async def readyz():
+    """Readiness: 200 solo si el pool entrega una conexión viva"""
+    if await database.ping():
+        if database.hay_replicas():
+            return {"status": "ready", "replicas": database.estado_replicas()}
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content={"status": "sin conexión a la base de datos"})
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(presupuesto(0))])
+async def metrics():
+    cuerpo, content_type = metricas.exponer()
+    return Response(content=cuerpo, media_type=content_type)
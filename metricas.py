@@ -0,0 +1,147 @@
+"""
+Métricas Prometheus de la API (expuestas en GET /metrics)
+
+- Latencia y conteo de requests por ruta (plantilla, no path real) y status,
+  medidos por un middleware ASGI puro sin BaseHTTPMiddleware.
+- Pools de conexiones: conexiones en uso, overflow y tamaño se leen al
+  momento del scrape (costo cero por request); la espera de checkout la
+  registra el pool de database.py.
+- bcrypt: tiempo de CPU de hash/verify medido dentro del pool de procesos.
+- Conflictos de horario (409) por operación.
+- Rechazos por rate limiting (429) y por admisión de hashing (503).
+- Usos del modo legacy ?usuario_id= sin token.
+- Streams SSE: suscriptores abiertos y expulsados (lentos o tras reconectar LISTEN).
+
+Con varios workers de uvicorn cada proceso tiene sus propias métricas; si
+PROMETHEUS_MULTIPROC_DIR está definida se agregan entre procesos.
+"""
+
+import os
+import time
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Histogram, generate_latest)
+from prometheus_client.core import GaugeMetricFamily
+
+DURACION_REQUEST = Histogram(
+    "http_request_duration_seconds", "Latencia de las requests HTTP", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    "http_requests_total", "Requests HTTP por ruta y status", ["method", "route", "status"],
+)
+ESPERA_CHECKOUT = Histogram(
+    "db_pool_checkout_wait_seconds", "Tiempo para obtener una conexión del pool", ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 10),
+)
+DURACION_BCRYPT = Histogram(
+    "password_hash_seconds", "Tiempo de CPU de bcrypt por operación", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2),
+)
+CONFLICTOS = Counter(
+    "citas_conflicto_total", "Citas rechazadas por solapamiento (409)", ["operation"],
+)
+RATE_LIMIT = Counter(
+    "rate_limit_rejected_total", "Requests rechazadas por rate limit o admisión de hashing", ["rule"],
+)
+AUTH_LEGACY = Counter(
+    "auth_legacy_usuario_id_total", "Citas creadas con ?usuario_id= sin token (AUTH_LEGACY_USUARIO_ID)",
+)
+STREAM_EXPULSADOS = Counter(
+    "sse_evicted_total", "Suscriptores SSE desconectados por el servidor", ["reason"],
+)
+
+_pools = {}  # etiqueta -> Pool de SQLAlchemy
+_hash_pendientes = None  # hashing.pendientes, registrado por hashing.py
+_stream_suscriptores = None  # len del broadcaster, registrado por eventos.py
+
+
+def registrar_pool(etiqueta: str, pool):
+    """Expone los gauges de un pool de SQLAlchemy (QueuePool o AsyncAdaptedQueuePool)"""
+    _pools[etiqueta] = pool
+
+def registrar_hashing(pendientes):
+    global _hash_pendientes
+    _hash_pendientes = pendientes
+
+def registrar_stream(suscriptores):
+    global _stream_suscriptores
+    _stream_suscriptores = suscriptores
+
+
+class _PoolCollector:
+    def collect(self):
+        familias = {
+            "checked_out": GaugeMetricFamily("db_pool_checked_out", "Conexiones en uso", labels=["engine"]),
+            "overflow": GaugeMetricFamily("db_pool_overflow", "Conexiones por encima de pool_size", labels=["engine"]),
+            "size": GaugeMetricFamily("db_pool_size", "pool_size configurado", labels=["engine"]),
+        }
+        for etiqueta, pool in _pools.items():
+            if not hasattr(pool, "checkedout"):  # NullPool no lleva cuenta
+                continue
+            familias["checked_out"].add_metric([etiqueta], pool.checkedout())
+            familias["overflow"].add_metric([etiqueta], max(0, pool.overflow()))
+            familias["size"].add_metric([etiqueta], pool.size())
+        yield from familias.values()
+
+
+class _HashingCollector:
+    def collect(self):
+        gauge = GaugeMetricFamily("password_hash_pending", "Trabajos de bcrypt en cola o en ejecución")
+        if _hash_pendientes is not None:
+            gauge.add_metric([], _hash_pendientes())
+        yield gauge
+
+
+class _StreamCollector:
+    def collect(self):
+        gauge = GaugeMetricFamily("sse_subscribers", "Streams SSE abiertos en este worker")
+        if _stream_suscriptores is not None:
+            gauge.add_metric([], _stream_suscriptores())
+        yield gauge
+
+
+REGISTRY.register(_PoolCollector())
+REGISTRY.register(_HashingCollector())
+REGISTRY.register(_StreamCollector())
+
+
+def exponer() -> tuple:
+    """(cuerpo, content type) para la respuesta de /metrics"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        registro.register(_PoolCollector())
+        registro.register(_HashingCollector())
+        registro.register(_StreamCollector())
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricasMiddleware:
+    """Middleware ASGI: latencia y status por plantilla de ruta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        async def send_con_status(mensaje):
+            nonlocal status
+            if mensaje["type"] == "http.response.start":
+                status = mensaje["status"]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_con_status)
+        finally:
+            # La ruta se resuelve dentro de la app; sin match se agrupa para no explotar la cardinalidad
+            ruta = scope.get("route")
+            plantilla = ruta.path if ruta is not None else "sin_ruta"
+            DURACION_REQUEST.labels(scope["method"], plantilla).observe(time.perf_counter() - inicio)
+            REQUESTS.labels(scope["method"], plantilla, str(status)).inc()
@@ -11,6 +11,7 @@ Uso:
 import argparse
 import subprocess
 import os
+from datetime import date
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -67,6 +68,61 @@ def status():
     print("\nHistorial de migraciones:")
     subprocess.run(["alembic", "history"], check=True)
 
+def seed():
+    """Sembrar datos estáticos (idempotente: solo inserta en tablas vacías)"""
+    from database import SessionLocal, get_direct_engine
+    from crud import init_static_data
+
+    db = SessionLocal(bind=get_direct_engine())
+    try:
+        init_static_data(db)
+    finally:
+        db.close()
+    print("✓ Datos estáticos sembrados")
+
+def ocupacion(desde=None, hasta=None):
+    """Reconstruir el rollup ocupacion_diaria desde citas (backfill o corrección)"""
+    from database import SessionLocal, get_direct_engine
+    from crud import reconstruir_ocupacion
+
+    db = SessionLocal(bind=get_direct_engine())
+    try:
+        filas = reconstruir_ocupacion(db, desde, hasta)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return
+    finally:
+        db.close()
+    print(f"✓ Rollup de ocupación reconstruido ({filas} filas)")
+
+def particiones(meses=None):
+    """Crear las particiones mensuales de citas que falten hasta `meses` adelante"""
+    from database import SessionLocal, get_direct_engine
+    from crud import crear_particiones
+
+    db = SessionLocal(bind=get_direct_engine())
+    try:
+        creadas = crear_particiones(db, meses)
+    finally:
+        db.close()
+    print(f"✓ Particiones de citas al día ({creadas} creadas)")
+
+def archivar(meses=None, eliminar=False):
+    """Separar de citas las particiones más antiguas que la retención"""
+    from database import SessionLocal, get_direct_engine
+    from crud import archivar_particiones
+    from config import config
+
+    db = SessionLocal(bind=get_direct_engine())
+    try:
+        archivadas = archivar_particiones(db, meses, eliminar)
+    finally:
+        db.close()
+    destino = "eliminadas" if eliminar else f"movidas al esquema {config.ARCHIVO_ESQUEMA}"
+    print(f"✓ {len(archivadas)} particiones {destino}")
+    for nombre in archivadas:
+        print(f"  - {nombre}")
+
 def main():
     parser = argparse.ArgumentParser(
         description="Utilidad de migraciones para Supabase con Alembic",
@@ -78,6 +134,10 @@ Ejemplos:
   python migrate.py upgrade                 # Aplicar todas las migraciones
   python migrate.py downgrade -1            # Revertir última migración
   python migrate.py status                  # Ver estado actual
+  python migrate.py seed                    # Sembrar datos estáticos
+  python migrate.py ocupacion --desde 2025-01-01  # Reconstruir el rollup de ocupación
+  python migrate.py particiones --meses 6   # Crear particiones de citas por adelantado
+  python migrate.py archivar --meses 24     # Archivar particiones de más de 24 meses
         """
     )
     
@@ -97,6 +157,20 @@ Ejemplos:
     
     subparsers.add_parser("status", help="Ver estado de migraciones")
     
+    subparsers.add_parser("seed", help="Sembrar datos estáticos (idempotente)")
+    
+    ocupacion_parser = subparsers.add_parser("ocupacion", help="Reconstruir el rollup de ocupación")
+    ocupacion_parser.add_argument("--desde", type=date.fromisoformat, help="Fecha inicial (YYYY-MM-DD)")
+    ocupacion_parser.add_argument("--hasta", type=date.fromisoformat, help="Fecha final (YYYY-MM-DD)")
+    
+    particiones_parser = subparsers.add_parser("particiones", help="Crear particiones de citas por adelantado")
+    particiones_parser.add_argument("--meses", type=int, help="Meses hacia adelante (default: PARTICIONES_MESES_ADELANTE)")
+    
+    archivar_parser = subparsers.add_parser("archivar", help="Archivar particiones de citas antiguas")
+    archivar_parser.add_argument("--meses", type=int, help="Meses de retención (default: ARCHIVO_MESES)")
+    archivar_parser.add_argument("--eliminar", action="store_true",
+                                 help="Eliminar las particiones en vez de moverlas al esquema de archivo")
+    
     args = parser.parse_args()
     
     if args.command == "init":
@@ -109,6 +183,14 @@ Ejemplos:
         downgrade(args.revision)
     elif args.command == "status":
         status()
+    elif args.command == "seed":
+        seed()
+    elif args.command == "ocupacion":
+        ocupacion(args.desde, args.hasta)
+    elif args.command == "particiones":
+        particiones(args.meses)
+    elif args.command == "archivar":
+        archivar(args.meses, args.eliminar)
     else:
         parser.print_help()
 
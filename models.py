@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Date, Time, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import (Column, Integer, String, Date, DateTime, Time, ForeignKey, Boolean, Index, Computed,
+                        CheckConstraint, LargeBinary, func, text)
+from sqlalchemy.dialects.postgresql import JSONB, TSRANGE
+from sqlalchemy.orm import relationship, deferred
 from database import Base
 
 class Usuario(Base):
@@ -10,6 +12,49 @@ class Usuario(Base):
     contraseña = Column(String(255), nullable=False)
     telefono = Column(String(20))
     activo = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Se incrementa en cada UPDATE (ETag)
+
+    citas = relationship("Cita", back_populates="usuario")
+
+class OcupacionDiaria(Base):
+    """
+    Rollup por barbero, día y servicio, mantenido por las escrituras de citas
+    en su misma transacción (crud._sumar_ocupacion). Se reconstruye desde
+    citas con `python migrate.py ocupacion`.
+    """
+    __tablename__ = "ocupacion_diaria"
+    id_barbero = Column(Integer, ForeignKey("barberos.id_barbero"), primary_key=True)
+    fecha = Column(Date, primary_key=True, index=True)
+    servicio = Column(String(100), primary_key=True, server_default="")  # "" = sin servicio
+    citas = Column(Integer, nullable=False, server_default="0")  # Activas (no canceladas)
+    canceladas = Column(Integer, nullable=False, server_default="0")
+    minutos = Column(Integer, nullable=False, server_default="0")  # Reservados por citas activas
+
+class CitaFecha(Base):
+    """
+    id_cita -> fecha de cada cita, para que las rutas por id poden las
+    particiones de citas. La mantiene el trigger citas_fechas_sincronizar
+    (migración c8e5a1f03b62).
+    """
+    __tablename__ = "citas_fechas"
+    id_cita = Column(Integer, primary_key=True)
+    fecha = Column(Date, nullable=False, index=True)
+
+class TokenRevocado(Base):
+    __tablename__ = "tokens_revocados"
+    jti = Column(String(36), primary_key=True)
+    expira = Column(DateTime(timezone=True), nullable=False, index=True)  # Se purga cuando el token vence
+
+class Idempotencia(Base):
+    """Respuestas guardadas por Idempotency-Key (IDEMPOTENCIA_BACKEND=bd)"""
+    __tablename__ = "idempotencia"
+    clave = Column(String(64), primary_key=True)  # sha256 de método, ruta, clave y Authorization
+    huella = Column(String(64), nullable=False)  # sha256 de query string y cuerpo
+    status = Column(Integer)  # NULL mientras la petición original se ejecuta
+    headers = Column(JSONB)
+    cuerpo = Column(LargeBinary)
+    creada = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    expira = Column(DateTime(timezone=True), nullable=False, index=True)
 
 class Cliente(Base):
     __tablename__ = "clientes"
@@ -23,15 +68,45 @@ class Barbero(Base):
     nombre = Column(String(100), nullable=False)
 
 class Cita(Base):
+    """
+    Particionada por mes de `fecha` (migración f3b7c92d4e18): la PK incluye
+    la clave de partición y el constraint de solapamiento vive en cada
+    partición, lo crea la función crear_particiones_citas(). Una cita no
+    puede cruzar el fin de su mes (ck_citas_dentro_del_mes), así dos
+    particiones nunca se solapan.
+    """
     __tablename__ = "citas"
-    id_cita = Column(Integer, primary_key=True, index=True)
+    id_cita = Column(Integer, primary_key=True, autoincrement=True)
     id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=False)
     id_barbero = Column(Integer, ForeignKey("barberos.id_barbero"), nullable=False)
-    fecha = Column(Date, nullable=False)
+    fecha = Column(Date, primary_key=True)
     hora = Column(Time, nullable=False)
     estado = Column(String(20), default="pendiente")
     servicio = Column(String(100), nullable=True)  # Nuevo campo
     duracion_minutos = Column(Integer, default=30)  # Nuevo campo con default 30 min
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Se incrementa en cada UPDATE (ETag)
+    # Intervalo [inicio, fin) calculado por Postgres; solo lo usa el constraint de solapamiento
+    rango = deferred(Column(
+        TSRANGE,
+        Computed(
+            "tsrange(fecha + hora, fecha + hora + make_interval(mins => coalesce(duracion_minutos, 30)))",
+            persisted=True,
+        ),
+    ))
 
-    usuario = relationship("Usuario")
+    usuario = relationship("Usuario", back_populates="citas")
     barbero = relationship("Barbero")
+
+    # Índices compuestos que terminan en la clave de paginación (fecha, hora, id_cita)
+    __table_args__ = (
+        Index("ix_citas_fecha_hora_id", "fecha", "hora", "id_cita"),
+        Index("ix_citas_barbero_fecha_hora", "id_barbero", "fecha", "hora", "id_cita"),
+        Index("ix_citas_usuario_fecha_hora", "id_usuario", "fecha", "hora", "id_cita"),
+        Index("ix_citas_estado_fecha_hora", "estado", "fecha", "hora", "id_cita"),
+        # Agenda activa de un barbero: disponibilidad y validación de solapamiento
+        Index("ix_citas_activas_barbero_fecha", "id_barbero", "fecha", "hora",
+              postgresql_where=text("estado <> 'cancelada'")),
+        CheckConstraint("upper(rango) <= date_trunc('month', fecha::timestamp) + interval '1 month'",
+                        name="ck_citas_dentro_del_mes"),
+        {"postgresql_partition_by": "RANGE (fecha)"},
+    )
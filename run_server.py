@@ -12,18 +12,63 @@ load_dotenv()
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import tempfile
+
 import uvicorn
 
+# Mínimo de conexiones en el pool de cada worker (pool_size 1 + overflow 1)
+CONEXIONES_MIN_POOL = 2
+
+def conexiones_minimas_worker(workers: int) -> int:
+    """Pool mínimo más las conexiones fuera del pool (DB_CONEXIONES_EXTRA en config.py)"""
+    # Mismo default que config.EVENTOS_BACKEND
+    eventos = os.getenv("EVENTOS_BACKEND", "postgres" if workers > 1 else "memoria")
+    return CONEXIONES_MIN_POOL + (eventos == "postgres")
+
+def calcular_workers() -> int:
+    """
+    WEB_CONCURRENCY si está definida; si no, un worker por core. Nunca más de
+    los que caben en DB_MAX_CONEXIONES: con 64 cores y 40 conexiones, 64
+    workers con el mínimo de 2 cada uno abrirían 128.
+    """
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    maximo = max(1, int(os.getenv("DB_MAX_CONEXIONES", 40)) // conexiones_minimas_worker(workers))
+    if workers > maximo:
+        print(f"Workers limitados a {maximo}: DB_MAX_CONEXIONES no alcanza para {workers}")
+    return min(workers, maximo)
+
 if __name__ == "__main__":
     # Configuración para desarrollo local y producción
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
     reload = os.getenv("ENVIRONMENT", "development") == "development"
+    # En desarrollo un solo proceso con reload; en producción un worker por core
+    workers = 1 if reload else calcular_workers()
+    
+    # Los workers heredan el entorno: config.py reparte DB_MAX_CONEXIONES
+    # y HASH_WORKERS entre WEB_CONCURRENCY procesos
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        # /metrics agrega los contadores de todos los workers
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus_")
+    
+    from config import config
+    if config.FORWARDED_ALLOW_IPS.strip() == "*":
+        # Con "*" el rate limit por IP se salta rotando X-Forwarded-For
+        sys.exit("FORWARDED_ALLOW_IPS=* no es seguro: usar la IP o CIDR del proxy")
+    print(
+        f"Workers: {workers} | conexiones por worker: {config.DB_POOL_SIZE} + "
+        f"{config.DB_MAX_OVERFLOW} overflow + {config.DB_CONEXIONES_EXTRA} LISTEN "
+        f"(total {config.DB_MAX_CONEXIONES}) | "
+        f"bcrypt: {config.HASH_WORKERS} procesos por worker"
+    )
     
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         reload=reload,
+        workers=workers,
+        forwarded_allow_ips=config.FORWARDED_ALLOW_IPS,
         log_level="info"
     )
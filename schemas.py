@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import date, time
 from typing import Optional, List
 
@@ -13,6 +13,12 @@ class UsuarioLogin(BaseModel):
     email: EmailStr
     contraseña: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class Logout(BaseModel):
+    refresh_token: Optional[str] = None  # Si se envía, también se revoca
+
 class UsuarioRead(BaseModel):
     id_usuario: int
     nombre: str
@@ -29,9 +35,8 @@ class CitaCreate(BaseModel):
     hora: time
     estado: str = "pendiente"
     servicio: Optional[str] = None  # Nuevo campo
-    duracion_minutos: int = 30  # Nuevo campo con default 30 min
-    servicio: Optional[str] = None  # Nuevo campo
-    duracion_minutos: int = 30  # Nuevo campo con default 30 min
+    # > 0: un rango vacío no chocaría con nada en el constraint de solapamiento
+    duracion_minutos: int = Field(30, gt=0, le=480)  # Nuevo campo con default 30 min
 
 class CitaRead(BaseModel):
     id_cita: int
@@ -46,13 +51,69 @@ class CitaRead(BaseModel):
     class Config:
         from_attributes = True
 
+class CitaFiltros(BaseModel):
+    id_barbero: Optional[int] = None
+    id_usuario: Optional[int] = None
+    estado: Optional[str] = None
+    fecha_desde: Optional[date] = None
+    fecha_hasta: Optional[date] = None
+
+class CitaPagina(BaseModel):
+    items: List[CitaRead]
+    next_cursor: Optional[str] = None  # None = última página
+
+# Esquemas de creación por lote
+class ConflictoBatch(BaseModel):
+    indice: int  # Posición en la lista enviada
+    cita_existente: dict  # "id" si choca con una cita guardada, "indice" si con otra del lote
+
+class CitaBatchResultado(BaseModel):
+    creadas: List[CitaRead] = []
+    conflictos: List[ConflictoBatch] = []
+
 class CitaUpdate(BaseModel):
     id_barbero: int = None
     fecha: date = None
     hora: time = None
     estado: str = None
     servicio: Optional[str] = None  # Nuevo campo
-    duracion_minutos: Optional[int] = None  # Nuevo campo
+    duracion_minutos: Optional[int] = Field(None, gt=0, le=480)  # Nuevo campo
+
+# Esquema de disponibilidad de un barbero
+class Disponibilidad(BaseModel):
+    id_barbero: int
+    fecha: date
+    duracion_minutos: int
+    horarios_libres: List[time] = []
+
+# Esquemas de ocupación (GET /stats/ocupacion)
+class OcupacionDia(BaseModel):
+    fecha: date
+    citas: int
+    canceladas: int
+    minutos: int
+    ocupacion: float  # minutos / minutos de la jornada
+
+class OcupacionServicio(BaseModel):
+    servicio: Optional[str]
+    citas: int
+    canceladas: int
+    minutos: int
+
+class OcupacionBarbero(BaseModel):
+    id_barbero: int
+    citas: int
+    canceladas: int
+    minutos: int
+    ocupacion: float  # minutos / (jornada x días del rango)
+    dias: List[OcupacionDia] = []
+    servicios: List[OcupacionServicio] = []
+
+class Ocupacion(BaseModel):
+    desde: date
+    hasta: date
+    minutos_jornada: int
+    barberos: List[OcupacionBarbero] = []
 
 # Esquema para Perfil con Historial
 class PerfilUsuario(BaseModel):
@@ -0,0 +1,60 @@
+"""
+Serialización rápida de las respuestas grandes (listado de citas y perfil)
+
+Las citas salen de la BD como filas con el tipo de cada columna, así que no
+pasan por la validación `from_attributes` de Pydantic ni por el encoder JSON
+estándar: se arman dicts planos y se codifican con orjson (fechas y horas en
+ISO 8601, igual que FastAPI). El `response_model` de la ruta se mantiene
+para OpenAPI; con VALIDAR_RESPUESTAS=true (tests) la respuesta además se
+valida contra su TypeAdapter para detectar desvíos entre el SELECT y el
+esquema.
+
+Con `Accept: application/msgpack` (cliente Flutter) la respuesta se codifica
+en MessagePack si el paquete `msgpack` está instalado.
+"""
+
+from functools import lru_cache
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from config import config
+
+MEDIA_JSON = "application/json"
+MEDIA_MSGPACK = "application/msgpack"
+
+try:
+    import msgpack  # Dependencia opcional
+except ImportError:
+    msgpack = None
+
+
+@lru_cache(maxsize=None)
+def _adapter(modelo) -> TypeAdapter:
+    return TypeAdapter(modelo)
+
+def _iso(valor):
+    """Tipos que msgpack no conoce (date, time): mismo texto que en JSON"""
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+def acepta_msgpack(request: Request) -> bool:
+    if msgpack is None:
+        return False
+    accept = request.headers.get("accept", "")
+    return MEDIA_MSGPACK in accept or "application/x-msgpack" in accept
+
+def responder(request: Request, contenido, modelo=None, headers: dict = None) -> Response:
+    """
+    Response ya codificada (FastAPI no vuelve a validar ni a serializar).
+    `modelo`: esquema de la respuesta, solo se usa con VALIDAR_RESPUESTAS=true.
+    """
+    if modelo is not None and config.VALIDAR_RESPUESTAS:
+        _adapter(modelo).validate_python(contenido)
+    headers = {**(headers or {}), "Vary": "Accept"}
+    if acepta_msgpack(request):
+        return Response(msgpack.packb(contenido, default=_iso), media_type=MEDIA_MSGPACK, headers=headers)
+    return Response(orjson.dumps(contenido), media_type=MEDIA_JSON, headers=headers)
@@ -0,0 +1,60 @@
+"""
+Fixtures compartidas. Las de base de datos necesitan una base migrada
+(DATABASE_URL) y se saltean sin ella; cada prueba usa su propio barbero y
+usuario, que se borran al terminar junto con sus citas.
+"""
+
+import os
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture
+def bd():
+    if not os.getenv("DATABASE_URL"):
+        pytest.skip("requiere DATABASE_URL")
+    import database
+    return database.get_engine()
+
+@pytest.fixture
+def barbero(bd):
+    with bd.begin() as conexion:
+        id_barbero = conexion.execute(text(
+            "INSERT INTO barberos (nombre) VALUES ('Barbero de prueba') RETURNING id_barbero"
+        )).scalar()
+    yield id_barbero
+    with bd.begin() as conexion:
+        for tabla in ("citas", "ocupacion_diaria", "barberos"):
+            conexion.execute(text(f"DELETE FROM {tabla} WHERE id_barbero = :b"), {"b": id_barbero})
+
+@pytest.fixture
+def usuario(bd):
+    with bd.begin() as conexion:
+        id_usuario = conexion.execute(text(
+            "INSERT INTO usuarios (nombre, email, contraseña, activo) "
+            "VALUES ('Usuario de prueba', :email, '-', true) RETURNING id_usuario"
+        ), {"email": f"prueba-{uuid.uuid4().hex[:12]}@test.barber-api.com"}).scalar()
+    yield id_usuario
+    with bd.begin() as conexion:
+        conexion.execute(text("DELETE FROM citas WHERE id_usuario = :u"), {"u": id_usuario})
+        conexion.execute(text("DELETE FROM usuarios WHERE id_usuario = :u"), {"u": id_usuario})
+
+@pytest.fixture
+def autorizacion(usuario):
+    import auth
+    return {"Authorization": f"Bearer {auth.crear_tokens(usuario)['access_token']}"}
+
+@pytest.fixture
+def api(bd):
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as cliente:
+        yield cliente
+
+@pytest.fixture
+def fecha():
+    """Un día del mes que viene: siempre tiene su partición creada"""
+    return (date.today().replace(day=1) + timedelta(days=40)).replace(day=10)
@@ -0,0 +1,58 @@
+"""Índice de agenda: búsqueda de solapamientos y huecos libres (agenda.py)"""
+
+from datetime import date, time
+
+from agenda import AgendaIndex, a_hora, a_minutos, buscar_solapamiento, huecos_libres
+
+# 10:00-10:30, 11:00-11:45, 13:00-13:15 en minutos desde las 00:00
+INTERVALOS = [(600, 630, 1), (660, 705, 2), (780, 795, 3)]
+
+
+def test_buscar_solapamiento_devuelve_el_intervalo_que_choca():
+    assert buscar_solapamiento(INTERVALOS, 620, 650) == (600, 630, 1)
+    assert buscar_solapamiento(INTERVALOS, 700, 720) == (660, 705, 2)
+    assert buscar_solapamiento(INTERVALOS, 500, 900) == (600, 630, 1)
+
+def test_buscar_solapamiento_intervalos_contiguos_no_chocan():
+    # [inicio, fin): terminar justo cuando empieza otra cita no es solapamiento
+    assert buscar_solapamiento(INTERVALOS, 630, 660) is None
+    assert buscar_solapamiento(INTERVALOS, 570, 600) is None
+    assert buscar_solapamiento(INTERVALOS, 795, 810) is None
+
+def test_buscar_solapamiento_sin_intervalos():
+    assert buscar_solapamiento([], 600, 630) is None
+
+def test_huecos_libres():
+    libres = huecos_libres(INTERVALOS, apertura=600, cierre=750, duracion=30, paso=15)
+    assert [a_hora(m) for m in libres] == [time(10, 30), time(11, 45), time(12, 0)]
+
+def test_huecos_libres_la_ultima_cita_debe_terminar_antes_del_cierre():
+    assert huecos_libres([], apertura=600, cierre=660, duracion=45, paso=15) == [600, 615]
+
+def test_a_minutos_y_a_hora():
+    assert a_minutos(time(13, 45)) == 825
+    assert a_hora(825) == time(13, 45)
+
+def test_agenda_ttl_por_carga():
+    agenda = AgendaIndex(max_dias=10, ttl_segundos=60)
+    cargas = []
+    def cargar():
+        cargas.append(1)
+        return [(660, 690, 2), (600, 630, 1)]
+
+    assert agenda.obtener(1, date(2030, 1, 1), cargar) == [(600, 630, 1), (660, 690, 2)]
+    agenda.obtener(1, date(2030, 1, 1), cargar)
+    assert len(cargas) == 1
+    # Lo cargado con TTL 0 (p. ej. desde una réplica) vence enseguida
+    agenda.obtener(1, date(2030, 1, 2), cargar, ttl_segundos=0)
+    agenda.obtener(1, date(2030, 1, 2), cargar, ttl_segundos=0)
+    assert len(cargas) == 3
+
+def test_agenda_agregar_y_quitar_mantienen_el_orden():
+    agenda = AgendaIndex(max_dias=10, ttl_segundos=60)
+    dia = date(2030, 1, 1)
+    agenda.obtener(1, dia, lambda: [(600, 630, 1)])
+    agenda.agregar(1, dia, time(9, 0), 30, 2)
+    assert agenda.obtener(1, dia, lambda: None) == [(540, 570, 2), (600, 630, 1)]
+    agenda.quitar(1, dia, 1)
+    assert agenda.obtener(1, dia, lambda: None) == [(540, 570, 2)]
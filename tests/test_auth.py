@@ -0,0 +1,34 @@
+"""Dueño de las citas creadas: token o ?usuario_id= legacy (main.usuario_autenticado)"""
+
+import main
+
+
+def _cita(barbero, fecha, hora="10:00"):
+    return {"id_barbero": barbero, "fecha": str(fecha), "hora": hora}
+
+def test_con_token_el_usuario_sale_de_los_claims(api, autorizacion, usuario, barbero, fecha):
+    respuesta = api.post("/citas/", json=_cita(barbero, fecha), headers=autorizacion)
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["id_usuario"] == usuario
+
+def test_sin_token_y_sin_modo_legacy_responde_401(api, usuario, barbero, fecha, monkeypatch):
+    monkeypatch.setattr(main.config, "AUTH_LEGACY_USUARIO_ID", False)
+    assert api.post("/citas/", json=_cita(barbero, fecha)).status_code == 401
+    respuesta = api.post("/citas/", json=_cita(barbero, fecha), params={"usuario_id": usuario})
+    assert respuesta.status_code == 401
+    assert respuesta.headers["www-authenticate"] == "Bearer"
+
+def test_usuario_id_distinto_del_token_responde_403(api, autorizacion, usuario, barbero, fecha):
+    respuesta = api.post("/citas/", json=_cita(barbero, fecha), params={"usuario_id": usuario + 1},
+                         headers=autorizacion)
+    assert respuesta.status_code == 403
+
+def test_token_invalido_responde_401(api, barbero, fecha):
+    respuesta = api.post("/citas/", json=_cita(barbero, fecha), headers={"Authorization": "Bearer basura"})
+    assert respuesta.status_code == 401
+
+def test_modo_legacy_acepta_usuario_id_sin_token(api, usuario, barbero, fecha, monkeypatch):
+    monkeypatch.setattr(main.config, "AUTH_LEGACY_USUARIO_ID", True)
+    respuesta = api.post("/citas/", json=_cita(barbero, fecha), params={"usuario_id": usuario})
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["id_usuario"] == usuario
@@ -0,0 +1,58 @@
+"""Creación de citas: validación de la duración, solapamientos y lotes (POST /citas/, /citas/batch)"""
+
+import pytest
+from pydantic import ValidationError
+
+from schemas import CitaCreate, CitaUpdate
+
+
+@pytest.mark.parametrize("duracion", [0, -30, 481])
+def test_duracion_fuera_de_rango(duracion):
+    with pytest.raises(ValidationError):
+        CitaCreate(id_barbero=1, fecha="2030-01-10", hora="10:00", duracion_minutos=duracion)
+    with pytest.raises(ValidationError):
+        CitaUpdate(duracion_minutos=duracion)
+
+def test_duracion_por_defecto():
+    assert CitaCreate(id_barbero=1, fecha="2030-01-10", hora="10:00").duracion_minutos == 30
+    assert CitaUpdate().duracion_minutos is None
+
+
+def test_solapamiento_responde_409(api, autorizacion, barbero, fecha):
+    cita = {"id_barbero": barbero, "fecha": str(fecha), "hora": "10:00", "duracion_minutos": 60}
+    primera = api.post("/citas/", json=cita, headers=autorizacion)
+    assert primera.status_code == 200, primera.text
+
+    solapada = api.post("/citas/", json={**cita, "hora": "10:30"}, headers=autorizacion)
+    assert solapada.status_code == 409
+    detalle = solapada.json()["detail"]
+    assert detalle["error"] == "CITA_CONFLICTO"
+    assert detalle["cita_existente"]["id"] == primera.json()["id_cita"]
+
+    contigua = api.post("/citas/", json={**cita, "hora": "11:00"}, headers=autorizacion)
+    assert contigua.status_code == 200, contigua.text
+
+def test_duracion_invalida_responde_422(api, autorizacion, barbero, fecha):
+    cita = {"id_barbero": barbero, "fecha": str(fecha), "hora": "10:00", "duracion_minutos": -30}
+    assert api.post("/citas/", json=cita, headers=autorizacion).status_code == 422
+
+def test_lote_con_conflictos_parciales(api, autorizacion, barbero, fecha):
+    base = {"id_barbero": barbero, "fecha": str(fecha), "duracion_minutos": 60}
+    existente = api.post("/citas/", json={**base, "hora": "10:00"}, headers=autorizacion).json()
+    lote = [
+        {**base, "hora": "10:30"},  # Choca con la existente
+        {**base, "hora": "12:00"},
+        {**base, "hora": "12:15"},  # Choca con la anterior del lote
+        {**base, "hora": "14:00"},
+    ]
+    respuesta = api.post("/citas/batch", json=lote, headers=autorizacion)
+    assert respuesta.status_code == 200, respuesta.text
+    resultado = respuesta.json()
+    assert [c["hora"] for c in resultado["creadas"]] == ["12:00:00", "14:00:00"]
+    conflictos = {c["indice"]: c["cita_existente"] for c in resultado["conflictos"]}
+    assert set(conflictos) == {0, 2}
+    assert conflictos[0]["id"] == existente["id_cita"]
+    assert conflictos[2]["indice"] == 1
+
+    listado = api.get("/citas/", params={"id_barbero": barbero}).json()["items"]
+    assert [c["hora"] for c in listado] == ["10:00:00", "12:00:00", "14:00:00"]
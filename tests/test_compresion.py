@@ -0,0 +1,51 @@
+"""ETags de respuestas comprimidas a través del middleware (compresion.py)"""
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+import compresion
+import etags
+from compresion import CompresionMiddleware
+
+ETAG = etags.etag_cita(7, 3)
+
+
+@pytest.fixture
+def cliente():
+    app = FastAPI()
+
+    @app.get("/citas/7")
+    async def obtener(request: Request):
+        if etags.coincide(request.headers.get("if-none-match"), ETAG):
+            return Response(status_code=304, headers={"ETag": ETAG})
+        return Response("x" * 2000, media_type="application/json", headers={"ETag": ETAG})
+
+    @app.put("/citas/7")
+    async def actualizar(request: Request):
+        if etags.versiones_if_match(request.headers["if-match"], 7) != [3]:
+            return Response(status_code=412)
+        return Response(status_code=204)
+
+    return TestClient(CompresionMiddleware(app, minimo=0))
+
+
+@pytest.mark.parametrize("codificacion", [
+    "gzip",
+    pytest.param("br", marks=pytest.mark.skipif(compresion.brotli is None, reason="sin el paquete brotli")),
+])
+def test_etag_de_la_respuesta_comprimida_lleva_la_codificacion(cliente, codificacion):
+    respuesta = cliente.get("/citas/7", headers={"Accept-Encoding": codificacion})
+    assert respuesta.headers["content-encoding"] == codificacion
+    assert respuesta.headers["etag"] == etags.con_codificacion(ETAG, codificacion)
+    assert "accept-encoding" in respuesta.headers["vary"].lower()
+
+def test_sin_compresion_el_etag_no_cambia(cliente):
+    respuesta = cliente.get("/citas/7", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in respuesta.headers
+    assert respuesta.headers["etag"] == ETAG
+
+def test_etag_comprimido_sirve_para_if_none_match_e_if_match(cliente):
+    etag = cliente.get("/citas/7", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    assert cliente.get("/citas/7", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+    assert cliente.put("/citas/7", headers={"If-Match": etag}).status_code == 204
@@ -0,0 +1,20 @@
+"""Cursor de la paginación keyset de GET /citas/ (crud.encode_cursor/decode_cursor)"""
+
+from datetime import date, time
+from types import SimpleNamespace
+
+import pytest
+
+from crud import decode_cursor, encode_cursor
+
+
+def test_ida_y_vuelta():
+    cita = SimpleNamespace(fecha=date(2030, 1, 31), hora=time(9, 45), id_cita=123456)
+    cursor = encode_cursor(cita)
+    assert "=" not in cursor  # Sin padding: va en la query string tal cual
+    assert decode_cursor(cursor) == (date(2030, 1, 31), time(9, 45), 123456)
+
+@pytest.mark.parametrize("cursor", ["", "no-es-base64!", "MjAzMC0wMS0zMXwwOTo0NQ", "YXxifGM"])
+def test_cursor_invalido_lanza_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
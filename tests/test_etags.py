@@ -0,0 +1,37 @@
+"""ETags de citas y perfil, If-None-Match e If-Match (etags.py)"""
+
+from etags import coincide, con_codificacion, etag_cita, etag_perfil, versiones_if_match
+
+
+def test_versiones_if_match():
+    assert versiones_if_match('"c7-v3"', 7) == [3]
+    assert versiones_if_match(' "c7-v3" , "c7-v4"', 7) == [3, 4]
+
+def test_versiones_if_match_asterisco_acepta_cualquier_version():
+    assert versiones_if_match("*", 7) is None
+
+def test_versiones_if_match_ignora_etags_de_otra_cita_o_debiles():
+    assert versiones_if_match('"c8-v3"', 7) == []
+    # If-Match usa comparación fuerte: un ETag débil nunca coincide
+    assert versiones_if_match('W/"c7-v3"', 7) == []
+    assert versiones_if_match('"p7-abc"', 7) == []
+    assert versiones_if_match("basura", 7) == []
+
+def test_versiones_if_match_acepta_el_etag_de_una_respuesta_comprimida():
+    assert versiones_if_match(con_codificacion(etag_cita(7, 3), "br"), 7) == [3]
+    assert versiones_if_match('"c7-v3-gzip"', 7) == [3]
+
+def test_coincide():
+    etag = etag_cita(1, 2)
+    assert coincide(etag, etag)
+    assert coincide(f'"c1-v1", {etag}', etag)
+    assert coincide("W/" + etag, etag)
+    assert coincide("*", etag)
+    assert coincide(con_codificacion(etag, "gzip"), etag)
+    assert not coincide('"c1-v1"', etag)
+    assert not coincide(None, etag)
+
+def test_etag_perfil_no_depende_del_orden_de_las_citas():
+    assert etag_perfil(1, 2, [(5, 1), (3, 2)]) == etag_perfil(1, 2, [(3, 2), (5, 1)])
+    assert etag_perfil(1, 2, [(5, 1)]) != etag_perfil(1, 2, [(5, 2)])
+    assert etag_perfil(1, 2, []) != etag_perfil(1, 3, [])
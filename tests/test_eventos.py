@@ -0,0 +1,103 @@
+"""Eventos de citas: destinos, reparto con colas acotadas y emisión tras el commit (eventos.py)"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+import eventos
+from eventos import Broadcaster, StreamSaturado, canal_barbero, canal_usuario
+
+CITA = {"id_cita": 1, "id_usuario": 9, "id_barbero": 2, "fecha": "2030-01-10", "hora": "10:00:00",
+        "duracion_minutos": 30, "estado": "pendiente", "servicio": "Corte"}
+
+
+def test_el_canal_del_barbero_no_ve_datos_del_cliente():
+    destinos = dict(eventos._destinos(eventos.evento("creada", CITA)))
+    assert set(destinos) == {canal_barbero(2), canal_usuario(9)}
+    assert set(destinos[canal_barbero(2)]) == set(eventos.CAMPOS_BARBERO)
+    assert destinos[canal_usuario(9)] == CITA
+
+def test_un_cambio_de_barbero_llega_a_los_dos():
+    anterior = {"id_barbero": 3, "fecha": "2030-01-10", "hora": "09:00:00", "duracion_minutos": 30}
+    destinos = list(eventos._destinos(eventos.evento("actualizada", CITA, anterior)))
+    assert [canal for canal, _ in destinos] == [canal_barbero(2), canal_barbero(3), canal_usuario(9)]
+    assert destinos[0][1]["anterior"] == anterior
+
+def test_payloads_se_parten_bajo_el_maximo():
+    lote = [eventos.evento("creada", dict(CITA, id_cita=i)) for i in range(200)]
+    payloads = eventos._payloads(lote)
+    assert len(payloads) > 1
+    assert all(len(p.encode()) <= eventos.MAX_PAYLOAD for p in payloads)
+    assert sum(p.count('"tipo"') for p in payloads) == 200
+
+
+def test_reparto_y_expulsion_del_suscriptor_lento():
+    async def escenario():
+        broadcaster = Broadcaster(max_cola=1, max_suscriptores=10)
+        rapido = broadcaster.suscribir(canal_barbero(2))
+        lento = broadcaster.suscribir(canal_barbero(2))
+        otro = broadcaster.suscribir(canal_barbero(5))
+        broadcaster.repartir([eventos.evento("creada", CITA)])
+        assert rapido.cola.get_nowait()[0] == "creada"
+        assert otro.cola.empty()
+        broadcaster.repartir([eventos.evento("cancelada", CITA)])
+        assert not rapido.expulsado
+        # La cola del lento seguía llena: se expulsa en vez de crecer
+        assert lento.expulsado
+        assert len(broadcaster) == 2
+    asyncio.run(escenario())
+
+def test_maximo_de_suscriptores():
+    async def escenario():
+        broadcaster = Broadcaster(max_cola=1, max_suscriptores=1)
+        broadcaster.suscribir(canal_barbero(2))
+        with pytest.raises(StreamSaturado):
+            broadcaster.suscribir(canal_barbero(2))
+    asyncio.run(escenario())
+
+def test_stream_envia_eventos_y_termina_al_expulsar(monkeypatch):
+    async def escenario():
+        broadcaster = Broadcaster(max_cola=10, max_suscriptores=10)
+        monkeypatch.setattr(eventos, "broadcaster", broadcaster)
+        cuerpo = eventos.stream(broadcaster.suscribir(canal_barbero(2)))
+        assert (await cuerpo.__anext__()).startswith(b"retry: ")
+        broadcaster.repartir([eventos.evento("creada", CITA)])
+        assert (await cuerpo.__anext__()).startswith(b"event: creada\ndata: ")
+        broadcaster.latido()
+        assert await cuerpo.__anext__() == b": ping\n\n"
+        # Expulsado, lo que quedaba en la cola ya no se envía: el cliente reconecta y recarga
+        broadcaster.repartir([eventos.evento("cancelada", CITA)])
+        broadcaster.expulsar_todos("prueba")
+        assert [parte async for parte in cuerpo] == []
+        assert len(broadcaster) == 0
+    asyncio.run(escenario())
+
+def test_memoria_no_arranca_con_varios_workers(monkeypatch):
+    monkeypatch.setattr(eventos.config, "EVENTOS_BACKEND", "memoria")
+    monkeypatch.setattr(eventos.config, "WEB_CONCURRENCY", 2)
+    with pytest.raises(RuntimeError):
+        eventos.validar_backend()
+
+
+def test_los_eventos_salen_solo_tras_el_commit(bd, monkeypatch):
+    from database import SessionLocal
+    monkeypatch.setattr(eventos.config, "EVENTOS_BACKEND", "memoria")
+
+    async def escenario():
+        broadcaster = Broadcaster(max_cola=10, max_suscriptores=10)
+        monkeypatch.setattr(eventos, "broadcaster", broadcaster)
+        suscriptor = broadcaster.suscribir(canal_barbero(2))
+        with SessionLocal(bind=bd) as db:
+            db.execute(text("SELECT 1"))
+            eventos.emitir(db, [eventos.evento("creada", CITA)])
+            db.rollback()
+            db.execute(text("SELECT 1"))
+            eventos.emitir(db, [eventos.evento("eliminada", CITA)])
+            await asyncio.sleep(0)
+            assert suscriptor.cola.empty()
+            db.commit()
+        await asyncio.sleep(0)
+        assert suscriptor.cola.get_nowait()[0] == "eliminada"
+        assert suscriptor.cola.empty()
+    asyncio.run(escenario())
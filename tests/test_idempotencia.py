@@ -0,0 +1,123 @@
+"""Idempotency-Key: reintentos con respuesta guardada y conflictos (idempotencia.py)"""
+
+import asyncio
+
+import pytest
+from fastapi import Body, Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import idempotencia
+from idempotencia import EnProceso, HuellaDistinta, IdempotenciaMiddleware, MemoryIdempotencia, Respuesta
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = MemoryIdempotencia()
+    monkeypatch.setattr(idempotencia, "backend", backend)
+    return backend
+
+@pytest.fixture
+def app(backend):
+    app = FastAPI()
+    app.state.ejecuciones = 0
+    app.state.limitado = False
+
+    async def limite():
+        if app.state.limitado:
+            raise HTTPException(429, "Demasiadas solicitudes", headers={"Retry-After": "1"})
+
+    @app.post("/citas/", dependencies=[Depends(limite)])
+    async def crear(datos: dict = Body(...)):
+        app.state.ejecuciones += 1
+        if datos.get("conflicto"):
+            raise HTTPException(409, "ocupado")
+        if datos.get("falla"):
+            raise HTTPException(503, "caído")
+        return {"id_cita": app.state.ejecuciones}
+
+    return app
+
+@pytest.fixture
+def cliente(app):
+    return TestClient(IdempotenciaMiddleware(app), raise_server_exceptions=False)
+
+
+def test_reintento_recibe_la_respuesta_original(app, cliente):
+    headers = {"Idempotency-Key": "k1", "Authorization": "Bearer a"}
+    primera = cliente.post("/citas/", json={"hora": "10:00"}, headers=headers)
+    reintento = cliente.post("/citas/", json={"hora": "10:00"}, headers=headers)
+    assert primera.json() == reintento.json() == {"id_cita": 1}
+    assert "idempotent-replayed" not in primera.headers
+    assert reintento.headers["idempotent-replayed"] == "true"
+    assert app.state.ejecuciones == 1
+
+def test_misma_clave_con_otro_cuerpo_responde_422(cliente):
+    headers = {"Idempotency-Key": "k1"}
+    cliente.post("/citas/", json={"hora": "10:00"}, headers=headers)
+    respuesta = cliente.post("/citas/", json={"hora": "11:00"}, headers=headers)
+    assert respuesta.status_code == 422
+
+def test_la_clave_es_por_usuario(app, cliente):
+    cliente.post("/citas/", json={}, headers={"Idempotency-Key": "k1", "Authorization": "Bearer a"})
+    otra = cliente.post("/citas/", json={}, headers={"Idempotency-Key": "k1", "Authorization": "Bearer b"})
+    assert otra.json() == {"id_cita": 2}
+    assert app.state.ejecuciones == 2
+
+def test_error_del_servidor_libera_la_clave(app, cliente):
+    headers = {"Idempotency-Key": "k1"}
+    assert cliente.post("/citas/", json={"falla": True}, headers=headers).status_code == 503
+    assert cliente.post("/citas/", json={"falla": True}, headers=headers).status_code == 503
+    assert app.state.ejecuciones == 2
+
+def test_rate_limit_no_se_guarda(app, cliente):
+    headers = {"Idempotency-Key": "k1"}
+    app.state.limitado = True
+    assert cliente.post("/citas/", json={}, headers=headers).status_code == 429
+    app.state.limitado = False
+    reintento = cliente.post("/citas/", json={}, headers=headers)
+    assert reintento.status_code == 200
+    assert "idempotent-replayed" not in reintento.headers
+    assert app.state.ejecuciones == 1
+
+def test_conflicto_de_dominio_se_guarda(app, cliente):
+    headers = {"Idempotency-Key": "k1"}
+    assert cliente.post("/citas/", json={"conflicto": True}, headers=headers).status_code == 409
+    reintento = cliente.post("/citas/", json={"conflicto": True}, headers=headers)
+    assert reintento.status_code == 409
+    assert reintento.headers["idempotent-replayed"] == "true"
+    assert app.state.ejecuciones == 1
+
+def test_sin_clave_o_fuera_de_las_rutas_no_interviene(app, cliente):
+    cliente.post("/citas/", json={})
+    cliente.post("/citas/", json={})
+    assert app.state.ejecuciones == 2
+    assert cliente.post("/citas/", json={}, headers={"Idempotency-Key": ""}).status_code == 400
+
+def test_duplicado_concurrente_espera_al_original(backend):
+    async def escenario():
+        assert await backend.obtener_o_reservar("k", "h") is None
+        duplicado = asyncio.create_task(backend.obtener_o_reservar("k", "h"))
+        await asyncio.sleep(0)
+        assert not duplicado.done()
+        await backend.guardar("k", Respuesta(200, [], b"{}"))
+        return await duplicado
+
+    assert asyncio.run(escenario()).cuerpo == b"{}"
+
+def test_duplicado_concurrente_con_otra_huella(backend):
+    async def escenario():
+        await backend.obtener_o_reservar("k", "h")
+        await backend.obtener_o_reservar("k", "otra")
+
+    with pytest.raises(HuellaDistinta):
+        asyncio.run(escenario())
+
+def test_original_que_no_termina_responde_en_proceso(backend, monkeypatch):
+    monkeypatch.setattr(idempotencia.config, "IDEMPOTENCIA_ESPERA_SEGUNDOS", 0.01)
+
+    async def escenario():
+        await backend.obtener_o_reservar("k", "h")
+        await backend.obtener_o_reservar("k", "h")
+
+    with pytest.raises(EnProceso):
+        asyncio.run(escenario())
@@ -0,0 +1,72 @@
+"""Token buckets del rate limiting de auth (limites.py)"""
+
+import asyncio
+
+import pytest
+
+import limites
+from limites import LimiteExcedido, MemoryLimites, Regla
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(limites.time, "monotonic", reloj)
+    return reloj
+
+
+def test_rafaga_y_luego_espera(reloj):
+    backend = MemoryLimites(max_claves=100)
+    regla = Regla(capacidad=3, por_minuto=6)  # Un token cada 10 s
+    assert [backend.consumir("ip:1", regla) for _ in range(3)] == [0, 0, 0]
+    assert backend.consumir("ip:1", regla) == pytest.approx(10)
+
+def test_recarga_con_el_tiempo_sin_superar_la_capacidad(reloj):
+    backend = MemoryLimites(max_claves=100)
+    regla = Regla(capacidad=2, por_minuto=60)  # Un token por segundo
+    backend.consumir("ip:1", regla)
+    backend.consumir("ip:1", regla)
+    reloj.ahora += 0.5
+    assert backend.consumir("ip:1", regla) == pytest.approx(0.5)
+    reloj.ahora += 3600
+    assert backend.consumir("ip:1", regla) == 0
+    assert backend.consumir("ip:1", regla) == 0
+    assert backend.consumir("ip:1", regla) > 0
+
+def test_buckets_independientes_por_clave(reloj):
+    backend = MemoryLimites(max_claves=100)
+    regla = Regla(capacidad=1, por_minuto=1)
+    assert backend.consumir("ip:1", regla) == 0
+    assert backend.consumir("ip:1", regla) > 0
+    assert backend.consumir("ip:2", regla) == 0
+
+def test_lru_desaloja_la_clave_mas_vieja(reloj):
+    backend = MemoryLimites(max_claves=2)
+    regla = Regla(capacidad=1, por_minuto=1)
+    for clave in ("a", "b", "c"):
+        backend.consumir(clave, regla)
+    # "a" se desalojó: vuelve con el bucket lleno
+    assert backend.consumir("a", regla) == 0
+    assert backend.consumir("c", regla) > 0
+
+def test_consumir_lanza_limite_excedido(reloj, monkeypatch):
+    monkeypatch.setattr(limites.config, "LIMITES_ACTIVOS", True)
+    monkeypatch.setattr(limites, "backend", MemoryLimites(max_claves=100))
+    monkeypatch.setitem(limites.REGLAS, "prueba", Regla(capacidad=1, por_minuto=30))
+    asyncio.run(limites.consumir("prueba", "10.0.0.1"))
+    with pytest.raises(LimiteExcedido) as error:
+        asyncio.run(limites.consumir("prueba", "10.0.0.1"))
+    assert error.value.regla == "prueba"
+    assert error.value.reintentar_en == pytest.approx(2)
+
+def test_clave_email_normaliza_y_no_guarda_el_email():
+    assert limites.clave_email(" Ana@Example.com ") == limites.clave_email("ana@example.com")
+    assert "ana" not in limites.clave_email("ana@example.com")
@@ -0,0 +1,44 @@
+"""Rollup ocupacion_diaria: deltas de cada escritura de citas (crud._sumar_ocupacion)"""
+
+from datetime import timedelta
+
+from sqlalchemy import text
+
+
+def _rollup(bd, id_barbero) -> dict:
+    """(fecha, servicio) -> (citas, canceladas, minutos), sin las filas que quedaron en cero"""
+    with bd.connect() as conexion:
+        filas = conexion.execute(text(
+            "SELECT fecha, servicio, citas, canceladas, minutos FROM ocupacion_diaria "
+            "WHERE id_barbero = :b AND (citas <> 0 OR canceladas <> 0)"
+        ), {"b": id_barbero})
+        return {(fecha, servicio): (citas, canceladas, minutos)
+                for fecha, servicio, citas, canceladas, minutos in filas}
+
+
+def test_crear_actualizar_y_eliminar_mueven_el_rollup(api, bd, autorizacion, barbero, fecha):
+    base = {"id_barbero": barbero, "fecha": str(fecha)}
+    a = api.post("/citas/", json={**base, "hora": "10:00", "servicio": "Corte", "duracion_minutos": 60},
+                 headers=autorizacion).json()
+    b = api.post("/citas/", json={**base, "hora": "11:00"}, headers=autorizacion).json()
+    assert _rollup(bd, barbero) == {(fecha, "Corte"): (1, 0, 60), (fecha, ""): (1, 0, 30)}
+
+    api.put(f"/citas/{a['id_cita']}", json={"servicio": "Barba", "duracion_minutos": 45})
+    siguiente = fecha + timedelta(days=1)
+    api.put(f"/citas/{b['id_cita']}", json={"fecha": str(siguiente)})
+    assert _rollup(bd, barbero) == {(fecha, "Barba"): (1, 0, 45), (siguiente, ""): (1, 0, 30)}
+
+    api.put(f"/citas/{a['id_cita']}", json={"estado": "cancelada"})
+    assert api.delete(f"/citas/{b['id_cita']}").status_code == 200
+    assert _rollup(bd, barbero) == {(fecha, "Barba"): (0, 1, 0)}
+
+    stats = api.get("/stats/ocupacion", params={"desde": str(fecha), "hasta": str(siguiente),
+                                                 "id_barbero": barbero}).json()
+    assert [(b["citas"], b["canceladas"], b["minutos"]) for b in stats["barberos"]] == [(0, 1, 0)]
+
+def test_lote_suma_solo_las_creadas(api, bd, autorizacion, barbero, fecha):
+    base = {"id_barbero": barbero, "fecha": str(fecha), "servicio": "Corte"}
+    lote = [{**base, "hora": "10:00"}, {**base, "hora": "10:15"}, {**base, "hora": "12:00"}]
+    resultado = api.post("/citas/batch", json=lote, headers=autorizacion).json()
+    assert len(resultado["creadas"]) == 2
+    assert _rollup(bd, barbero) == {(fecha, "Corte"): (2, 0, 60)}
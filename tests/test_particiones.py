@@ -0,0 +1,106 @@
+"""Particiones mensuales de citas: ruteo, archivo y rollup de ocupación (crud.py)"""
+
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+import crud
+from crud import archivar_particiones, reconstruir_ocupacion
+
+MES_VIEJO = date(1990, 1, 1)
+
+
+@pytest.fixture
+def sesion(bd):
+    from database import SessionLocal
+    db = SessionLocal(bind=bd)
+    yield db
+    db.close()
+
+@pytest.fixture
+def mes_archivado(bd, sesion, barbero, usuario, monkeypatch):
+    """Una partición de 1990 con una cita y su rollup, archivada en un esquema de prueba"""
+    monkeypatch.setattr(crud.config, "ARCHIVO_ESQUEMA", "archivo_pruebas")
+    with bd.begin() as conexion:
+        conexion.execute(text("SELECT crear_particiones_citas(:mes, :mes)"), {"mes": MES_VIEJO})
+        conexion.execute(text(
+            "INSERT INTO citas (id_usuario, id_barbero, fecha, hora, estado) "
+            "VALUES (:u, :b, :fecha, '10:00', 'pendiente')"
+        ), {"u": usuario, "b": barbero, "fecha": MES_VIEJO})
+    try:
+        reconstruir_ocupacion(sesion, MES_VIEJO, MES_VIEJO)
+        # Retención de 30 años: solo se archiva 1990
+        assert archivar_particiones(sesion, meses=30 * 12) == ["citas_1990_01"]
+        yield MES_VIEJO
+    finally:
+        sesion.rollback()
+        with bd.begin() as conexion:
+            conexion.execute(text("DROP SCHEMA IF EXISTS archivo_pruebas CASCADE"))
+            conexion.execute(text("DROP TABLE IF EXISTS citas_1990_01"))
+
+
+def _ocupacion(sesion, id_barbero, fecha):
+    return sesion.execute(text(
+        "SELECT citas FROM ocupacion_diaria WHERE id_barbero = :b AND fecha = :fecha"
+    ), {"b": id_barbero, "fecha": fecha}).scalars().all()
+
+def test_archivar_conserva_el_rollup_y_olvida_el_id(sesion, mes_archivado, barbero):
+    assert sesion.execute(text("SELECT count(*) FROM citas WHERE id_barbero = :b"), {"b": barbero}).scalar() == 0
+    assert sesion.execute(text("SELECT count(*) FROM archivo_pruebas.citas_1990_01")).scalar() == 1
+    assert sesion.execute(text("SELECT count(*) FROM citas_fechas WHERE fecha = :f"), {"f": MES_VIEJO}).scalar() == 0
+    assert _ocupacion(sesion, barbero, MES_VIEJO) == [1]
+
+def test_reconstruir_no_toca_meses_archivados(sesion, mes_archivado, barbero):
+    with pytest.raises(ValueError):
+        reconstruir_ocupacion(sesion, MES_VIEJO)
+    sesion.rollback()
+    # Sin desde empieza en la partición adjunta más antigua (un solo día, para que sea rápido)
+    piso = crud._particiones_mensuales(sesion)[0][1]
+    assert piso > MES_VIEJO
+    reconstruir_ocupacion(sesion, hasta=piso)
+    assert _ocupacion(sesion, barbero, MES_VIEJO) == [1]
+
+def _particion(sesion, id_cita):
+    return sesion.execute(text(
+        "SELECT c.tableoid::regclass::text, f.fecha FROM citas c JOIN citas_fechas f USING (id_cita) "
+        "WHERE c.id_cita = :id"
+    ), {"id": id_cita}).one()
+
+def test_la_cita_va_a_la_particion_de_su_mes_y_se_mueve_con_ella(api, sesion, autorizacion, barbero, fecha):
+    cita = api.post("/citas/", json={"id_barbero": barbero, "fecha": str(fecha), "hora": "10:00"},
+                    headers=autorizacion).json()
+    assert _particion(sesion, cita["id_cita"]) == (f"citas_{fecha:%Y_%m}", fecha)
+
+    otro_mes = fecha - timedelta(days=20)
+    movida = api.put(f"/citas/{cita['id_cita']}", json={"fecha": str(otro_mes)})
+    assert movida.status_code == 200, movida.text
+    sesion.rollback()
+    assert _particion(sesion, cita["id_cita"]) == (f"citas_{otro_mes:%Y_%m}", otro_mes)
+    assert api.get(f"/citas/{cita['id_cita']}").json()["fecha"] == str(otro_mes)
+
+def test_cita_que_cruza_el_fin_de_mes_responde_400(api, autorizacion, barbero, fecha):
+    ultimo_dia = fecha.replace(day=1) + timedelta(days=40)
+    ultimo_dia = ultimo_dia.replace(day=1) - timedelta(days=1)
+    respuesta = api.post("/citas/", json={"id_barbero": barbero, "fecha": str(ultimo_dia), "hora": "23:45"},
+                         headers=autorizacion)
+    assert respuesta.status_code == 400
+
+def test_crear_la_particion_saca_las_filas_de_la_default(bd, sesion, barbero, usuario):
+    mes = date(2199, 1, 1)
+    try:
+        with bd.begin() as conexion:
+            id_cita = conexion.execute(text(
+                "INSERT INTO citas (id_usuario, id_barbero, fecha, hora, estado) "
+                "VALUES (:u, :b, :fecha, '10:00', 'pendiente') RETURNING id_cita"
+            ), {"u": usuario, "b": barbero, "fecha": mes}).scalar()
+        assert _particion(sesion, id_cita) == ("citas_default", mes)
+        sesion.rollback()
+        with bd.begin() as conexion:
+            assert conexion.execute(text("SELECT crear_particiones_citas(:mes, :mes)"), {"mes": mes}).scalar() == 1
+        assert _particion(sesion, id_cita) == ("citas_2199_01", mes)
+    finally:
+        sesion.rollback()
+        with bd.begin() as conexion:
+            conexion.execute(text("DELETE FROM citas WHERE id_barbero = :b"), {"b": barbero})
+            conexion.execute(text("DROP TABLE IF EXISTS citas_2199_01"))
@@ -0,0 +1,64 @@
+"""
+Rutas bajo SQL_PRESUPUESTO_ESTRICTO: una consulta de más es un 500 (consultas.py)
+
+Necesitan una base de datos migrada (DATABASE_URL); sin ella se saltean.
+"""
+
+import os
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("requiere DATABASE_URL", allow_module_level=True)
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import consultas
+import main
+from crud_async import _run
+from database import get_session
+
+
+@pytest.fixture
+def estricto(monkeypatch):
+    monkeypatch.setattr(consultas.config, "SQL_PRESUPUESTO_ESTRICTO", True)
+
+@pytest.fixture
+def cliente(estricto):
+    with TestClient(main.app) as cliente:
+        yield cliente
+
+
+def test_rutas_de_lectura_dentro_del_presupuesto(cliente):
+    pagina = cliente.get("/citas/", params={"limit": 5})
+    assert pagina.status_code == 200, pagina.text
+    if not pagina.json()["items"]:
+        pytest.skip("no hay citas cargadas")
+    cita = pagina.json()["items"][0]
+
+    respuesta = cliente.get(f"/citas/{cita['id_cita']}")
+    assert respuesta.status_code == 200, respuesta.text
+    etag = respuesta.headers["etag"]
+    assert cliente.get(f"/citas/{cita['id_cita']}", headers={"If-None-Match": etag}).status_code == 304
+    perfil = cliente.get(f"/perfil/{cita['id_usuario']}", params={"limit": 3})
+    assert perfil.status_code == 200, perfil.text
+    disponibilidad = cliente.get(f"/barberos/{cita['id_barbero']}/disponibilidad",
+                                 params={"fecha": cita["fecha"]})
+    assert disponibilidad.status_code == 200, disponibilidad.text
+
+def test_exceder_el_presupuesto_responde_500(estricto):
+    app = FastAPI()
+    app.add_exception_handler(consultas.PresupuestoExcedido, main.presupuesto_excedido_handler)
+
+    @app.get("/n-mas-uno", dependencies=[Depends(consultas.presupuesto(1))])
+    async def n_mas_uno(db=Depends(get_session)):
+        for _ in range(2):
+            await _run(db, lambda sesion: sesion.execute(text("SELECT 1")))
+        return {}
+
+    with TestClient(consultas.ConsultasMiddleware(app)) as cliente:
+        respuesta = cliente.get("/n-mas-uno")
+    assert respuesta.status_code == 500
+    assert "Presupuesto de consultas excedido" in respuesta.json()["detail"]
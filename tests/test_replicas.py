@@ -0,0 +1,58 @@
+"""Read-your-writes con réplicas: qué lecturas quedan fijadas al primario (database.py)"""
+
+import pytest
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+import auth
+import database
+from cache import Cache, MemoryCache
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(database, "_replicas", [object()])
+    monkeypatch.setattr(database, "cache", Cache(MemoryCache(100), 30))
+    app = FastAPI()
+
+    @app.put("/citas/{cita_id}", dependencies=[Depends(database.marcar_escritura)])
+    async def escribir(cita_id: int):
+        return {}
+
+    @app.get("/citas/{cita_id}")
+    async def leer(cita_id: int, request: Request):
+        return {"fijado": database._fijado(request)}
+
+    with TestClient(app) as cliente:
+        yield cliente
+
+def _token(usuario_id: int) -> dict:
+    return {"Authorization": f"Bearer {auth.crear_tokens(usuario_id)['access_token']}"}
+
+
+def test_escritura_fija_al_usuario_del_token_sin_cookie(cliente):
+    respuesta = cliente.put("/citas/7", headers=_token(1))
+    assert respuesta.cookies.get(database.COOKIE_PRIMARIO) == "1"
+    cliente.cookies.clear()
+    assert cliente.get("/citas/99", headers=_token(1)).json() == {"fijado": True}
+    assert cliente.get("/citas/99", headers=_token(2)).json() == {"fijado": False}
+    assert cliente.get("/citas/99").json() == {"fijado": False}
+
+def test_escritura_fija_la_cita(cliente):
+    cliente.put("/citas/7")
+    cliente.cookies.clear()
+    assert cliente.get("/citas/7").json() == {"fijado": True}
+    assert cliente.get("/citas/8").json() == {"fijado": False}
+
+def test_token_invalido_no_fija(cliente):
+    cliente.put("/citas/7", headers={"Authorization": "Bearer basura"})
+    assert cliente.get("/citas/99", headers={"Authorization": "Bearer basura"}).json() == {"fijado": False}
+
+def test_con_varios_workers_exige_cache_compartida(monkeypatch):
+    monkeypatch.setattr(database, "_replicas", [object()])
+    monkeypatch.setattr(database.config, "WEB_CONCURRENCY", 2)
+    monkeypatch.setattr(database.config, "CACHE_BACKEND", "memoria")
+    with pytest.raises(RuntimeError):
+        database.validar_replicas()
+    monkeypatch.setattr(database.config, "CACHE_BACKEND", "redis")
+    database.validar_replicas()